@@ -0,0 +1,169 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import solver
+from engine import CLASSIC, canonical, iter_cells, popcount
+from search import DEFAULT_TIME_BUDGET, WIN_SCORE, get_searcher
+
+# Per-move analysis: the value of every legal move for the player to move.
+#
+# Classic 3x3 positions are read from the opening book and are exact. On
+# bigger boards every move is searched to the same depth within a time
+# budget, so wins and losses are the forced results the search found and
+# anything else is left unresolved with its heuristic score.
+#
+# Results are kept in a bounded LRU cache shared by every game in the
+# process. Positions are cached under their smallest symmetric form, so the
+# eight rotations and reflections of a position share one entry, and the
+# moves are mapped back to the caller's orientation on the way out. Searched
+# positions are also keyed by their time budget, since a longer search can
+# resolve more moves.
+
+ANALYSIS_CACHE_SIZE = int(os.environ.get('ANALYSIS_CACHE_SIZE', 100000))
+
+WIN, DRAW, LOSS = 'win', 'draw', 'loss'
+
+# value is WIN, DRAW, LOSS or None when unresolved; distance is the number
+# of plies, counting this move, until the game ends with best play; score
+# ranks the moves, from the mover's point of view
+MoveValue = namedtuple('MoveValue', ['row', 'col', 'value', 'distance', 'score'])
+
+
+class EvalCache:
+    # LRU cache of analysed positions. on_lookup, if set, is called with
+    # 'hit' or 'miss' for every lookup.
+
+    def __init__(self, capacity=ANALYSIS_CACHE_SIZE, on_lookup=None):
+        self.capacity = capacity
+        self.on_lookup = on_lookup
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if self.on_lookup:
+            self.on_lookup('miss' if value is None else 'hit')
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+cache = EvalCache()
+
+
+def _canonical(geometry, x_mask, o_mask):
+    # Returns (x_mask, o_mask, symmetry) for the smallest equivalent position
+    if geometry is CLASSIC:
+        return canonical(x_mask, o_mask)
+    best = None
+    for symmetry in range(len(geometry.symmetries)):
+        cx = geometry.transform_mask(x_mask, symmetry)
+        co = geometry.transform_mask(o_mask, symmetry)
+        key = (cx << geometry.cell_count) | co
+        if best is None or key < best[0]:
+            best = (key, symmetry)
+    key, symmetry = best
+    return key >> geometry.cell_count, key & geometry.full_mask, symmetry
+
+
+def _score(value, distance):
+    if value == WIN:
+        return WIN_SCORE - distance + 1
+    if value == LOSS:
+        return distance - 1 - WIN_SCORE
+    return 0
+
+
+def _book_moves(geometry, x_mask, o_mask, player):
+    # [(cell, value, distance, score)] from the opening book
+    mine, theirs = (x_mask, o_mask) if player == 'X' else (o_mask, x_mask)
+    empty = geometry.full_mask & ~(x_mask | o_mask)
+    results = []
+    for cell in iter_cells(empty):
+        placed = mine | (1 << cell)
+        if geometry.has_line(placed, cell):
+            value, distance = WIN, 1
+        elif (placed | theirs) == geometry.full_mask:
+            value, distance = DRAW, 1
+        else:
+            child = (placed, theirs) if player == 'X' else (theirs, placed)
+            _, reply_value, reply_distance = solver.lookup(*child)
+            value = (WIN, DRAW, LOSS)[reply_value + 1]
+            distance = reply_distance + 1
+        results.append((cell, value, distance, _score(value, distance)))
+    return results
+
+
+def searched_moves(geometry, x_mask, o_mask, player, time_budget):
+    # [(cell, value, distance, score)] from a search of every move
+    scores, depth = get_searcher(geometry).analyze(x_mask, o_mask, player, time_budget)
+    remaining = popcount(geometry.full_mask & ~(x_mask | o_mask))
+    results = []
+    for cell, score in scores.items():
+        if abs(score) >= WIN_SCORE - remaining:
+            value, distance = (WIN if score > 0 else LOSS), WIN_SCORE - abs(score) + 1
+        elif depth == remaining:
+            # Searched to the end of the game without a win for either side
+            value, distance = DRAW, remaining
+        else:
+            value, distance = None, None
+        results.append((cell, value, distance, score))
+    return results
+
+
+def analyze(game, time_budget=None, search=searched_moves):
+    # Returns a MoveValue for every legal move of the player to move, best
+    # first. time_budget (seconds) only applies to boards searched afresh,
+    # which `search` does (bots.BotPool.analyze runs it in a bot worker).
+    if game.game_over:
+        return []
+    geometry = game.geometry
+    if game.is_classic:
+        time_budget = None
+    elif time_budget is None:
+        time_budget = DEFAULT_TIME_BUDGET
+    x_mask, o_mask, symmetry = _canonical(geometry, game.x_mask, game.o_mask)
+    key = (geometry.size, geometry.win_length, (x_mask << geometry.cell_count) | o_mask,
+           time_budget)
+    moves = cache.get(key)
+    if moves is None:
+        if game.is_classic:
+            moves = _book_moves(geometry, x_mask, o_mask, game.current_player)
+        else:
+            moves = search(geometry, x_mask, o_mask, game.current_player, time_budget)
+        moves = tuple(sorted(moves, key=lambda move: -move[3]))
+        cache.put(key, moves)
+    inverse = geometry.inverse_symmetries[symmetry]
+    return [MoveValue(*geometry.to_row_col(inverse[cell]), value, distance, score)
+            for cell, value, distance, score in moves]
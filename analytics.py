@@ -0,0 +1,238 @@
+import argparse
+import json
+import sys
+from collections import namedtuple
+
+import journal
+from codec import GAME_MODES, WINNERS
+from engine import DIFFICULTIES, get_geometry
+from store import DEFAULT_TTL
+
+# Streaming analytics over finished games.
+#
+#   python analytics.py --journal journal/ [--depth 4] [--top 5] [--json]
+#   python analytics.py --jsonl games.jsonl
+#   python analytics.py --journal journal/ --export games.jsonl
+#
+# Games flow through a chain of generators (read -> finished games ->
+# aggregate), so memory depends on the number of games in progress at once
+# and on the size of the opening tree, never on the number of games read.
+# Exported and imported JSONL has one finished game per line:
+#
+#   {"size": 3, "win_length": 3, "mode": "bot", "difficulty": "hard",
+#    "winner": "X", "moves": [4, 0, 8]}
+#
+# with moves as cell indices (row * size + col) in play order. Bot games are
+# reported per difficulty.
+
+DEFAULT_DEPTH = 4
+DEFAULT_TOP = 5
+SWEEP_EVERY = 100000  # records between drops of abandoned games
+
+FinishedGame = namedtuple('FinishedGame', 'size win_length mode difficulty winner moves')
+
+
+def journal_games(directory, idle=DEFAULT_TTL):
+    # Finished games from a journal, in the order they ended. Games with no
+    # event for `idle` seconds are dropped, as the server's store would have.
+    playing = {}  # game key -> [size, win length, mode, difficulty, moves, last event time]
+    for count, record in enumerate(journal.iter_records(directory), 1):
+        kind = record.kind
+        if kind == journal.NEW:
+            playing[record.game_id] = [record.a, record.b, GAME_MODES[record.c & 15],
+                                       DIFFICULTIES[record.c >> 4], bytearray(), record.timestamp]
+        else:
+            state = playing.get(record.game_id)
+            if state is None:
+                continue
+            state[5] = record.timestamp
+            if kind == journal.MOVE:
+                state[4].append(record.a)
+            elif kind == journal.UNDO:
+                if state[4]:
+                    state[4].pop()
+            elif kind == journal.RESET:
+                state[4] = bytearray()
+            elif kind == journal.MODE:
+                state[2] = GAME_MODES[record.a]
+                state[3] = DIFFICULTIES[record.b]
+            elif kind == journal.END:
+                # The moves stay: an undo may take the last one back and
+                # play on, and a reset starts a new game under the same id
+                yield FinishedGame(state[0], state[1], state[2], state[3], WINNERS[record.a],
+                                   bytes(state[4]))
+
+        if count % SWEEP_EVERY == 0:
+            cutoff = record.timestamp - idle
+            for key in [key for key, state in playing.items() if state[5] < cutoff]:
+                del playing[key]
+
+
+def jsonl_games(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        game = json.loads(line)
+        yield FinishedGame(game['size'], game['win_length'], game.get('mode'),
+                           game.get('difficulty', DIFFICULTIES[0]), game['winner'],
+                           bytes(game['moves']))
+
+
+def export_jsonl(games, out):
+    count = 0
+    for game in games:
+        out.write(json.dumps({'size': game.size, 'win_length': game.win_length, 'mode': game.mode,
+                              'difficulty': game.difficulty, 'winner': game.winner,
+                              'moves': list(game.moves)}))
+        out.write('\n')
+        count += 1
+    return count
+
+
+class Report:
+    # Running totals per board variant: results by game mode and an opening
+    # tree of positions reached in the first `depth` moves. Positions are
+    # folded under the board's 8 symmetries, so mirrored or rotated openings
+    # count as one.
+
+    def __init__(self, depth=DEFAULT_DEPTH):
+        self.depth = depth
+        self.games = 0
+        self.modes = {}  # (variant, mode) -> [games, X wins, O wins, ties, moves]
+        self.openings = {}  # (variant, ply, position key) -> [games, X wins, O wins, ties]
+
+    def add(self, game):
+        variant = (game.size, game.win_length)
+        result = 1 + ('X', 'O', 'Tie').index(game.winner)
+        self.games += 1
+
+        mode = game.mode or 'none'
+        if mode == 'bot':
+            mode = 'bot/' + game.difficulty
+        totals = self.modes.get((variant, mode))
+        if totals is None:
+            totals = self.modes[(variant, mode)] = [0, 0, 0, 0, 0]
+        totals[0] += 1
+        totals[result] += 1
+        totals[4] += len(game.moves)
+
+        # One key per symmetry, updated move by move: O marks in the low
+        # cell_count bits and X marks above them, so the smallest key is
+        # the canonical position
+        geometry = get_geometry(game.size, game.win_length)
+        cells = geometry.cell_count
+        symmetries = geometry.symmetries
+        keys = [0] * len(symmetries)
+        for ply, cell in enumerate(game.moves[:self.depth]):
+            shift = cells if ply % 2 == 0 else 0
+            for index, perm in enumerate(symmetries):
+                keys[index] |= 1 << (perm[cell] + shift)
+            node_key = (variant, ply + 1, min(keys))
+            node = self.openings.get(node_key)
+            if node is None:
+                node = self.openings[node_key] = [0, 0, 0, 0]
+            node[0] += 1
+            node[result] += 1
+
+    def consume(self, games):
+        for game in games:
+            self.add(game)
+        return self
+
+    def as_dict(self, top=DEFAULT_TOP):
+        variants = {}
+        for ((size, win_length), mode), (games, x, o, ties, moves) in sorted(self.modes.items()):
+            entry = variants.setdefault('%d-%d' % (size, win_length), {'modes': {}, 'openings': {}})
+            entry['modes'][mode] = {
+                'games': games, 'x_wins': x, 'o_wins': o, 'ties': ties,
+                'average_moves': moves / games,
+            }
+
+        by_ply = {}
+        for (variant, ply, key), stats in self.openings.items():
+            by_ply.setdefault((variant, ply), []).append((key, stats))
+        for ((size, win_length), ply), nodes in sorted(by_ply.items()):
+            nodes.sort(key=lambda node: (-node[1][0], node[0]))
+            cells = size * size
+            variants['%d-%d' % (size, win_length)]['openings'][ply] = [
+                {'cells': _render(key, cells), 'games': games,
+                 'x_wins': x, 'o_wins': o, 'ties': ties}
+                for key, (games, x, o, ties) in nodes[:top]
+            ]
+        return {'games': self.games, 'variants': variants}
+
+
+def _render(key, cells):
+    # A position key as an 'X', 'O', '.' string in cell order
+    x_mask = key >> cells
+    return ''.join('X' if x_mask >> cell & 1 else 'O' if key >> cell & 1 else '.'
+                   for cell in range(cells))
+
+
+def _percent(count, total):
+    return 100 * count / total if total else 0.0
+
+
+def print_report(summary, out=sys.stdout):
+    out.write('%d finished games\n' % summary['games'])
+    for variant, entry in summary['variants'].items():
+        out.write('\n%s\n' % variant)
+        for mode, stats in entry['modes'].items():
+            games = stats['games']
+            out.write('  %-12s %9d games  X %5.1f%%  O %5.1f%%  tie %5.1f%%  %5.2f moves/game\n' % (
+                mode, games, _percent(stats['x_wins'], games), _percent(stats['o_wins'], games),
+                _percent(stats['ties'], games), stats['average_moves']))
+            if mode.startswith('bot'):
+                out.write('  %-12s bot (O) wins %.1f%%, loses %.1f%%\n' % (
+                    '', _percent(stats['o_wins'], games), _percent(stats['x_wins'], games)))
+        for ply, nodes in entry['openings'].items():
+            out.write('  after move %d:\n' % ply)
+            for node in nodes:
+                games = node['games']
+                out.write('    %s %9d  X %5.1f%%  O %5.1f%%  tie %5.1f%%\n' % (
+                    node['cells'], games, _percent(node['x_wins'], games),
+                    _percent(node['o_wins'], games), _percent(node['ties'], games)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate statistics over finished games")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--journal', metavar='DIR', help="read games from a journal directory")
+    source.add_argument('--jsonl', metavar='FILE', help="read games from JSONL ('-' for stdin)")
+    parser.add_argument('--export', metavar='FILE',
+                        help="write the finished games as JSONL ('-' for stdout) instead of a report")
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH, help="opening tree depth in moves")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help="positions shown per depth")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.journal:
+        games = journal_games(args.journal)
+        return _run(args, games)
+    if args.jsonl == '-':
+        return _run(args, jsonl_games(sys.stdin))
+    with open(args.jsonl) as f:
+        return _run(args, jsonl_games(f))
+
+
+def _run(args, games):
+    if args.export:
+        if args.export == '-':
+            export_jsonl(games, sys.stdout)
+        else:
+            with open(args.export, 'w') as out:
+                count = export_jsonl(games, out)
+            print('Exported %d games to %s' % (count, args.export))
+        return 0
+
+    summary = Report(args.depth).consume(games).as_dict(args.top)
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        print_report(summary)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
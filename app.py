@@ -1,103 +1,290 @@
-from flask import Flask, render_template, jsonify, request
-import random
+from concurrent.futures import TimeoutError as FutureTimeout
+from functools import partial
+from flask import Flask, Response, g, render_template, jsonify, request
+from engine import DIFFICULTIES, TicTacToe, BOARD_SIZE
+from store import MemoryGameStore, VersionConflict, create_store
+from bots import BotPool, think
+from journal import create_journal
+from codec import GAME_MODES, compact_board
+from ratings import MAX_NAME_LENGTH, create_ratings
+from rooms import (Broadcast, changes, hub, player_for_token, player_token,
+                   seat_for_token)
+import analysis
+import codec
+import hashlib
+import json
+import metrics
+import solver
+import time
 
 app = Flask(__name__)
 
-# Store game states in memory (in production, use Redis or database)
-games = {}
+# Load the perfect-play opening book once per worker, not on the first move
+solver.get_book()
 
-class TicTacToe:
-    def __init__(self):
-        self.board = [['' for _ in range(3)] for _ in range(3)]
-        self.current_player = 'X'
-        self.game_mode = None
-        self.game_over = False
-        self.winner = None
-        
-    def reset(self):
-        self.board = [['' for _ in range(3)] for _ in range(3)]
-        self.current_player = 'X'
-        self.game_over = False
-        self.winner = None
-        
-    def make_move(self, row, col):
-        if self.board[row][col] == '' and not self.game_over:
-            self.board[row][col] = self.current_player
-            if self.check_winner():
-                self.game_over = True
-                self.winner = self.current_player
-            elif self.is_board_full():
-                self.game_over = True
-                self.winner = 'Tie'
-            else:
-                self.current_player = 'O' if self.current_player == 'X' else 'X'
-            return True
-        return False
-        
-    def check_winner(self):
-        # Check rows
-        for row in self.board:
-            if row[0] == row[1] == row[2] != '':
-                return True
-                
-        # Check columns
-        for col in range(3):
-            if self.board[0][col] == self.board[1][col] == self.board[2][col] != '':
-                return True
-                
-        # Check diagonals
-        if self.board[0][0] == self.board[1][1] == self.board[2][2] != '':
-            return True
-        if self.board[0][2] == self.board[1][1] == self.board[2][0] != '':
-            return True
-            
-        return False
-        
-    def is_board_full(self):
-        for row in self.board:
-            if '' in row:
-                return False
-        return True
-        
-    def get_bot_move(self):
-        # Try to win
-        for row in range(3):
-            for col in range(3):
-                if self.board[row][col] == '':
-                    self.board[row][col] = 'O'
-                    if self.check_winner():
-                        self.board[row][col] = ''
-                        return (row, col)
-                    self.board[row][col] = ''
-                    
-        # Block player from winning
-        for row in range(3):
-            for col in range(3):
-                if self.board[row][col] == '':
-                    self.board[row][col] = 'X'
-                    if self.check_winner():
-                        self.board[row][col] = ''
-                        return (row, col)
-                    self.board[row][col] = ''
-                    
-        # Take center if available
-        if self.board[1][1] == '':
-            return (1, 1)
-            
-        # Take corner if available
-        corners = [(0, 0), (0, 2), (2, 0), (2, 2)]
-        random.shuffle(corners)
-        for row, col in corners:
-            if self.board[row][col] == '':
-                return (row, col)
-                
-        # Take any available space
-        for row in range(3):
-            for col in range(3):
-                if self.board[row][col] == '':
-                    return (row, col)
-                    
+# Game sessions live in a GameStore: in-process by default, or Redis when
+# REDIS_URL is set so every worker sees the same games
+games = create_store(on_evict=metrics.game_evicted)
+
+# Every game event is also appended to an on-disk journal. After a restart
+# the in-process store is refilled from it (Redis keeps games by itself).
+journal = create_journal()
+if journal.directory:
+    active = journal.load_index(time.time() - games.ttl)
+    if isinstance(games, MemoryGameStore):
+        games.save_many(journal.rebuild(active))
+
+# Players, their ratings and the seats they take, in SQLite (see ratings.py)
+ratings = create_ratings()
+
+# Position analyses are cached per process; count hits and misses
+analysis.cache.on_lookup = metrics.analysis_lookup
+
+# Most players returned by one leaderboard request
+MAX_LEADERBOARD = 100
+
+# Most games or moves accepted by one batch request
+MAX_BATCH_SIZE = 1000
+
+# Bot moves are computed by a pool of worker processes (see bots.py).
+# /api/make-move waits up to BOT_WAIT seconds (or the request's "wait") for
+# the reply, then returns without it; the reply is applied and pushed when
+# it is ready.
+bots = BotPool()
+BOT_WAIT = 2.0
+# A batch waits this long for bot replies in total, however many it has;
+# replies not ready by then are applied in the background
+BATCH_BOT_WAIT = BOT_WAIT
+
+# Games with a bot reply still being computed by this process
+pending_bot_games = set()
+
+# Longest a GET of a game's state may wait for it to change
+LONG_POLL_MAX = 30.0
+
+def wants_compact(data):
+    return data.get('format') == 'compact' or request.args.get('format') == 'compact'
+
+def game_state(game, compact=False):
+    # Compact clients get the board as one 'X', 'O', '.' string instead of nested lists
+    state = {
+        'current_player': game.current_player,
+        'game_over': game.game_over,
+        'winner': game.winner
+    }
+    if compact:
+        state['cells'] = compact_board(game)
+        state['size'] = game.size
+    else:
+        state['board'] = game.board
+    return state
+
+def full_game_state(game, compact=False):
+    state = game_state(game, compact)
+    state['game_mode'] = game.game_mode
+    state['difficulty'] = game.difficulty
+    state['size'] = game.size
+    state['win_length'] = game.win_length
+    state['version'] = game.version
+    return state
+
+def publish_state(game_id, game, **extra):
+    # Push the new state to every WebSocket watching this game (see asgi.py)
+    # and wake long-polls waiting for it to change
+    changes.notify(game_id)
+    if not hub.subscriber_count(game_id):
+        return
+    snapshot = codec.decode(codec.encode(game))
+    hub.publish(game_id, Broadcast(
+        lambda compact: json.dumps(dict(full_game_state(snapshot, compact), type='state', **extra))))
+
+def check_seat(game_id, game, data, turn=False):
+    # Online games only accept changes from a seated player (the player to
+    # move, for moves); returns an (error, status) pair or None
+    if game.game_mode != 'online':
         return None
+    seat = seat_for_token(game_id, data.get('token'))
+    if seat is None:
+        metrics.validation_failed('seat_required')
+        return 'Seat token required', 403
+    if turn and seat != game.current_player:
+        metrics.validation_failed('not_your_turn')
+        return 'Not your turn', 403
+    return None
+
+def check_mode_change(game_id, game):
+    # Online games never change mode, and rated games keep the mode and
+    # difficulty they were started with so the result is rated against the
+    # bot that was actually played; returns an (error, status) pair or None
+    if game.game_mode == 'online':
+        metrics.validation_failed('invalid_mode')
+        return 'Online games cannot change mode', 400
+    if game.moves and ratings.is_seated(game_id):
+        metrics.validation_failed('rated_mode_locked')
+        return 'Rated games cannot change mode once started', 409
+    return None
+
+def check_take_back(game_id, game):
+    # Rated games are played out from where they stand, so a player cannot
+    # take back a lost position; returns an (error, status) pair or None
+    if ratings.is_seated(game_id):
+        metrics.validation_failed('rated_take_back')
+        return 'Rated games cannot undo or reset moves', 409
+    return None
+
+def apply_move(game_id, game, data, wait=None):
+    # Plays a human move and, in bot mode, the bot's reply if it is ready
+    # within `wait` seconds (None waits for it). Returns (extra response
+    # fields, pending bot future or None, None) or (None, None, (error, status)).
+    # The caller saves the game, then records the moves.
+    error = check_seat(game_id, game, data, turn=True)
+    if error:
+        return None, None, error
+    if bot_to_move(game):
+        # A reply lost with a restarted process is asked for again
+        if game_id not in pending_bot_games:
+            request_bot_move(game_id, game)
+        metrics.validation_failed('bot_thinking')
+        return None, None, ('The bot is still thinking', 409)
+    if not game.make_move(data.get('row'), data.get('col')):
+        metrics.validation_failed('invalid_move')
+        return None, None, ('Invalid move', 400)
+    metrics.move_played(game)
+    extra = {}
+    pending = None
+    if bot_to_move(game):
+        future = bots.submit(game_id, game)
+        try:
+            move, seconds = future.result(timeout=wait)
+        except FutureTimeout:
+            pending = future
+            extra['bot_pending'] = True
+        except Exception:
+            # A failed or crashed worker: think here, as deliver_bot_move does
+            app.logger.exception('Bot move failed for game %s', game_id)
+            move, seconds = think(game)
+        if pending is None:
+            extra['bot_move'] = play_bot_reply(game, move, seconds)
+    return extra, pending, None
+
+def record_moves(game_id, game, start):
+    # Journals the moves from `start` on, and rates the game if they ended
+    # it; called once they are saved
+    journal.record_moves(game_id, game, start)
+    if game.game_over:
+        ratings.record_result(game_id, game)
+
+def undo_moves(game):
+    # Takes back the last move, and in bot mode the bot's reply before it,
+    # so the human is to move again; returns the undone (row, col) pairs.
+    # Once saved, the caller journals them with journal.record_undo.
+    undone = []
+    move = game.undo_move()
+    if move:
+        undone.append(move)
+        if game.game_mode == 'bot' and game.current_player == 'O' and game.moves:
+            undone.append(game.undo_move())
+    return undone
+
+def find_game(game_id):
+    # The stored game, or its last journaled state once the store has
+    # dropped it; only used for read-only views. Only games in this
+    # process's journal index are looked up, so unknown ids cost nothing.
+    game = games.get(game_id)
+    if game is None and journal.directory and isinstance(game_id, str):
+        try:
+            game = journal.load_game(game_id)
+        except ValueError:
+            game = None
+    return game
+
+def bot_to_move(game):
+    return game.game_mode == 'bot' and not game.game_over and game.current_player == 'O'
+
+def play_bot_reply(game, move, seconds):
+    metrics.observe_bot_move(game, seconds)
+    game.make_move(move[0], move[1])
+    metrics.move_played(game)
+    return {'row': move[0], 'col': move[1]}
+
+def request_bot_move(game_id, game, future=None):
+    # Applies the bot's reply in the background once it is ready. The game
+    # must already be saved in its current state.
+    if future is None:
+        future = bots.submit(game_id, game)
+    pending_bot_games.add(game_id)
+    future.add_done_callback(partial(deliver_bot_move, game_id, bytes(game.moves)))
+
+def deliver_bot_move(game_id, moves, future):
+    # Applies a bot reply that was not ready when its request returned,
+    # unless the game has changed since (undo, reset, mode change)
+    pending_bot_games.discard(game_id)
+    try:
+        move, seconds = future.result()
+    except Exception:
+        app.logger.exception('Bot move failed for game %s', game_id)
+        move = None
+    game = games.get(game_id)
+    if game is None or bytes(game.moves) != moves or not bot_to_move(game):
+        return
+    if move is None:
+        move, seconds = think(game)
+    start = len(game.moves)
+    bot_move = play_bot_reply(game, move, seconds)
+    try:
+        games.save(game_id, game)
+    except VersionConflict:
+        return  # changed while the reply was being applied
+    record_moves(game_id, game, start)
+    publish_state(game_id, game, bot_move=bot_move)
+    bots.ponder(game_id, game)
+
+def parse_wait(data):
+    wait = data.get('wait', BOT_WAIT)
+    if isinstance(wait, bool) or not isinstance(wait, (int, float)) or not 0 <= wait <= BOT_WAIT:
+        return None
+    return wait
+
+def state_etag(game):
+    # A digest of the whole encoded game, version included, so two states
+    # never share an ETag even if a game's version starts over
+    return hashlib.blake2b(codec.encode(game), digest_size=8).hexdigest()
+
+def wait_for_change(game_id, etag, timeout):
+    # The stored game once its ETag is no longer `etag`, or as it is when
+    # the timeout passes; None if it is gone
+    latest = [None]
+    
+    def changed():
+        latest[0] = games.get(game_id)
+        return latest[0] is None or state_etag(latest[0]) != etag
+    
+    changes.wait(game_id, changed, timeout)
+    return latest[0]
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    # Routes are labelled by their rule, so game ids never become labels
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe_request(rule, request.method, response.status_code,
+                            time.perf_counter() - g.request_start)
+    metrics.observe_store(games)
+    return response
+
+@app.errorhandler(VersionConflict)
+def version_conflict(error):
+    # Another request saved the game between this one loading and saving it
+    metrics.validation_failed('version_conflict')
+    return jsonify({'error': 'The game changed, try again'}), 409
+
+@app.route('/metrics')
+def metrics_endpoint():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
 
 @app.route('/')
 def index():
@@ -106,56 +293,96 @@ def index():
 @app.route('/api/new-game', methods=['POST'])
 def new_game():
     import uuid
+    data = request.get_json(silent=True) or {}
+    size = data.get('size', BOARD_SIZE)
+    win_length = data.get('win_length')
+    difficulty = data.get('difficulty', DIFFICULTIES[0])
+    
+    try:
+        game = TicTacToe(size, win_length)
+    except (TypeError, ValueError) as e:
+        metrics.validation_failed('invalid_variant')
+        return jsonify({'error': str(e)}), 400
+    if difficulty not in DIFFICULTIES:
+        metrics.validation_failed('invalid_difficulty')
+        return jsonify({'error': 'Invalid difficulty'}), 400
+    game.difficulty = difficulty
+    # A player token makes bot games rated, with the player as X
+    player_id = player_for_token(data['player']) if 'player' in data else None
+    if 'player' in data and player_id is None:
+        metrics.validation_failed('invalid_player')
+        return jsonify({'error': 'Invalid player token'}), 403
+        
     game_id = str(uuid.uuid4())
-    games[game_id] = TicTacToe()
-    return jsonify({'game_id': game_id})
+    games.save(game_id, game)
+    journal.record_new(game_id, game)
+    metrics.games_created(game)
+    if player_id is not None:
+        ratings.seat(game_id, 'X', player_id)
+    return jsonify({
+        'game_id': game_id,
+        'size': game.size,
+        'win_length': game.win_length
+    })
 
 @app.route('/api/make-move', methods=['POST'])
 def make_move():
     data = request.json
     game_id = data.get('game_id')
-    row = data.get('row')
-    col = data.get('col')
     
-    if game_id not in games:
+    wait = parse_wait(data)
+    if wait is None:
+        metrics.validation_failed('invalid_wait')
+        return jsonify({'error': 'wait must be between 0 and %g seconds' % BOT_WAIT}), 400
+    
+    game = games.get(game_id)
+    if game is None:
         return jsonify({'error': 'Game not found'}), 404
-        
-    game = games[game_id]
-    
-    if game.make_move(row, col):
-        result = {
-            'board': game.board,
-            'current_player': game.current_player,
-            'game_over': game.game_over,
-            'winner': game.winner
-        }
-        
-        # Bot plays automatically if in bot mode
-        if game.game_mode == 'bot' and not game.game_over and game.current_player == 'O':
-            bot_move = game.get_bot_move()
-            if bot_move:
-                game.make_move(bot_move[0], bot_move[1])
-                result['bot_move'] = {'row': bot_move[0], 'col': bot_move[1]}
-        
-        result['board'] = game.board
-        result['current_player'] = game.current_player
-        result['game_over'] = game.game_over
-        result['winner'] = game.winner
-        
-        return jsonify(result)
-    else:
-        return jsonify({'error': 'Invalid move'}), 400
+    
+    start = len(game.moves)
+    extra, pending, error = apply_move(game_id, game, data, wait)
+    if error:
+        return jsonify({'error': error[0]}), error[1]
+    
+    result = dict(game_state(game, wants_compact(data)), **extra)
+    
+    games.save(game_id, game)
+    record_moves(game_id, game, start)
+    publish_state(game_id, game, **extra)
+    if pending:
+        # Registered after the save, so the reply always sees the human move
+        request_bot_move(game_id, game, pending)
+    elif 'bot_move' in extra:
+        bots.ponder(game_id, game)
+    return jsonify(result)
 
 @app.route('/api/set-mode', methods=['POST'])
 def set_mode():
     data = request.json
     game_id = data.get('game_id')
     mode = data.get('mode')
+    difficulty = data.get('difficulty')
     
-    if game_id not in games:
+    if mode not in GAME_MODES or mode == 'online':
+        metrics.validation_failed('invalid_mode')
+        return jsonify({'error': 'Invalid mode'}), 400
+    if difficulty is not None and difficulty not in DIFFICULTIES:
+        metrics.validation_failed('invalid_difficulty')
+        return jsonify({'error': 'Invalid difficulty'}), 400
+        
+    game = games.get(game_id)
+    if game is None:
         return jsonify({'error': 'Game not found'}), 404
+    error = check_mode_change(game_id, game)
+    if error:
+        return jsonify({'error': error[0]}), error[1]
         
-    games[game_id].game_mode = mode
+    game.game_mode = mode
+    if difficulty is not None:
+        game.difficulty = difficulty
+    games.save(game_id, game)
+    journal.record_mode(game_id, game)
+    publish_state(game_id, game)
     return jsonify({'status': 'success'})
 
 @app.route('/api/reset', methods=['POST'])
@@ -163,32 +390,277 @@ def reset_game():
     data = request.json
     game_id = data.get('game_id')
     
-    if game_id not in games:
+    game = games.get(game_id)
+    if game is None:
         return jsonify({'error': 'Game not found'}), 404
+    
+    error = check_seat(game_id, game, data) or check_take_back(game_id, game)
+    if error:
+        return jsonify({'error': error[0]}), error[1]
         
-    games[game_id].reset()
-    return jsonify({
-        'board': games[game_id].board,
-        'current_player': games[game_id].current_player,
-        'game_over': False,
-        'winner': None
-    })
+    game.reset()
+    games.save(game_id, game)
+    journal.record_reset(game_id)
+    publish_state(game_id, game)
+    return jsonify(game_state(game, wants_compact(data)))
+
+@app.route('/api/undo', methods=['POST'])
+def undo():
+    data = request.json
+    game_id = data.get('game_id')
+    
+    game = games.get(game_id)
+    if game is None:
+        return jsonify({'error': 'Game not found'}), 404
+    if game.game_mode == 'online':
+        metrics.validation_failed('undo_online')
+        return jsonify({'error': 'Online games cannot undo moves'}), 400
+    error = check_take_back(game_id, game)
+    if error:
+        return jsonify({'error': error[0]}), error[1]
+    
+    moves = bytes(game.moves)
+    undone = undo_moves(game)
+    if not undone:
+        metrics.validation_failed('nothing_to_undo')
+        return jsonify({'error': 'No moves to undo'}), 400
+    
+    games.save(game_id, game)
+    journal.record_undo(game_id, moves, len(game.moves))
+    publish_state(game_id, game)
+    result = game_state(game, wants_compact(data))
+    result['undone'] = [{'row': row, 'col': col} for row, col in undone]
+    return jsonify(result)
+
+@app.route('/api/history', methods=['POST'])
+def history():
+    data = request.json
+    game_id = data.get('game_id')
+    
+    game = find_game(game_id)
+    if game is None:
+        return jsonify({'error': 'Game not found'}), 404
+    
+    result = full_game_state(game, wants_compact(data))
+    result['moves'] = [{'row': row, 'col': col, 'player': 'X' if ply % 2 == 0 else 'O'}
+                       for ply, (row, col) in enumerate(game.history)]
+    return jsonify(result)
+
+@app.route('/api/replay', methods=['POST'])
+def replay():
+    # The position after each move (or only after move `ply`), from the
+    # empty board onwards
+    data = request.json
+    game_id = data.get('game_id')
+    ply = data.get('ply')
+    
+    game = find_game(game_id)
+    if game is None:
+        return jsonify({'error': 'Game not found'}), 404
+    if ply is not None and (not isinstance(ply, int) or not 0 <= ply <= len(game.moves)):
+        return jsonify({'error': 'ply must be between 0 and %d' % len(game.moves)}), 400
+    
+    compact = wants_compact(data)
+    frames = []
+    position = TicTacToe(game.size, game.win_length)
+    for index in range(len(game.moves) + 1):
+        if ply is None or index == ply:
+            frames.append(dict(game_state(position, compact), ply=index))
+        if index < len(game.moves):
+            position.make_move(*position.geometry.to_row_col(game.moves[index]))
+    return jsonify({'size': game.size, 'win_length': game.win_length, 'frames': frames})
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze():
+    # The value of every legal move for the player to move, best first
+    data = request.json
+    game_id = data.get('game_id')
+    
+    game = find_game(game_id)
+    if game is None:
+        return jsonify({'error': 'Game not found'}), 404
+    
+    # Bigger boards are searched in the game's bot worker, not this thread
+    moves = [move._asdict() for move in bots.analyze(game_id, game)]
+    return jsonify({'player': None if game.game_over else game.current_player,
+                    'moves': moves})
+
+@app.route('/api/players', methods=['POST'])
+def create_player():
+    data = request.get_json(silent=True) or {}
+    name = data.get('name')
+    if not isinstance(name, str) or not 0 < len(name.strip()) <= MAX_NAME_LENGTH:
+        metrics.validation_failed('invalid_name')
+        return jsonify({'error': 'name must be 1 to %d characters' % MAX_NAME_LENGTH}), 400
+    
+    player = ratings.create_player(name.strip())
+    player['token'] = player_token(player['player_id'])
+    return jsonify(player)
+
+@app.route('/api/players/<player_id>')
+def get_player(player_id):
+    player = ratings.get_player(player_id)
+    if player is None:
+        return jsonify({'error': 'Player not found'}), 404
+    return jsonify(player)
+
+@app.route('/api/leaderboard')
+def leaderboard():
+    # The best rated players; ?player=<player_id> also returns that
+    # player's own entry and rank
+    limit = request.args.get('limit', '10')
+    if not limit.isdigit() or not 1 <= int(limit) <= MAX_LEADERBOARD:
+        metrics.validation_failed('invalid_limit')
+        return jsonify({'error': 'limit must be between 1 and %d' % MAX_LEADERBOARD}), 400
+    
+    result = {'players': ratings.top(int(limit))}
+    player_id = request.args.get('player')
+    if player_id is not None:
+        result['player'] = ratings.get_player(player_id)
+    return jsonify(result)
 
 @app.route('/api/game-state', methods=['POST'])
 def get_game_state():
     data = request.json
     game_id = data.get('game_id')
     
-    if game_id not in games:
+    game = games.get(game_id)
+    if game is None:
         return jsonify({'error': 'Game not found'}), 404
         
-    game = games[game_id]
+    return jsonify(full_game_state(game, wants_compact(data)))
+
+@app.route('/api/games/<game_id>/state')
+def game_state_resource(game_id):
+    # Cacheable state: a request with a current If-None-Match gets 304.
+    # With ?wait=<seconds> such a request is held until the game changes
+    # (200) or the wait runs out (304).
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        wait = -1
+    if not 0 <= wait <= LONG_POLL_MAX:
+        metrics.validation_failed('invalid_wait')
+        return jsonify({'error': 'wait must be between 0 and %g seconds' % LONG_POLL_MAX}), 400
+    
+    game = find_game(game_id)
+    if game is None:
+        return jsonify({'error': 'Game not found'}), 404
+    etag = state_etag(game)
+    if wait and request.if_none_match.contains(etag):
+        game = wait_for_change(game_id, etag, wait)
+        if game is None:
+            return jsonify({'error': 'Game not found'}), 404
+    
+    response = jsonify(full_game_state(game, wants_compact({})))
+    response.set_etag(state_etag(game))
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/api/batch/new-games', methods=['POST'])
+def batch_new_games():
+    import uuid
+    data = request.get_json(silent=True) or {}
+    count = data.get('count', 1)
+    mode = data.get('mode')
+    difficulty = data.get('difficulty', DIFFICULTIES[0])
+    
+    if not isinstance(count, int) or not 1 <= count <= MAX_BATCH_SIZE:
+        metrics.validation_failed('invalid_batch')
+        return jsonify({'error': 'count must be between 1 and %d' % MAX_BATCH_SIZE}), 400
+    if mode not in GAME_MODES or mode == 'online':
+        metrics.validation_failed('invalid_mode')
+        return jsonify({'error': 'Invalid mode'}), 400
+    if difficulty not in DIFFICULTIES:
+        metrics.validation_failed('invalid_difficulty')
+        return jsonify({'error': 'Invalid difficulty'}), 400
+    try:
+        template = TicTacToe(data.get('size', BOARD_SIZE), data.get('win_length'))
+    except (TypeError, ValueError) as e:
+        metrics.validation_failed('invalid_variant')
+        return jsonify({'error': str(e)}), 400
+    template.game_mode = mode
+    template.difficulty = difficulty
+    
+    # Every new game starts identical, so they can share one instance on save
+    new_games = {str(uuid.uuid4()): template for _ in range(count)}
+    games.save_many(new_games)
+    for game_id in new_games:
+        journal.record_new(game_id, template)
+    metrics.games_created(template, count)
     return jsonify({
-        'board': game.board,
-        'current_player': game.current_player,
-        'game_over': game.game_over,
-        'winner': game.winner,
-        'game_mode': game.game_mode
+        'game_ids': list(new_games),
+        'size': template.size,
+        'win_length': template.win_length
+    })
+
+@app.route('/api/batch/moves', methods=['POST'])
+def batch_moves():
+    data = request.get_json(silent=True) or {}
+    moves = data.get('moves')
+    
+    if not isinstance(moves, list) or not 1 <= len(moves) <= MAX_BATCH_SIZE:
+        metrics.validation_failed('invalid_batch')
+        return jsonify({'error': 'moves must be a list of 1 to %d moves' % MAX_BATCH_SIZE}), 400
+    
+    # Load every game once, apply the moves in order, then save once
+    game_ids = {move.get('game_id') for move in moves
+                if isinstance(move, dict) and isinstance(move.get('game_id'), str)}
+    loaded = games.get_many(game_ids)
+    starts = {game_id: len(game.moves) for game_id, game in loaded.items()}
+    changed = {}
+    last_extra = {}
+    pending = {}  # game id -> bot reply not ready by the deadline
+    results = []
+    deadline = time.monotonic() + BATCH_BOT_WAIT
+    for move in moves:
+        if not isinstance(move, dict):
+            metrics.validation_failed('invalid_move')
+            results.append({'error': 'Invalid move', 'status': 400})
+            continue
+        game_id = move.get('game_id')
+        game = loaded.get(game_id) if isinstance(game_id, str) else None
+        if game is None:
+            results.append({'game_id': game_id, 'error': 'Game not found', 'status': 404})
+            continue
+        if game_id in pending:
+            metrics.validation_failed('bot_thinking')
+            results.append({'game_id': game_id, 'error': 'The bot is still thinking',
+                            'status': 409})
+            continue
+        before = codec.encode(game)
+        try:
+            extra, future, error = apply_move(game_id, game, move,
+                                              max(0.0, deadline - time.monotonic()))
+        except Exception:
+            # Only this move fails; the game goes back to how it was before it
+            app.logger.exception('Batch move failed for game %s', game_id)
+            loaded[game_id] = codec.decode(before)
+            if game_id in changed:
+                changed[game_id] = loaded[game_id]
+            results.append({'game_id': game_id, 'error': 'The move failed', 'status': 500})
+            continue
+        if future is not None:
+            pending[game_id] = future
+        if error:
+            results.append({'game_id': game_id, 'error': error[0], 'status': error[1]})
+            continue
+        changed[game_id] = game
+        last_extra[game_id] = extra
+        results.append(dict(extra, game_id=game_id, current_player=game.current_player,
+                            game_over=game.game_over, winner=game.winner))
+    
+    games.save_many(changed)
+    for game_id, game in changed.items():
+        record_moves(game_id, game, starts[game_id])
+        publish_state(game_id, game, **last_extra[game_id])
+    for game_id, future in pending.items():
+        request_bot_move(game_id, changed[game_id], future)
+    
+    compact = wants_compact(data)
+    return jsonify({
+        'results': results,
+        'games': {game_id: game_state(game, compact) for game_id, game in changed.items()}
     })
 
 if __name__ == '__main__':
@@ -0,0 +1,333 @@
+import asyncio
+import json
+import os
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.sync import SyncToAsync
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from app import (app as flask_app, bots, games, journal, ratings, bot_to_move,
+                 check_mode_change, check_take_back, deliver_bot_move, full_game_state,
+                 publish_state, record_moves, undo_moves)
+from codec import GAME_MODES
+import metrics
+from engine import DIFFICULTIES, TicTacToe, BOARD_SIZE
+from rooms import Matchmaker, hub, player_for_token, seat_for_token, seat_token
+from store import VersionConflict
+
+# Asyncio serving mode. The Flask REST routes are served unchanged through
+# an ASGI adapter, and each game also gets a WebSocket channel at
+# /ws/<game_id> so a client can stream moves and receive bot replies over
+# one connection:
+#
+#   uvicorn asgi:app
+#
+# Client messages are JSON objects with a "type" of "move" (with "row" and
+# "col"), "set_mode" (with "mode" and optionally "difficulty"), "undo",
+# "reset" or "state". Every socket on a
+# game receives {"type": "state", ...} pushes for each change, whoever made
+# it; problems are reported to the sender as {"type": "error", "error": ...}.
+# After a human move in bot mode the human move is pushed first and the
+# bot's reply follows as a second state message.
+#
+# Online games: a socket on /ws/match?size=..&win_length=.. waits for an
+# opponent and receives {"type": "matched", "game_id", "seat", "token"}.
+# Players then connect to /ws/<game_id>?token=<token>; sockets without a
+# token are spectators and can only ask for the state. Add &player=<player
+# token> to the match socket to play a rated game.
+
+WS_PREFIX = '/ws/'
+MATCH_PATH = '/ws/match'
+# REST requests handled at once, long-polls held open included
+HTTP_THREADS = int(os.environ.get('HTTP_THREADS', 32))
+
+_http_executor = ThreadPoolExecutor(HTTP_THREADS, thread_name_prefix='http')
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs every WSGI call on one shared thread, so a long-poll held
+    # for its wait would stall every other request (including the move that
+    # should end it); Flask is thread-safe, so requests get a pool instead
+    run_wsgi_app = SyncToAsync(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func,
+                               thread_sensitive=False, executor=_http_executor)
+
+
+class _PooledWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await _PooledWsgiInstance(self.wsgi_application)(scope, receive, send)
+
+
+http_app = _PooledWsgiToAsgi(flask_app)
+
+# One lock per game with live sockets, so concurrent messages apply in order
+_game_locks = weakref.WeakValueDictionary()
+
+
+def _game_lock(game_id):
+    lock = _game_locks.get(game_id)
+    if lock is None:
+        lock = _game_locks[game_id] = asyncio.Lock()
+    return lock
+
+
+def _create_online_game(size, win_length):
+    game = TicTacToe(size, win_length)
+    game.game_mode = 'online'
+    game_id = str(uuid.uuid4())
+    games.save(game_id, game)
+    journal.record_new(game_id, game)
+    metrics.games_created(game)
+    return game_id
+
+
+matchmaker = Matchmaker(_create_online_game)
+
+
+def _query(scope):
+    params = parse_qs(scope.get('query_string', b'').decode())
+    return {key: values[-1] for key, values in params.items()}
+
+
+async def _send_json(send, payload):
+    await send({'type': 'websocket.send', 'text': json.dumps(payload)})
+
+
+async def _receive_json(receive):
+    # Returns the next JSON object, {} for anything else, or None on disconnect
+    while True:
+        message = await receive()
+        if message['type'] == 'websocket.disconnect':
+            return None
+        if message['type'] != 'websocket.receive':
+            continue
+        try:
+            payload = json.loads(message.get('text') or message.get('bytes') or '')
+        except ValueError:
+            payload = None
+        return payload if isinstance(payload, dict) else {}
+
+
+def _apply_message(game_id, seat, message, compact):
+    # Applies one client message. Runs in a worker thread, since it loads
+    # and saves the game and journals and rates the change. Returns a
+    # direct reply or None when the result is delivered through the game's
+    # broadcast, and the (future, moves) of a bot reply to wait for or None.
+    msg_type = message.get('type')
+    game = games.get(game_id)
+    if game is None:
+        return {'type': 'error', 'error': 'Game not found'}, None
+
+    if msg_type == 'state':
+        return dict(full_game_state(game, compact), type='state'), None
+
+    online = game.game_mode == 'online'
+    if online and seat is None:
+        metrics.validation_failed('seat_required')
+        return {'type': 'error', 'error': 'Spectators cannot play'}, None
+
+    if msg_type == 'move':
+        if online and seat != game.current_player:
+            metrics.validation_failed('not_your_turn')
+            return {'type': 'error', 'error': 'Not your turn'}, None
+        if bot_to_move(game):
+            metrics.validation_failed('bot_thinking')
+            return {'type': 'error', 'error': 'The bot is still thinking'}, None
+        start = len(game.moves)
+        if not game.make_move(message.get('row'), message.get('col')):
+            metrics.validation_failed('invalid_move')
+            return {'type': 'error', 'error': 'Invalid move'}, None
+        metrics.move_played(game)
+        games.save(game_id, game)
+        record_moves(game_id, game, start)
+        publish_state(game_id, game)
+
+        if bot_to_move(game):
+            return None, (bots.submit(game_id, game), bytes(game.moves))
+        return None, None
+
+    if msg_type == 'set_mode':
+        mode = message.get('mode')
+        difficulty = message.get('difficulty', game.difficulty)
+        if mode not in GAME_MODES or mode == 'online':
+            metrics.validation_failed('invalid_mode')
+            return {'type': 'error', 'error': 'Invalid mode'}, None
+        if difficulty not in DIFFICULTIES:
+            metrics.validation_failed('invalid_difficulty')
+            return {'type': 'error', 'error': 'Invalid difficulty'}, None
+        error = check_mode_change(game_id, game)
+        if error:
+            return {'type': 'error', 'error': error[0]}, None
+        game.game_mode = mode
+        game.difficulty = difficulty
+        games.save(game_id, game)
+        journal.record_mode(game_id, game)
+        publish_state(game_id, game)
+        return None, None
+
+    if msg_type == 'undo':
+        if online:
+            metrics.validation_failed('undo_online')
+            return {'type': 'error', 'error': 'Online games cannot undo moves'}, None
+        error = check_take_back(game_id, game)
+        if error:
+            return {'type': 'error', 'error': error[0]}, None
+        moves = bytes(game.moves)
+        if not undo_moves(game):
+            metrics.validation_failed('nothing_to_undo')
+            return {'type': 'error', 'error': 'No moves to undo'}, None
+        games.save(game_id, game)
+        journal.record_undo(game_id, moves, len(game.moves))
+        publish_state(game_id, game)
+        return None, None
+
+    if msg_type == 'reset':
+        error = check_take_back(game_id, game)
+        if error:
+            return {'type': 'error', 'error': error[0]}, None
+        game.reset()
+        games.save(game_id, game)
+        journal.record_reset(game_id)
+        publish_state(game_id, game)
+        return None, None
+
+    return {'type': 'error', 'error': 'Unknown message type'}, None
+
+
+async def _handle_message(game_id, seat, message, compact):
+    # Applies one client message off the event loop; returns a direct reply
+    # or None when the result is delivered through the game's broadcast
+    reply, bot = await asyncio.to_thread(_apply_message, game_id, seat, message, compact)
+    if bot is None:
+        return reply
+    # The bot pool thinks in another process; the reply is applied (unless
+    # the game changed meanwhile) and pushed when ready
+    future, moves = bot
+    try:
+        await asyncio.wrap_future(future)
+    except Exception:
+        pass  # deliver_bot_move logs the failure and thinks in this process instead
+    try:
+        await asyncio.to_thread(deliver_bot_move, game_id, moves, future)
+    except Exception:
+        flask_app.logger.exception('Bot move failed for game %s', game_id)
+        return {'type': 'error', 'error': 'The bot could not move'}
+    return None
+
+
+async def _forward(subscription, send, compact):
+    # Relays broadcasts for one socket until it is closed or falls behind
+    while True:
+        broadcast = await subscription.queue.get()
+        await send({'type': 'websocket.send', 'text': broadcast.text(compact)})
+        if subscription.overflowed and subscription.queue.empty():
+            await send({'type': 'websocket.close', 'code': 1008})
+            return
+
+
+async def game_socket(scope, receive, send):
+    game_id = scope['path'][len(WS_PREFIX):]
+    query = _query(scope)
+    compact = query.get('format') == 'compact'
+
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if await asyncio.to_thread(games.get, game_id) is None:
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    await send({'type': 'websocket.accept'})
+
+    seat = seat_for_token(game_id, query.get('token'))
+    lock = _game_lock(game_id)
+    subscription = hub.subscribe(game_id)
+    forwarder = asyncio.ensure_future(_forward(subscription, send, compact))
+    try:
+        while True:
+            payload = await _receive_json(receive)
+            if payload is None or forwarder.done():
+                return
+            async with lock:
+                try:
+                    reply = await _handle_message(game_id, seat, payload, compact)
+                except VersionConflict:
+                    # Changed through the REST API in the meantime
+                    metrics.validation_failed('version_conflict')
+                    reply = {'type': 'error', 'error': 'The game changed, try again'}
+            if reply is not None:
+                await _send_json(send, reply)
+    finally:
+        hub.unsubscribe(subscription)
+        forwarder.cancel()
+
+
+async def match_socket(scope, receive, send):
+    query = _query(scope)
+    try:
+        size = int(query.get('size', BOARD_SIZE))
+        win_length = int(query['win_length']) if 'win_length' in query else None
+        TicTacToe(size, win_length)
+    except (TypeError, ValueError):
+        size = None
+    player_id = player_for_token(query['player']) if 'player' in query else None
+
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if size is None:
+        await send({'type': 'websocket.close', 'code': 4400})
+        return
+    if 'player' in query and player_id is None:
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+    await send({'type': 'websocket.accept'})
+
+    # Stop waiting if the client goes away before an opponent turns up
+    join = asyncio.ensure_future(matchmaker.join(size, win_length))
+    disconnect = asyncio.ensure_future(_receive_json(receive))
+    while True:
+        done, _ = await asyncio.wait({join, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        if join in done:
+            break
+        if disconnect.result() is None:
+            join.cancel()
+            return
+        disconnect = asyncio.ensure_future(_receive_json(receive))
+    disconnect.cancel()
+
+    game_id, seat = join.result()
+    if player_id is not None:
+        await asyncio.to_thread(ratings.seat, game_id, seat, player_id)
+    await _send_json(send, {
+        'type': 'matched',
+        'game_id': game_id,
+        'seat': seat,
+        'token': seat_token(game_id, seat),
+        'size': size,
+    })
+    await send({'type': 'websocket.close', 'code': 1000})
+
+
+async def lifespan_app(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'websocket' and scope['path'] == MATCH_PATH:
+        await match_socket(scope, receive, send)
+    elif scope['type'] == 'websocket' and scope['path'].startswith(WS_PREFIX):
+        await game_socket(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await lifespan_app(scope, receive, send)
+    elif scope['type'] == 'http':
+        await http_app(scope, receive, send)
+    else:
+        await send({'type': 'websocket.close', 'code': 4404})
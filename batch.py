@@ -0,0 +1,180 @@
+from functools import lru_cache
+
+import numpy as np
+
+import solver
+from engine import CLASSIC, CELL_COUNT, iter_cells
+
+# Vectorised evaluation of many boards at once with NumPy.
+#
+# Boards are (N, size * size) integer arrays holding 0 for empty, 1 for X
+# and 2 for O, in the engine's row-major cell order. Every function works on
+# the whole batch with array operations instead of looping per board.
+
+EMPTY, X, O = 0, 1, 2
+NO_MOVE = -1
+
+
+@lru_cache(maxsize=None)
+def line_matrix(geometry=CLASSIC):
+    # (lines, cells) 0/1 matrix of the geometry's winning lines
+    lines = np.zeros((len(geometry.win_masks), geometry.cell_count), dtype=np.int16)
+    for index, mask in enumerate(geometry.win_masks):
+        lines[index, list(iter_cells(mask))] = 1
+    return lines
+
+
+def from_games(games):
+    # Stacks engine games of one geometry into a board array
+    games = list(games)
+    cell_count = games[0].geometry.cell_count if games else CELL_COUNT
+    boards = np.zeros((len(games), cell_count), dtype=np.int8)
+    for index, game in enumerate(games):
+        boards[index, list(iter_cells(game.x_mask))] = X
+        boards[index, list(iter_cells(game.o_mask))] = O
+    return boards
+
+
+def line_counts(boards, geometry=CLASSIC):
+    # Marks per winning line for each player, two (N, lines) arrays
+    lines = line_matrix(geometry).T
+    x_counts = (boards == X).astype(np.int16) @ lines
+    o_counts = (boards == O).astype(np.int16) @ lines
+    return x_counts, o_counts
+
+
+def winners(boards, geometry=CLASSIC):
+    # (N,) int8: 0 for no winner, 1 if X has a line, 2 if O has one
+    x_counts, o_counts = line_counts(boards, geometry)
+    k = geometry.win_length
+    result = np.zeros(len(boards), dtype=np.int8)
+    result[(x_counts == k).any(axis=1)] = X
+    result[(o_counts == k).any(axis=1)] = O
+    return result
+
+
+def full(boards):
+    # (N,) bool: no empty cell left
+    return (boards != EMPTY).all(axis=1)
+
+
+def players_to_move(boards):
+    # (N,) int8: 1 when X is to move, 2 when O is
+    x_count = (boards == X).sum(axis=1)
+    o_count = (boards == O).sum(axis=1)
+    return np.where(x_count == o_count, X, O).astype(np.int8)
+
+
+def legal_moves(boards, geometry=CLASSIC):
+    # (N, cells) bool: empty cells of games that are still running
+    running = (winners(boards, geometry) == 0) & ~full(boards)
+    return (boards == EMPTY) & running[:, None]
+
+
+def _pick(candidates, rng):
+    # One True column per row (random among ties when rng is given), NO_MOVE if none
+    if rng is None:
+        choice = candidates.argmax(axis=1)
+    else:
+        choice = np.where(candidates, rng.random(candidates.shape), -1.0).argmax(axis=1)
+    return np.where(candidates.any(axis=1), choice, NO_MOVE)
+
+
+def random_moves(boards, geometry=CLASSIC, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    return _pick(legal_moves(boards, geometry), rng)
+
+
+def heuristic_moves(boards, geometry=CLASSIC, rng=None):
+    # The greedy bot for every board: win, block, center, corner, anything.
+    # Like TicTacToe.get_heuristic_move, ties go to the lowest cell except
+    # between corners, which are chosen at random when rng is given.
+    lines = line_matrix(geometry)
+    k = geometry.win_length
+    legal = legal_moves(boards, geometry)
+    to_move = players_to_move(boards)
+    x_counts, o_counts = line_counts(boards, geometry)
+    mover_x = (to_move == X)[:, None]
+    mine = np.where(mover_x, x_counts, o_counts)
+    theirs = np.where(mover_x, o_counts, x_counts)
+
+    # Empty cells on a line one short of k with no opposing marks
+    wins = (((mine == k - 1) & (theirs == 0)).astype(np.int16) @ lines > 0) & legal
+    blocks = (((theirs == k - 1) & (mine == 0)).astype(np.int16) @ lines > 0) & legal
+    center = np.zeros_like(legal)
+    center[:, geometry.center] = True
+    center &= legal
+    corners = np.zeros_like(legal)
+    corners[:, list(geometry.corners)] = True
+    corners &= legal
+
+    moves = np.full(len(boards), NO_MOVE)
+    for candidates in (wins, blocks, center, corners, legal):
+        undecided = moves == NO_MOVE
+        picked = _pick(candidates, rng if candidates is corners else None)
+        moves = np.where(undecided, picked, moves)
+    return moves
+
+
+@lru_cache(maxsize=None)
+def _book_table():
+    # (3 ** 9, 9) bool of optimal moves for every classic board, by base-3 index
+    table = np.zeros((3 ** CELL_COUNT, CELL_COUNT), dtype=bool)
+    digits = np.arange(3 ** CELL_COUNT)[:, None] // (3 ** np.arange(CELL_COUNT)) % 3
+    for index, row in enumerate(digits):
+        x_mask = int(sum(1 << cell for cell in range(CELL_COUNT) if row[cell] == X))
+        o_mask = int(sum(1 << cell for cell in range(CELL_COUNT) if row[cell] == O))
+        if x_mask & o_mask:
+            continue
+        result = solver.lookup(x_mask, o_mask)
+        if result is not None:
+            table[index, list(iter_cells(result[0]))] = True
+    return table
+
+
+def board_indices(boards):
+    # Base-3 index of each classic board
+    return boards.astype(np.int32) @ (3 ** np.arange(CELL_COUNT, dtype=np.int32))
+
+
+def perfect_moves(boards, rng=None):
+    # Opening-book moves for classic boards; NO_MOVE for finished or
+    # unreachable positions
+    candidates = _book_table()[board_indices(boards)] & legal_moves(boards)
+    return _pick(candidates, rng)
+
+
+def bot_moves(boards, geometry=CLASSIC, rng=None):
+    # The opening-book move on classic boards and the greedy heuristic on
+    # bigger ones, as cell indices. This is not the server's bot, which
+    # searches bigger boards (see strategies.LEVELS).
+    if geometry is CLASSIC:
+        return perfect_moves(boards, rng)
+    return heuristic_moves(boards, geometry, rng)
+
+
+MOVE_FUNCTIONS = {
+    'random': random_moves,
+    'heuristic': heuristic_moves,
+    'perfect': lambda boards, geometry, rng: perfect_moves(boards, rng),
+}
+
+
+def play_lockstep(x_name, o_name, count, geometry=CLASSIC, rng=None):
+    # Plays `count` games side by side, one ply of every game per step.
+    # Returns the final boards and their winners (0 for a draw).
+    rng = rng if rng is not None else np.random.default_rng()
+    x_moves = MOVE_FUNCTIONS[x_name]
+    o_moves = MOVE_FUNCTIONS[o_name]
+    boards = np.zeros((count, geometry.cell_count), dtype=np.int8)
+    rows = np.arange(count)
+
+    for ply in range(geometry.cell_count):
+        player = X if ply % 2 == 0 else O
+        moves = (x_moves if player == X else o_moves)(boards, geometry, rng)
+        playing = moves != NO_MOVE
+        if not playing.any():
+            break
+        boards[rows[playing], moves[playing]] = player
+
+    return boards, winners(boards, geometry)
@@ -0,0 +1,114 @@
+import argparse
+import random
+import sys
+import tracemalloc
+import uuid
+
+import codec
+import solver
+from engine import TicTacToe, get_geometry
+from search import Searcher
+from store import MemoryGameStore
+from benchmarks.common import add_baseline_arguments, finish, print_results, time_per_call
+
+# Micro-benchmarks for the game engine, bot, codec and session store.
+#
+#   python -m benchmarks.bench_engine [--save-baseline | --compare]
+
+# A full 3x3 game that ends in a draw
+DRAW_GAME = [(1, 1), (0, 0), (0, 1), (2, 1), (1, 0), (1, 2), (0, 2), (2, 0), (2, 2)]
+MEMORY_GAMES = 20000
+
+
+def _mid_game(size=3, win_length=None, moves=4, seed=1):
+    rng = random.Random(seed)
+    game = TicTacToe(size, win_length)
+    for _ in range(moves):
+        game.make_move(*rng.choice(game.legal_moves()))
+    return game
+
+
+def bench_engine():
+    results = {}
+
+    def play_draw():
+        game = TicTacToe()
+        for row, col in DRAW_GAME:
+            game.make_move(row, col)
+    results['make_move_us'] = time_per_call(play_draw) / len(DRAW_GAME) * 1e6
+
+    game = _mid_game()
+    results['check_winner_us'] = time_per_call(game.check_winner) * 1e6
+    results['is_board_full_us'] = time_per_call(game.is_board_full) * 1e6
+    results['legal_moves_us'] = time_per_call(game.legal_moves) * 1e6
+
+    solver.get_book()
+    results['bot_move_book_us'] = time_per_call(game.get_bot_move) * 1e6
+    results['bot_move_heuristic_us'] = time_per_call(game.get_heuristic_move) * 1e6
+
+    big = _mid_game(7, 4, moves=6)
+
+    def search_fixed_depth():
+        Searcher(get_geometry(7, 4), tt_size=1 << 12).search(
+            big.x_mask, big.o_mask, big.current_player, time_budget=60, max_depth=3)
+    results['search_7x7_depth3_ms'] = time_per_call(search_fixed_depth, min_time=0.5, repeat=3) * 1e3
+
+    data = codec.encode(game)
+    results['codec_encode_us'] = time_per_call(lambda: codec.encode(game)) * 1e6
+    results['codec_decode_us'] = time_per_call(lambda: codec.decode(data)) * 1e6
+
+    store = MemoryGameStore()
+    store.save('bench', game)
+    results['store_get_us'] = time_per_call(lambda: store.get('bench')) * 1e6
+    results['store_save_us'] = time_per_call(lambda: store.save('bench', game)) * 1e6
+    return results
+
+
+def bench_memory():
+    # Bytes held per game by a live engine object and by the session store
+    results = {}
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    live = [_mid_game(seed=seed) for seed in range(MEMORY_GAMES)]
+    results['live_game_bytes'] = (tracemalloc.get_traced_memory()[0] - before) / len(live)
+    del live
+
+    store = MemoryGameStore(max_games=MEMORY_GAMES)
+    game_ids = [str(uuid.uuid4()) for _ in range(MEMORY_GAMES)]
+    games = [_mid_game(seed=seed) for seed in range(MEMORY_GAMES)]
+    before = tracemalloc.get_traced_memory()[0]
+    for game_id, game in zip(game_ids, games):
+        store.save(game_id, game)
+    results['stored_game_bytes'] = (tracemalloc.get_traced_memory()[0] - before) / MEMORY_GAMES
+    tracemalloc.stop()
+    return results
+
+
+def bench_batch():
+    # Vectorised evaluation, when NumPy is installed
+    try:
+        import batch
+    except ImportError:
+        return {}
+    boards = batch.from_games(_mid_game(seed=seed) for seed in range(10000))
+    batch.perfect_moves(boards[:1])
+    return {
+        'batch_winners_10k_ms': time_per_call(lambda: batch.winners(boards)) * 1e3,
+        'batch_perfect_moves_10k_ms': time_per_call(lambda: batch.perfect_moves(boards)) * 1e3,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Engine micro-benchmarks")
+    add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    results = bench_engine()
+    results.update(bench_memory())
+    results.update(bench_batch())
+    print_results('Engine benchmarks', results)
+    return finish('engine', results, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import argparse
+import gc
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from benchmarks.common import add_baseline_arguments, finish, latency_summary, print_results
+
+# End-to-end load scenario for the HTTP API: each simulated player creates a
+# game, switches to bot mode and plays random legal moves until it ends.
+#
+#   python -m benchmarks.bench_http                       # Flask test client
+#   python -m benchmarks.bench_http --gunicorn 4          # spawn local gunicorn
+#   python -m benchmarks.bench_http --url http://host:port --clients 32
+#
+# Reports p50/p99 latency per route, overall request throughput and, for the
+# in-process run, memory held per active game.
+
+ROUTES = ('new-game', 'set-mode', 'make-move')
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestClientTransport:
+    def __init__(self):
+        from app import app
+        self.client = app.test_client()
+
+    def post(self, path, body):
+        response = self.client.post(path, json=body)
+        return response.get_json()
+
+
+class HTTPTransport:
+    # One keep-alive connection per thread
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.local = threading.local()
+
+    def post(self, path, body):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        payload = json.dumps(body)
+        try:
+            conn.request('POST', path, payload, {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            conn.request('POST', path, payload, {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+        return json.loads(response.read())
+
+
+def play_games(transport, games, rng, samples):
+    # Plays `games` full games, recording seconds per request by route
+    for _ in range(games):
+        start = time.perf_counter()
+        game_id = transport.post('/api/new-game', {})['game_id']
+        samples['new-game'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        transport.post('/api/set-mode', {'game_id': game_id, 'mode': 'bot'})
+        samples['set-mode'].append(time.perf_counter() - start)
+
+        board = [['' for _ in range(3)] for _ in range(3)]
+        while True:
+            empty = [(r, c) for r in range(3) for c in range(3) if not board[r][c]]
+            row, col = rng.choice(empty)
+            start = time.perf_counter()
+            state = transport.post('/api/make-move', {'game_id': game_id, 'row': row, 'col': col})
+            samples['make-move'].append(time.perf_counter() - start)
+            if 'error' in state:
+                samples['errors'].append(state['error'])
+                break
+            if state['game_over']:
+                break
+            board = state['board']
+
+
+def run_load(transport, games, clients, seed):
+    per_client = [defaultdict(list) for _ in range(clients)]
+    counts = [games // clients + (1 if i < games % clients else 0) for i in range(clients)]
+    threads = [
+        threading.Thread(target=play_games,
+                         args=(transport, counts[i], random.Random(seed + i), per_client[i]))
+        for i in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    results = {}
+    every = []
+    for route in ROUTES:
+        route_samples = [s for samples in per_client for s in samples[route]]
+        every.extend(route_samples)
+        results.update(latency_summary(route.replace('-', '_'), route_samples, elapsed))
+    results.update(latency_summary('all_requests', every, elapsed))
+    results['games_per_sec'] = games / elapsed
+    results['errors'] = sum(len(samples['errors']) for samples in per_client)
+    return results
+
+
+def active_game_bytes(count=5000):
+    # Memory retained by the in-process store per game created over HTTP
+    transport = TestClientTransport()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(count):
+        transport.post('/api/new-game', {})
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return retained / count
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(workers):
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', '127.0.0.1:%d' % port, 'app:app'],
+        cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process, 'http://127.0.0.1:%d' % port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('gunicorn did not start')
+
+
+def use_scratch_storage():
+    # The benchmark's games and players go to a temporary journal and ratings
+    # database, not the ones next to the app; returns the directory
+    directory = tempfile.mkdtemp(prefix='ttt-bench-')
+    os.environ.setdefault('JOURNAL_DIR', os.path.join(directory, 'journal'))
+    os.environ.setdefault('RATINGS_DB', os.path.join(directory, 'ratings.db'))
+    return directory
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP load benchmark")
+    parser.add_argument('--games', type=int, default=500, help="games to play")
+    parser.add_argument('--clients', type=int, default=None, help="concurrent players (default 1 in-process, 16 otherwise)")
+    parser.add_argument('--url', help="benchmark a running server instead of the Flask test client")
+    parser.add_argument('--gunicorn', type=int, metavar='WORKERS', help="start a local gunicorn with this many workers")
+    parser.add_argument('--seed', type=int, default=0)
+    add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.gunicorn and args.gunicorn > 1 and not os.environ.get('REDIS_URL'):
+        parser.error("more than one gunicorn worker needs REDIS_URL so workers share games")
+
+    # Set before the app is imported here or started by gunicorn
+    scratch = None if args.url else use_scratch_storage()
+    process = None
+    if args.gunicorn:
+        process, args.url = start_gunicorn(args.gunicorn)
+    try:
+        if args.url:
+            transport = HTTPTransport(args.url)
+            clients = args.clients or 16
+            name = 'http_gunicorn' if args.gunicorn else 'http_remote'
+        else:
+            transport = TestClientTransport()
+            clients = args.clients or 1
+            name = 'http_test_client'
+
+        results = run_load(transport, args.games, clients, args.seed)
+        if not args.url:
+            results['active_game_bytes'] = active_game_bytes()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if scratch is not None:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    print_results('HTTP benchmark (%s, %d clients, %d games)' % (name, clients, args.games), results)
+    settings = {'clients': clients, 'games': args.games}
+    if args.gunicorn:
+        settings['workers'] = args.gunicorn
+    return finish(name, results, args, settings)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import json
+import os
+import platform
+import time
+
+# Shared helpers for the benchmark scripts: timing, percentiles and saved
+# baselines. Results are flat {metric: value} dicts; metrics ending in
+# '_per_sec' are better when higher, everything else when lower. A baseline
+# also records the run's settings (client count and so on), and is only
+# compared with runs that used the same ones.
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+DEFAULT_TOLERANCE = 0.15  # relative slowdown reported as a regression
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def time_per_call(func, min_time=0.2, repeat=5):
+    # Best-of-`repeat` seconds per call, each run looping for at least min_time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def latency_summary(prefix, samples, elapsed):
+    # p50/p99 in milliseconds plus throughput for a list of per-request seconds
+    return {
+        prefix + '_p50_ms': percentile(samples, 50) * 1000,
+        prefix + '_p99_ms': percentile(samples, 99) * 1000,
+        prefix + '_per_sec': len(samples) / elapsed if elapsed else 0.0,
+    }
+
+
+def print_results(title, results):
+    print(title)
+    width = max(len(name) for name in results)
+    for name, value in results.items():
+        print('  %-*s %14.3f' % (width, name, value))
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, name + '.json')
+
+
+def save_baseline(name, results, settings=None):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(baseline_path(name), 'w') as f:
+        json.dump({
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'settings': settings or {},
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare_baseline(name, results, tolerance=DEFAULT_TOLERANCE, settings=None):
+    # Prints each metric against the saved baseline; returns the regressions
+    try:
+        with open(baseline_path(name)) as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        print('No baseline saved for %s (run with --save-baseline)' % name)
+        return []
+    if saved.get('settings', {}) != (settings or {}):
+        print('Baseline %s was recorded with %s, not %s; rerun with those settings'
+              % (baseline_path(name), saved.get('settings', {}), settings or {}))
+        return ['settings']
+    baseline = saved['results']
+
+    regressions = []
+    print('Compared with baseline %s:' % baseline_path(name))
+    for metric, value in results.items():
+        old = baseline.get(metric)
+        if not old:
+            continue
+        change = (value - old) / old
+        worse = -change if metric.endswith('_per_sec') else change
+        flag = ''
+        if worse > tolerance:
+            flag = '  REGRESSION'
+            regressions.append(metric)
+        print('  %-40s %+7.1f%%%s' % (metric, 100 * change, flag))
+    return regressions
+
+
+def add_baseline_arguments(parser):
+    parser.add_argument('--save-baseline', action='store_true', help="save results as the new baseline")
+    parser.add_argument('--compare', action='store_true', help="compare results with the saved baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="relative slowdown treated as a regression")
+
+
+def finish(name, results, args, settings=None):
+    # Saves or compares baselines as requested; returns the process exit code
+    if args.save_baseline:
+        save_baseline(name, results, settings)
+        print('Saved baseline %s' % baseline_path(name))
+    if args.compare:
+        return 1 if compare_baseline(name, results, args.tolerance, settings) else 0
+    return 0
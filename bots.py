@@ -0,0 +1,157 @@
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from engine import TicTacToe
+from strategies import LEVELS
+
+# Bot moves computed off the request (or render) thread.
+#
+# Searches on bigger boards run in worker processes, so they neither block
+# a request worker nor hold the GIL that the server and the pygame render
+# loop need. Every game is routed to the same worker each time, and after
+# the bot has moved that worker ponders: it searches the positions after the
+# opponent's likeliest replies, leaving the results in its transposition
+# table for when the real reply arrives. Classic 3x3 positions are answered
+# straight from the opening book or a tiny search in the calling thread,
+# since handing them to another process would cost more than the move.
+
+BOT_WORKERS = int(os.environ.get('BOT_WORKERS', min(4, os.cpu_count() or 1)))
+PONDER_REPLIES = 3  # opponent replies searched ahead after each bot move
+
+
+def _position(size, win_length, difficulty, x_mask, o_mask, player):
+    game = TicTacToe(size, win_length)
+    game.difficulty = difficulty
+    game.x_mask = x_mask
+    game.o_mask = o_mask
+    game.current_player = player
+    return game
+
+
+def _args(game):
+    return (game.size, game.win_length, game.difficulty, game.x_mask, game.o_mask,
+            game.current_player)
+
+
+def think(game):
+    # Returns (move, seconds spent) for the bot in this position
+    start = time.perf_counter()
+    move = game.get_bot_move()
+    return move, time.perf_counter() - start
+
+
+def _think(*args):
+    return think(_position(*args))
+
+
+def _search_moves(size, win_length, difficulty, x_mask, o_mask, player, time_budget):
+    from analysis import searched_moves
+    game = _position(size, win_length, difficulty, x_mask, o_mask, player)
+    return searched_moves(game.geometry, x_mask, o_mask, player, time_budget)
+
+
+def _ponder(size, win_length, difficulty, x_mask, o_mask, player):
+    # Searches each likely reply of `player` for the bot, sharing one move's
+    # time budget between them; only the transposition table keeps the results
+    from search import get_searcher
+    game = _position(size, win_length, difficulty, x_mask, o_mask, player)
+    searcher = get_searcher(game.geometry)
+    level = LEVELS[difficulty]
+    budget = level.time_budget / PONDER_REPLIES
+    bot = 'O' if player == 'X' else 'X'
+    for cell in searcher.likely_moves(x_mask, o_mask, player, PONDER_REPLIES):
+        reply = _position(size, win_length, difficulty, x_mask, o_mask, player)
+        if not reply.make_move(*reply.geometry.to_row_col(cell)) or reply.game_over:
+            continue
+        searcher.search(reply.x_mask, reply.o_mask, bot, time_budget=budget,
+                        max_depth=level.max_depth)
+
+
+class BotPool:
+    def __init__(self, workers=BOT_WORKERS):
+        self.workers = workers
+        self._executors = [None] * workers
+        self._pondering = [[] for _ in range(workers)]
+        self._lock = threading.Lock()
+
+    def _worker(self, key):
+        index = zlib.crc32(key.encode()) % self.workers
+        with self._lock:
+            executor = self._executors[index]
+            if executor is None:
+                # Spawned rather than forked: the server process has threads
+                executor = self._executors[index] = ProcessPoolExecutor(
+                    1, mp_context=multiprocessing.get_context('spawn'))
+        return index, executor
+
+    def _run(self, key, function, game, *extra):
+        # Submits to the game's worker, replacing it once if it has died
+        index, executor = self._worker(key)
+        try:
+            return index, executor.submit(function, *_args(game), *extra)
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executors[index] is executor:
+                    self._executors[index] = None
+            index, executor = self._worker(key)
+            return index, executor.submit(function, *_args(game), *extra)
+
+    def _inline(self, game):
+        return not self.workers or game.is_classic
+
+    def submit(self, key, game):
+        # Future for (move, seconds) of the bot to move in `game`. `key`
+        # (the game id) picks the worker. Cheap positions are answered in
+        # the calling thread and come back already done.
+        if self._inline(game):
+            future = Future()
+            future.set_result(think(game))
+            return future
+        index, future = self._run(key, _think, game)
+        # The real move goes ahead of any pondering that has not started
+        with self._lock:
+            for pending in self._pondering[index]:
+                pending.cancel()
+            self._pondering[index] = []
+        return future
+
+    def analyze(self, key, game, time_budget=None):
+        # analysis.analyze for `game`, with the search of a bigger board run
+        # in the game's worker while the calling thread only waits. Cached
+        # and 3x3 positions are answered here.
+        import analysis
+        if self._inline(game):
+            return analysis.analyze(game, time_budget)
+
+        def search(geometry, x_mask, o_mask, player, budget):
+            position = _position(game.size, game.win_length, game.difficulty,
+                                 x_mask, o_mask, player)
+            try:
+                return self._run(key, _search_moves, position, budget)[1].result()
+            except BrokenProcessPool:
+                return analysis.searched_moves(geometry, x_mask, o_mask, player, budget)
+
+        return analysis.analyze(game, time_budget, search)
+
+    def ponder(self, key, game):
+        # Thinks ahead on the opponent's likely replies, in the background
+        if self._inline(game) or game.game_over:
+            return
+        index, future = self._run(key, _ponder, game)
+        with self._lock:
+            self._pondering[index] = [f for f in self._pondering[index] if not f.done()]
+            self._pondering[index].append(future)
+
+    def close(self):
+        # Stops the workers; they are started again on the next submit
+        with self._lock:
+            executors, self._executors = self._executors, [None] * self.workers
+            self._pondering = [[] for _ in range(self.workers)]
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
@@ -0,0 +1,108 @@
+import struct
+
+from engine import DIFFICULTIES, TicTacToe
+
+# Compact binary encoding of a game, used by the session store.
+#
+#   byte 0      format version
+#   byte 1      board size
+#   byte 2      win length
+#   byte 3      flags: bit 0 = O to move, bit 1 = game over,
+#               bits 2-3 = winner (0 none, 1 X, 2 O, 3 tie),
+#               bits 4-5 = game mode (index into GAME_MODES),
+#               bits 6-7 = bot difficulty (index into DIFFICULTIES)
+#   then        X mask and O mask, ceil(size * size / 8) bytes each, little-endian
+#   then        move count and one cell index per move (version 2 onwards;
+#               boards have at most 225 cells, so both fit in a byte)
+#   then        game version, 4 bytes little-endian (version 4 onwards)
+#
+# A classic 3x3 game fits in 13 to 22 bytes. Older states still decode:
+# version 1 has no move list, versions 1-2 always have difficulty 0 and
+# versions 1-3 have game version 0.
+
+CODEC_VERSION = 4
+GAME_MODES = (None, 'bot', 'friend', 'online')
+WINNERS = (None, 'X', 'O', 'Tie')
+
+_HEADER = struct.Struct('<BBBB')
+_VERSION = struct.Struct('<I')
+
+
+class CodecError(ValueError):
+    pass
+
+
+def _mask_bytes(size):
+    return (size * size + 7) // 8
+
+
+def encode(game):
+    if game.game_mode not in GAME_MODES:
+        raise CodecError('Unknown game mode: %r' % (game.game_mode,))
+    if game.difficulty not in DIFFICULTIES:
+        raise CodecError('Unknown difficulty: %r' % (game.difficulty,))
+    flags = (
+        (game.current_player == 'O')
+        | (bool(game.game_over) << 1)
+        | (WINNERS.index(game.winner) << 2)
+        | (GAME_MODES.index(game.game_mode) << 4)
+        | (DIFFICULTIES.index(game.difficulty) << 6)
+    )
+    width = _mask_bytes(game.size)
+    return (_HEADER.pack(CODEC_VERSION, game.size, game.win_length, flags)
+            + game.x_mask.to_bytes(width, 'little')
+            + game.o_mask.to_bytes(width, 'little')
+            + bytes((len(game.moves),)) + game.moves
+            + _VERSION.pack(game.version & 0xFFFFFFFF))
+
+
+def stored_version(data):
+    # The game version of an encoded game, without decoding the rest
+    if data[0] < 4:
+        return 0
+    return _VERSION.unpack_from(data, len(data) - _VERSION.size)[0]
+
+
+def decode(data, game_class=TicTacToe):
+    if len(data) < _HEADER.size:
+        raise CodecError('Truncated game state')
+    version, size, win_length, flags = _HEADER.unpack_from(data)
+    if not 1 <= version <= CODEC_VERSION:
+        raise CodecError('Unsupported game state version: %d' % version)
+    width = _mask_bytes(size)
+    offset = _HEADER.size
+    moves_at = offset + 2 * width
+    if version == 1:
+        if len(data) != moves_at:
+            raise CodecError('Truncated game state')
+    else:
+        version_at = len(data) - (_VERSION.size if version >= 4 else 0)
+        if version_at <= moves_at or version_at != moves_at + 1 + data[moves_at]:
+            raise CodecError('Truncated game state')
+    mode = (flags >> 4) & 3
+
+    game = game_class(size, win_length)
+    game.x_mask = int.from_bytes(data[offset:offset + width], 'little')
+    game.o_mask = int.from_bytes(data[offset + width:offset + 2 * width], 'little')
+    game.current_player = 'O' if flags & 1 else 'X'
+    game.game_over = bool(flags & 2)
+    game.winner = WINNERS[(flags >> 2) & 3]
+    game.game_mode = GAME_MODES[mode]
+    game.difficulty = DIFFICULTIES[flags >> 6]
+    if version > 1:
+        game.moves = bytearray(data[moves_at + 1:version_at])
+    if version >= 4:
+        game.version, = _VERSION.unpack_from(data, version_at)
+    return game
+
+
+def compact_board(game):
+    # The board as one string of size * size cells, '.' for empty
+    cells = ['.'] * game.geometry.cell_count
+    for cell in range(game.geometry.cell_count):
+        bit = 1 << cell
+        if game.x_mask & bit:
+            cells[cell] = 'X'
+        elif game.o_mask & bit:
+            cells[cell] = 'O'
+    return ''.join(cells)
@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# app.py opens its journal and ratings database on import; point them at a
+# scratch directory so tests never touch the files next to the code
+_scratch = tempfile.mkdtemp(prefix='tictactoe-tests-')
+os.environ.setdefault('JOURNAL_DIR', os.path.join(_scratch, 'journal'))
+os.environ.setdefault('RATINGS_DB', os.path.join(_scratch, 'ratings.db'))
@@ -0,0 +1,363 @@
+import random
+from functools import lru_cache
+
+# Bitboard tic-tac-toe engine shared by the Flask server (app.py) and the
+# pygame client (game.py). Each player's marks are kept as an int bitmask
+# where cell (row, col) is bit row * size + col, so boards of any size (and
+# any win length) use the same representation.
+
+BOARD_SIZE = 3
+MIN_BOARD_SIZE = 3
+MAX_BOARD_SIZE = 15
+MIN_WIN_LENGTH = 3
+MAX_DEFAULT_WIN_LENGTH = 5
+
+# Bot difficulty levels (see strategies.LEVELS); the first is the default
+DIFFICULTIES = ('perfect', 'easy', 'medium', 'hard')
+
+
+def default_win_length(size):
+    return min(size, MAX_DEFAULT_WIN_LENGTH)
+
+
+def iter_cells(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+class Geometry:
+    # Precomputed masks for one (size, win_length) variant. Instances are
+    # shared between games through get_geometry().
+
+    def __init__(self, size, win_length):
+        self.size = size
+        self.win_length = win_length
+        self.cell_count = size * size
+        self.full_mask = (1 << self.cell_count) - 1
+        self.center = (size // 2) * size + size // 2
+        self.corners = (0, size - 1, (size - 1) * size, size * size - 1)
+
+        # Every run of win_length cells in a row, column or diagonal
+        win_masks = []
+        for row in range(size):
+            for col in range(size):
+                for d_row, d_col in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    end_row = row + d_row * (win_length - 1)
+                    end_col = col + d_col * (win_length - 1)
+                    if not (0 <= end_row < size and 0 <= end_col < size):
+                        continue
+                    mask = 0
+                    for step in range(win_length):
+                        mask |= 1 << ((row + d_row * step) * size + col + d_col * step)
+                    win_masks.append(mask)
+        self.win_masks = tuple(win_masks)
+
+        # Winning lines that pass through each cell, so a move only checks its own lines
+        self.lines_through = tuple(
+            tuple(mask for mask in self.win_masks if mask & (1 << cell))
+            for cell in range(self.cell_count)
+        )
+
+        # Cells within two steps of each cell, used to prune search on big boards
+        neighbours = []
+        for cell in range(self.cell_count):
+            row, col = divmod(cell, size)
+            mask = 0
+            for r in range(max(0, row - 2), min(size, row + 3)):
+                for c in range(max(0, col - 2), min(size, col + 3)):
+                    mask |= 1 << (r * size + c)
+            neighbours.append(mask & ~(1 << cell))
+        self.neighbours = tuple(neighbours)
+
+        self.symmetries = self._build_symmetries()
+        inverse_symmetries = []
+        for perm in self.symmetries:
+            inverse = [0] * self.cell_count
+            for cell, target in enumerate(perm):
+                inverse[target] = cell
+            inverse_symmetries.append(tuple(inverse))
+        self.inverse_symmetries = tuple(inverse_symmetries)
+
+    # The 8 symmetries of the square as cell permutations: symmetries[s][cell]
+    # is where `cell` lands under symmetry s. Index 0 is the identity.
+    def _rotate(self, cell):
+        row, col = divmod(cell, self.size)
+        return col * self.size + (self.size - 1 - row)
+
+    def _mirror(self, cell):
+        row, col = divmod(cell, self.size)
+        return row * self.size + (self.size - 1 - col)
+
+    def _build_symmetries(self):
+        symmetries = []
+        perm = list(range(self.cell_count))
+        for _ in range(4):
+            symmetries.append(tuple(perm))
+            symmetries.append(tuple(self._mirror(cell) for cell in perm))
+            perm = [self._rotate(cell) for cell in perm]
+        return tuple(symmetries)
+
+    def has_line(self, mask, cell=None):
+        lines = self.win_masks if cell is None else self.lines_through[cell]
+        for line in lines:
+            if mask & line == line:
+                return True
+        return False
+
+    def transform_mask(self, mask, symmetry):
+        perm = self.symmetries[symmetry]
+        result = 0
+        for cell in iter_cells(mask):
+            result |= 1 << perm[cell]
+        return result
+
+    def to_cell(self, row, col):
+        return row * self.size + col
+
+    def to_row_col(self, cell):
+        return divmod(cell, self.size)
+
+
+def get_geometry(size=BOARD_SIZE, win_length=None):
+    if win_length is None and isinstance(size, int):
+        win_length = default_win_length(size)
+    if not isinstance(size, int) or not isinstance(win_length, int):
+        raise TypeError('Board size and win length must be integers')
+    if not MIN_BOARD_SIZE <= size <= MAX_BOARD_SIZE:
+        raise ValueError('Board size must be between %d and %d' % (MIN_BOARD_SIZE, MAX_BOARD_SIZE))
+    if not MIN_WIN_LENGTH <= win_length <= size:
+        raise ValueError('Win length must be between %d and the board size' % MIN_WIN_LENGTH)
+    return _cached_geometry(size, win_length)
+
+
+@lru_cache(maxsize=None)
+def _cached_geometry(size, win_length):
+    return Geometry(size, win_length)
+
+
+# The classic 3x3 board, used by the opening book
+CLASSIC = get_geometry(BOARD_SIZE, BOARD_SIZE)
+CELL_COUNT = CLASSIC.cell_count
+FULL_MASK = CLASSIC.full_mask
+CENTER = CLASSIC.center
+CORNERS = CLASSIC.corners
+WIN_MASKS = CLASSIC.win_masks
+LINES_THROUGH = CLASSIC.lines_through
+SYMMETRIES = CLASSIC.symmetries
+INVERSE_SYMMETRIES = CLASSIC.inverse_symmetries
+
+
+def has_line(mask, cell=None):
+    return CLASSIC.has_line(mask, cell)
+
+
+def to_cell(row, col):
+    return CLASSIC.to_cell(row, col)
+
+
+def to_row_col(cell):
+    return CLASSIC.to_row_col(cell)
+
+
+def transform_mask(mask, symmetry):
+    return CLASSIC.transform_mask(mask, symmetry)
+
+
+# transform_mask for every 3x3 mask, so canonicalising is a handful of lookups
+_MASK_TRANSFORMS = tuple(
+    tuple(transform_mask(mask, symmetry) for mask in range(FULL_MASK + 1))
+    for symmetry in range(len(SYMMETRIES))
+)
+
+
+def canonical(x_mask, o_mask):
+    # Returns (x_mask, o_mask, symmetry) for the smallest equivalent 3x3 position
+    best = None
+    for symmetry, table in enumerate(_MASK_TRANSFORMS):
+        key = (table[x_mask] << CELL_COUNT) | table[o_mask]
+        if best is None or key < best[0]:
+            best = (key, symmetry)
+    key, symmetry = best
+    return key >> CELL_COUNT, key & FULL_MASK, symmetry
+
+
+class TicTacToe:
+    __slots__ = ('geometry', 'x_mask', 'o_mask', 'moves', 'current_player', 'game_mode',
+                 'difficulty', 'game_over', 'winner', 'version')
+
+    def __init__(self, size=BOARD_SIZE, win_length=None):
+        self.geometry = get_geometry(size, win_length)
+        self.x_mask = 0
+        self.o_mask = 0
+        self.moves = bytearray()  # cell of every move in play order; X moves first
+        self.current_player = 'X'
+        self.game_mode = None  # 'bot' or 'friend'
+        self.difficulty = DIFFICULTIES[0]  # how well the bot plays
+        self.game_over = False
+        self.winner = None
+        self.version = 0  # bumped by the store on every save
+
+    def reset(self):
+        self.x_mask = 0
+        self.o_mask = 0
+        self.moves = bytearray()
+        self.current_player = 'X'
+        self.game_over = False
+        self.winner = None
+
+    @property
+    def size(self):
+        return self.geometry.size
+
+    @property
+    def win_length(self):
+        return self.geometry.win_length
+
+    @property
+    def is_classic(self):
+        return self.geometry is CLASSIC
+
+    @property
+    def board(self):
+        size = self.geometry.size
+        board = [['' for _ in range(size)] for _ in range(size)]
+        for cell in iter_cells(self.x_mask):
+            row, col = divmod(cell, size)
+            board[row][col] = 'X'
+        for cell in iter_cells(self.o_mask):
+            row, col = divmod(cell, size)
+            board[row][col] = 'O'
+        return board
+
+    @property
+    def empty_mask(self):
+        return self.geometry.full_mask & ~(self.x_mask | self.o_mask)
+
+    @property
+    def history(self):
+        # Moves played so far as (row, col) pairs
+        return [self.geometry.to_row_col(cell) for cell in self.moves]
+
+    def player_mask(self, player):
+        return self.x_mask if player == 'X' else self.o_mask
+
+    def get_cell(self, row, col):
+        bit = 1 << self.geometry.to_cell(row, col)
+        if self.x_mask & bit:
+            return 'X'
+        if self.o_mask & bit:
+            return 'O'
+        return ''
+
+    def is_valid_move(self, row, col):
+        if self.game_over:
+            return False
+        if not isinstance(row, int) or not isinstance(col, int):
+            return False
+        size = self.geometry.size
+        if not (0 <= row < size and 0 <= col < size):
+            return False
+        return bool(self.empty_mask & (1 << self.geometry.to_cell(row, col)))
+
+    def make_move(self, row, col):
+        if not self.is_valid_move(row, col):
+            return False
+
+        cell = self.geometry.to_cell(row, col)
+        if self.current_player == 'X':
+            self.x_mask |= 1 << cell
+            mask = self.x_mask
+        else:
+            self.o_mask |= 1 << cell
+            mask = self.o_mask
+        self.moves.append(cell)
+
+        if self.geometry.has_line(mask, cell):
+            self.game_over = True
+            self.winner = self.current_player
+            self.on_win()
+        elif self.is_board_full():
+            self.game_over = True
+            self.winner = 'Tie'
+        else:
+            self.current_player = 'O' if self.current_player == 'X' else 'X'
+        return True
+
+    def undo_move(self):
+        # Takes back the last move and returns its (row, col), or None when
+        # there is nothing to undo. A finished game becomes playable again.
+        if not self.moves:
+            return None
+        cell = self.moves.pop()
+        player = 'X' if len(self.moves) % 2 == 0 else 'O'
+        if player == 'X':
+            self.x_mask &= ~(1 << cell)
+        else:
+            self.o_mask &= ~(1 << cell)
+        self.current_player = player
+        self.game_over = False
+        self.winner = None
+        return self.geometry.to_row_col(cell)
+
+    def on_win(self):
+        # Hook for clients that react to a win (e.g. the pygame celebration)
+        pass
+
+    def check_winner(self):
+        return self.geometry.has_line(self.x_mask) or self.geometry.has_line(self.o_mask)
+
+    def is_board_full(self):
+        return (self.x_mask | self.o_mask) == self.geometry.full_mask
+
+    def legal_moves(self):
+        return [self.geometry.to_row_col(cell) for cell in iter_cells(self.empty_mask)]
+
+    def get_bot_move(self, time_budget=None, rng=random):
+        # The bot's move at the game's difficulty; time_budget can only
+        # shorten the level's own limit
+        if self.game_over or not self.empty_mask:
+            return None
+        from strategies import level_move
+        return level_move(self, self.difficulty, rng, time_budget)
+
+    def analyze(self, time_budget=None):
+        # The value of every legal move for the player to move, best first
+        # (see analysis.py)
+        from analysis import analyze
+        return analyze(self, time_budget)
+
+    def get_heuristic_move(self, rng=random):
+        geometry = self.geometry
+        empty = self.empty_mask
+        if not empty:
+            return None
+        mine = self.player_mask(self.current_player)
+        theirs = self.x_mask if self.current_player == 'O' else self.o_mask
+
+        # Try to win
+        for cell in iter_cells(empty):
+            if geometry.has_line(mine | (1 << cell), cell):
+                return geometry.to_row_col(cell)
+
+        # Block player from winning
+        for cell in iter_cells(empty):
+            if geometry.has_line(theirs | (1 << cell), cell):
+                return geometry.to_row_col(cell)
+
+        # Take center if available
+        if empty & (1 << geometry.center):
+            return geometry.to_row_col(geometry.center)
+
+        # Take corner if available
+        corners = [cell for cell in geometry.corners if empty & (1 << cell)]
+        if corners:
+            return geometry.to_row_col(rng.choice(corners))
+
+        # Take any available space
+        return geometry.to_row_col((empty & -empty).bit_length() - 1)
@@ -1,16 +1,18 @@
-import pygame
 import sys
-import random
-import math
+import time
+from bots import BotPool, think
+from engine import TicTacToe as BaseTicTacToe, BOARD_SIZE, DIFFICULTIES
 
-# Initialize Pygame
-pygame.init()
+# Pygame is imported and started by GameUI, and NumPy (for the particles)
+# only when the first celebration starts, so the game logic below can be
+# used (by tools, tests or servers) without either
+pygame = None
 
 # Constants
 WIDTH, HEIGHT = 600, 700
-BOARD_SIZE = 3
 CELL_SIZE = WIDTH // BOARD_SIZE
 LINE_WIDTH = 10
+BOT_DELAY = 0.5  # minimum seconds before the bot's reply appears, for better UX
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 RED = (255, 50, 50)
@@ -20,227 +22,190 @@ YELLOW = (255, 255, 100)
 PURPLE = (200, 100, 255)
 GRAY = (128, 128, 128)
 LIGHT_GRAY = (200, 200, 200)
+CELEBRATION = (('burst', 400), ('fountain', 600), ('confetti', 800))  # effect, particles
+PARTICLE_COLORS = [RED, BLUE, GREEN, YELLOW, PURPLE]
 
-# Fonts
-FONT_LARGE = pygame.font.Font(None, 72)
-FONT_MEDIUM = pygame.font.Font(None, 48)
-FONT_SMALL = pygame.font.Font(None, 36)
+# Fonts, loaded by init_pygame()
+FONT_LARGE = FONT_MEDIUM = FONT_SMALL = None
 
-class TicTacToe:
-    def __init__(self):
-        self.board = [['' for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
-        self.current_player = 'X'
-        self.game_mode = None  # 'bot' or 'friend'
-        self.game_over = False
-        self.winner = None
-        self.celebration_particles = []
-        self.celebration_timer = 0
+
+def init_pygame():
+    # Imports pygame and starts only the display and font subsystems the
+    # client uses; pygame.init() would also start audio, joysticks, etc.
+    global pygame, FONT_LARGE, FONT_MEDIUM, FONT_SMALL
+    if pygame is not None:
+        return
+    import pygame as module
+    module.display.init()
+    module.font.init()
+    FONT_LARGE = module.font.Font(None, 72)
+    FONT_MEDIUM = module.font.Font(None, 48)
+    FONT_SMALL = module.font.Font(None, 36)
+    pygame = module
+
+
+class TicTacToe(BaseTicTacToe):
+    # Tells the window (ui), if any, when a win should be celebrated and
+    # when a reset should end the celebration
+    def __init__(self, size=BOARD_SIZE, win_length=None, ui=None):
+        super().__init__(size, win_length)
+        self.ui = ui
         
     def reset(self):
-        self.board = [['' for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
-        self.current_player = 'X'
-        self.game_over = False
-        self.winner = None
-        self.celebration_particles = []
-        self.celebration_timer = 0
-        
-    def make_move(self, row, col):
-        if self.board[row][col] == '' and not self.game_over:
-            self.board[row][col] = self.current_player
-            if self.check_winner():
-                self.game_over = True
-                self.winner = self.current_player
-                self.start_celebration()
-            elif self.is_board_full():
-                self.game_over = True
-                self.winner = 'Tie'
-            else:
-                self.current_player = 'O' if self.current_player == 'X' else 'X'
-            return True
-        return False
+        super().reset()
+        if self.ui:
+            self.ui.stop_celebration()
         
-    def check_winner(self):
-        # Check rows
-        for row in self.board:
-            if row[0] == row[1] == row[2] != '':
-                return True
-                
-        # Check columns
-        for col in range(BOARD_SIZE):
-            if self.board[0][col] == self.board[1][col] == self.board[2][col] != '':
-                return True
-                
-        # Check diagonals
-        if self.board[0][0] == self.board[1][1] == self.board[2][2] != '':
-            return True
-        if self.board[0][2] == self.board[1][1] == self.board[2][0] != '':
-            return True
-            
-        return False
-        
-    def is_board_full(self):
-        for row in self.board:
-            if '' in row:
-                return False
-        return True
-        
-    def get_bot_move(self):
-        # Try to win
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                if self.board[row][col] == '':
-                    self.board[row][col] = 'O'
-                    if self.check_winner():
-                        self.board[row][col] = ''
-                        return (row, col)
-                    self.board[row][col] = ''
-                    
-        # Block player from winning
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                if self.board[row][col] == '':
-                    self.board[row][col] = 'X'
-                    if self.check_winner():
-                        self.board[row][col] = ''
-                        return (row, col)
-                    self.board[row][col] = ''
-                    
-        # Take center if available
-        if self.board[1][1] == '':
-            return (1, 1)
-            
-        # Take corner if available
-        corners = [(0, 0), (0, 2), (2, 0), (2, 2)]
-        random.shuffle(corners)
-        for row, col in corners:
-            if self.board[row][col] == '':
-                return (row, col)
-                
-        # Take any available space
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                if self.board[row][col] == '':
-                    return (row, col)
-                    
-        return None
-        
-    def start_celebration(self):
-        self.celebration_particles = []
-        for _ in range(50):
-            particle = {
-                'x': WIDTH // 2,
-                'y': HEIGHT // 2,
-                'vx': random.uniform(-5, 5),
-                'vy': random.uniform(-5, 5),
-                'color': random.choice([RED, BLUE, GREEN, YELLOW, PURPLE]),
-                'size': random.randint(3, 8)
-            }
-            self.celebration_particles.append(particle)
-        self.celebration_timer = 180  # 3 seconds at 60 FPS
+    def on_win(self):
+        if self.ui:
+            self.ui.start_celebration()
 
 class GameUI:
-    def __init__(self):
+    def __init__(self, size=BOARD_SIZE, win_length=None):
+        init_pygame()
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
         pygame.display.set_caption("Tic-Tac-Toe Game")
         self.clock = pygame.time.Clock()
-        self.game = TicTacToe()
+        self.game = TicTacToe(size, win_length, ui=self)
+        self.board_size = self.game.size
+        self.cell_size = WIDTH // self.board_size
+        self.line_width = max(2, LINE_WIDTH * BOARD_SIZE // self.board_size)
         self.state = 'menu'  # 'menu', 'mode_selection', 'playing', 'game_over'
         self.running = True
+        # The bot thinks in a worker process so the window keeps drawing
+        self.bots = BotPool(1)
+        self.bot_future = None
+        self.bot_position = None
+        self.bot_due = 0
+        # Pre-rendered pieces of the screen, composed into self.scene
+        self.text_cache = {}
+        self.grid = self.render_grid()
+        self.marks = {'X': self.render_mark('X'), 'O': self.render_mark('O')}
+        self.scene = pygame.Surface((WIDTH, HEIGHT)).convert()
+        self.shown = None  # view() last drawn into self.scene
+        self.shown_moves = b''
+        self.shown_status = None
+        self.particles = None  # created by the first celebration
+        self.particle_rects = []
         
-    def draw_menu(self):
-        self.screen.fill(BLACK)
-        title = FONT_LARGE.render("TIC-TAC-TOE", True, WHITE)
-        title_rect = title.get_rect(center=(WIDTH//2, HEIGHT//2 - 100))
-        self.screen.blit(title, title_rect)
+    def start_celebration(self):
+        # Particles live up to 3 seconds at 60 FPS. The pool holds exactly
+        # one celebration.
+        import particles
+        if self.particles is None:
+            self.particles = particles.Particles(
+                WIDTH, HEIGHT, PARTICLE_COLORS, capacity=sum(count for _, count in CELEBRATION))
+        self.particles.clear()
+        for effect, count in CELEBRATION:
+            particles.EFFECTS[effect](self.particles, count)
+            
+    def stop_celebration(self):
+        if self.particles is not None:
+            self.particles.clear()
+        
+    def cycle_difficulty(self):
+        index = DIFFICULTIES.index(self.game.difficulty)
+        self.game.difficulty = DIFFICULTIES[(index + 1) % len(DIFFICULTIES)]
+        
+    def text(self, font, text, color):
+        # Rendered text is cached: the same few strings are drawn again and again
+        key = (font, text, color)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            surface = self.text_cache[key] = font.render(text, True, color)
+        return surface
+        
+    def blit_text(self, font, text, color, center):
+        surface = self.text(font, text, color)
+        rect = surface.get_rect(center=center)
+        self.scene.blit(surface, rect)
+        return rect
+        
+    def render_grid(self):
+        grid = pygame.Surface((WIDTH, WIDTH)).convert()
+        grid.fill(BLACK)
+        cell_size = self.cell_size
+        for i in range(1, self.board_size):
+            # Vertical lines
+            pygame.draw.line(grid, WHITE, (i * cell_size, 0), (i * cell_size, WIDTH), self.line_width)
+            # Horizontal lines
+            pygame.draw.line(grid, WHITE, (0, i * cell_size), (WIDTH, i * cell_size), self.line_width)
+        return grid
+        
+    def render_mark(self, player):
+        # One cell-sized, transparent surface per mark, blitted onto the grid
+        cell_size = self.cell_size
+        mark = pygame.Surface((cell_size, cell_size), pygame.SRCALPHA).convert_alpha()
+        center = cell_size // 2
+        if player == 'X':
+            offset = cell_size // 3
+            pygame.draw.line(mark, RED, (center - offset, center - offset),
+                             (center + offset, center + offset), self.line_width)
+            pygame.draw.line(mark, RED, (center - offset, center + offset),
+                             (center + offset, center - offset), self.line_width)
+        else:
+            pygame.draw.circle(mark, BLUE, (center, center), cell_size // 3, self.line_width)
+        return mark
         
-        subtitle = FONT_MEDIUM.render("Press ENTER to Start", True, YELLOW)
-        subtitle_rect = subtitle.get_rect(center=(WIDTH//2, HEIGHT//2 + 50))
-        self.screen.blit(subtitle, subtitle_rect)
+    def draw_menu(self):
+        self.scene.fill(BLACK)
+        self.blit_text(FONT_LARGE, "TIC-TAC-TOE", WHITE, (WIDTH//2, HEIGHT//2 - 100))
+        self.blit_text(FONT_MEDIUM, "Press ENTER to Start", YELLOW, (WIDTH//2, HEIGHT//2 + 50))
         
         # Decorative X and O
         for i in range(3):
-            x_text = FONT_MEDIUM.render("X", True, RED)
-            self.screen.blit(x_text, (50 + i*200, 50))
-            o_text = FONT_MEDIUM.render("O", True, BLUE)
-            self.screen.blit(o_text, (150 + i*200, 550))
+            self.scene.blit(self.text(FONT_MEDIUM, "X", RED), (50 + i*200, 50))
+            self.scene.blit(self.text(FONT_MEDIUM, "O", BLUE), (150 + i*200, 550))
             
     def draw_mode_selection(self):
-        self.screen.fill(BLACK)
-        title = FONT_MEDIUM.render("Select Game Mode", True, WHITE)
-        title_rect = title.get_rect(center=(WIDTH//2, 150))
-        self.screen.blit(title, title_rect)
+        self.scene.fill(BLACK)
+        self.blit_text(FONT_MEDIUM, "Select Game Mode", WHITE, (WIDTH//2, 150))
         
         # Friend mode button
         friend_color = GREEN if self.game.game_mode == 'friend' else LIGHT_GRAY
-        pygame.draw.rect(self.screen, friend_color, (150, 300, 300, 80), 0, 10)
-        pygame.draw.rect(self.screen, WHITE, (150, 300, 300, 80), 3, 10)
-        friend_text = FONT_MEDIUM.render("1. Play with Friend", True, BLACK)
-        friend_rect = friend_text.get_rect(center=(WIDTH//2, 340))
-        self.screen.blit(friend_text, friend_rect)
+        pygame.draw.rect(self.scene, friend_color, (150, 300, 300, 80), 0, 10)
+        pygame.draw.rect(self.scene, WHITE, (150, 300, 300, 80), 3, 10)
+        self.blit_text(FONT_MEDIUM, "1. Play with Friend", BLACK, (WIDTH//2, 340))
         
         # Bot mode button
         bot_color = GREEN if self.game.game_mode == 'bot' else LIGHT_GRAY
-        pygame.draw.rect(self.screen, bot_color, (150, 420, 300, 80), 0, 10)
-        pygame.draw.rect(self.screen, WHITE, (150, 420, 300, 80), 3, 10)
-        bot_text = FONT_MEDIUM.render("2. Play with Bot", True, BLACK)
-        bot_rect = bot_text.get_rect(center=(WIDTH//2, 460))
-        self.screen.blit(bot_text, bot_rect)
+        pygame.draw.rect(self.scene, bot_color, (150, 420, 300, 80), 0, 10)
+        pygame.draw.rect(self.scene, WHITE, (150, 420, 300, 80), 3, 10)
+        self.blit_text(FONT_MEDIUM, "2. Play with Bot", BLACK, (WIDTH//2, 460))
         
-        instruction = FONT_SMALL.render("Press 1 or 2 to select", True, YELLOW)
-        inst_rect = instruction.get_rect(center=(WIDTH//2, 550))
-        self.screen.blit(instruction, inst_rect)
+        # Bot difficulty, cycled with D or a click
+        self.blit_text(FONT_SMALL, f"Bot level: {self.game.difficulty.title()} (D to change)",
+                       WHITE, (WIDTH//2, 540))
+        self.blit_text(FONT_SMALL, "Press 1 or 2 to select", YELLOW, (WIDTH//2, 600))
         
     def draw_board(self):
-        self.screen.fill(BLACK)
+        self.scene.blit(self.grid, (0, 0))
+        self.draw_marks(self.game.moves)
+        self.draw_status()
         
-        # Draw grid lines
-        for i in range(1, BOARD_SIZE):
-            # Vertical lines
-            pygame.draw.line(self.screen, WHITE, 
-                           (i * CELL_SIZE, 0), 
-                           (i * CELL_SIZE, WIDTH), 
-                           LINE_WIDTH)
-            # Horizontal lines
-            pygame.draw.line(self.screen, WHITE, 
-                           (0, i * CELL_SIZE), 
-                           (WIDTH, i * CELL_SIZE), 
-                           LINE_WIDTH)
-                           
-        # Draw X's and O's
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                x = col * CELL_SIZE + CELL_SIZE // 2
-                y = row * CELL_SIZE + CELL_SIZE // 2
-                
-                if self.game.board[row][col] == 'X':
-                    # Draw X
-                    offset = CELL_SIZE // 3
-                    pygame.draw.line(self.screen, RED, 
-                                   (x - offset, y - offset), 
-                                   (x + offset, y + offset), 
-                                   LINE_WIDTH)
-                    pygame.draw.line(self.screen, RED, 
-                                   (x - offset, y + offset), 
-                                   (x + offset, y - offset), 
-                                   LINE_WIDTH)
-                elif self.game.board[row][col] == 'O':
-                    # Draw O
-                    radius = CELL_SIZE // 3
-                    pygame.draw.circle(self.screen, BLUE, (x, y), radius, LINE_WIDTH)
-                    
-        # Draw current player indicator
+    def draw_marks(self, cells):
+        # Draws the marks of the given moves; returns the cells to update
+        rects = []
+        cell_size = self.cell_size
+        for cell in cells:
+            row, col = divmod(cell, self.board_size)
+            rect = pygame.Rect(col * cell_size, row * cell_size, cell_size, cell_size)
+            self.scene.blit(self.marks[self.game.get_cell(row, col)], rect)
+            rects.append(rect)
+        return rects
+        
+    def draw_status(self):
+        # Draws the text below the board; returns its area
+        area = pygame.Rect(0, WIDTH, WIDTH, HEIGHT - WIDTH)
+        self.scene.fill(BLACK, area)
         status_y = WIDTH + 20
         if not self.game.game_over:
             player_text = f"Current Player: {self.game.current_player}"
             player_color = RED if self.game.current_player == 'X' else BLUE
-            status = FONT_MEDIUM.render(player_text, True, player_color)
-            status_rect = status.get_rect(center=(WIDTH//2, status_y))
-            self.screen.blit(status, status_rect)
+            self.blit_text(FONT_MEDIUM, player_text, player_color, (WIDTH//2, status_y))
             
-            mode_text = f"Mode: {'Bot' if self.game.game_mode == 'bot' else 'Friend'}"
-            mode_status = FONT_SMALL.render(mode_text, True, GRAY)
-            mode_rect = mode_status.get_rect(center=(WIDTH//2, status_y + 40))
-            self.screen.blit(mode_status, mode_rect)
+            mode_text = f"Mode: Bot ({self.game.difficulty.title()})" if self.game.game_mode == 'bot' else "Mode: Friend"
+            self.blit_text(FONT_SMALL, mode_text, GRAY, (WIDTH//2, status_y + 40))
         else:
             # Game over message
             if self.game.winner == 'Tie':
@@ -250,34 +215,72 @@ class GameUI:
                 result_text = f"PLAYER {self.game.winner} WINS!"
                 result_color = GREEN if self.game.winner == 'X' else PURPLE
                 
-            result = FONT_LARGE.render(result_text, True, result_color)
-            result_rect = result.get_rect(center=(WIDTH//2, status_y))
-            self.screen.blit(result, result_rect)
+            self.blit_text(FONT_LARGE, result_text, result_color, (WIDTH//2, status_y))
+            self.blit_text(FONT_SMALL, "Press R to Restart or ESC for Menu", WHITE, (WIDTH//2, status_y + 50))
+        return area
+        
+    def draw_particles(self):
+        # Particles move every frame: the scene is restored under last
+        # frame's particles before they are drawn at their new positions
+        dirty = self.particle_rects
+        for rect in dirty:
+            self.screen.blit(self.scene, rect, rect)
+        if self.particles is None:
+            return dirty
+        self.particles.update()
+        area = self.particles.draw(self.screen)
+        self.particle_rects = [area] if area else []
+        return dirty + self.particle_rects
+        
+    def view(self):
+        # What the current screen depends on, apart from the moves and status
+        if self.state == 'menu':
+            return (self.state,)
+        return (self.state, self.game.game_mode, self.game.difficulty)
+        
+    def status(self):
+        return (self.game.current_player, self.game.game_over, self.game.winner)
+        
+    def render(self):
+        # Retained-mode drawing: self.scene holds the current screen without
+        # particles, only what changed is redrawn, and only those parts of
+        # the window are updated. An unchanged frame costs next to nothing.
+        view = self.view()
+        moves = bytes(self.game.moves)
+        if view != self.shown or not moves.startswith(self.shown_moves):
+            # A new screen, a reset or an undo: draw everything once
+            if self.state == 'menu':
+                self.draw_menu()
+            elif self.state == 'mode_selection':
+                self.draw_mode_selection()
+            else:
+                self.draw_board()
+            self.shown, self.shown_moves, self.shown_status = view, moves, self.status()
+            self.particle_rects = []
+            self.screen.blit(self.scene, (0, 0))
+            pygame.display.flip()
+            return
+        if self.state != 'playing':
+            return
             
-            restart_text = FONT_SMALL.render("Press R to Restart or ESC for Menu", True, WHITE)
-            restart_rect = restart_text.get_rect(center=(WIDTH//2, status_y + 50))
-            self.screen.blit(restart_text, restart_rect)
+        dirty = []
+        if moves != self.shown_moves:
+            dirty += self.draw_marks(moves[len(self.shown_moves):])
+            self.shown_moves = moves
+        if self.status() != self.shown_status:
+            dirty.append(self.draw_status())
+            self.shown_status = self.status()
+        for rect in dirty:
+            self.screen.blit(self.scene, rect, rect)
+        dirty += self.draw_particles()
+        if dirty:
+            pygame.display.update(dirty)
             
-        # Draw celebration particles
-        if self.game.celebration_timer > 0:
-            self.game.celebration_timer -= 1
-            for particle in self.game.celebration_particles[:]:
-                particle['x'] += particle['vx']
-                particle['y'] += particle['vy']
-                particle['vy'] += 0.2  # Gravity
-                
-                if 0 <= particle['x'] < WIDTH and 0 <= particle['y'] < HEIGHT:
-                    pygame.draw.circle(self.screen, particle['color'], 
-                                     (int(particle['x']), int(particle['y'])), 
-                                     particle['size'])
-                else:
-                    self.game.celebration_particles.remove(particle)
-                    
     def get_cell_from_pos(self, pos):
         x, y = pos
         if 0 <= x < WIDTH and 0 <= y < WIDTH:
-            col = x // CELL_SIZE
-            row = y // CELL_SIZE
+            col = x // self.cell_size
+            row = y // self.cell_size
             return (row, col)
         return None
         
@@ -286,13 +289,36 @@ class GameUI:
             cell = self.get_cell_from_pos(pos)
             if cell:
                 row, col = cell
+                if self.bot_to_move():
+                    return  # wait for the bot's reply
                 if self.game.make_move(row, col):
                     # If playing with bot and game not over, bot plays automatically
-                    if self.game.game_mode == 'bot' and not self.game.game_over:
-                        pygame.time.wait(500)  # Small delay for better UX
-                        bot_move = self.game.get_bot_move()
-                        if bot_move:
-                            self.game.make_move(bot_move[0], bot_move[1])
+                    if self.bot_to_move():
+                        self.bot_future = self.bots.submit('local', self.game)
+                        self.bot_position = bytes(self.game.moves)
+                        self.bot_due = time.monotonic() + BOT_DELAY
+                            
+    def bot_to_move(self):
+        return (self.game.game_mode == 'bot' and not self.game.game_over
+                and self.game.current_player == 'O')
+                
+    def update_bot(self):
+        # Plays the bot's reply once it is ready, checked every frame
+        future = self.bot_future
+        if future is None or not future.done() or time.monotonic() < self.bot_due:
+            return
+        self.bot_future = None
+        # Drop replies to a position that was reset or left meanwhile
+        if bytes(self.game.moves) != self.bot_position or not self.bot_to_move():
+            return
+        try:
+            bot_move, _ = future.result()
+        except Exception:
+            # The worker failed or crashed: think in this thread instead
+            bot_move, _ = think(self.game)
+        if bot_move:
+            self.game.make_move(bot_move[0], bot_move[1])
+            self.bots.ponder('local', self.game)
                             
     def run(self):
         while self.running:
@@ -300,6 +326,9 @@ class GameUI:
                 if event.type == pygame.QUIT:
                     self.running = False
                     
+                if event.type == pygame.VIDEOEXPOSE:
+                    self.shown = None  # the window needs drawing again
+                    
                 if event.type == pygame.KEYDOWN:
                     if self.state == 'menu':
                         if event.key == pygame.K_RETURN:
@@ -314,6 +343,8 @@ class GameUI:
                             self.game.game_mode = 'bot'
                             self.game.reset()
                             self.state = 'playing'
+                        elif event.key == pygame.K_d:
+                            self.cycle_difficulty()
                             
                     elif self.state == 'playing':
                         if event.key == pygame.K_r and self.game.game_over:
@@ -337,22 +368,23 @@ class GameUI:
                                     self.game.game_mode = 'bot'
                                     self.game.reset()
                                     self.state = 'playing'
+                                elif 520 <= y <= 560:
+                                    self.cycle_difficulty()
                                     
-            # Draw current state
-            if self.state == 'menu':
-                self.draw_menu()
-            elif self.state == 'mode_selection':
-                self.draw_mode_selection()
-            elif self.state == 'playing':
-                self.draw_board()
-                
-            pygame.display.flip()
+            if self.state == 'playing':
+                self.update_bot()
+            self.render()
             self.clock.tick(60)
             
         pygame.quit()
         sys.exit()
 
 if __name__ == "__main__":
-    game = GameUI()
+    import argparse
+    parser = argparse.ArgumentParser(description="Tic-Tac-Toe Game")
+    parser.add_argument('--size', type=int, default=BOARD_SIZE, help="board size (3-15)")
+    parser.add_argument('--win-length', type=int, default=None, help="marks in a row needed to win")
+    args = parser.parse_args()
+    game = GameUI(args.size, args.win_length)
     game.run()
 
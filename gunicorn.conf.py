@@ -0,0 +1,27 @@
+import os
+import shutil
+import tempfile
+
+# Gunicorn settings, read automatically when gunicorn starts in this
+# directory. Workers share their metrics through files in
+# PROMETHEUS_MULTIPROC_DIR (see metrics.py); the directory must be set
+# before any worker imports the app.
+
+# Threads per worker, so long-polls on /api/games/<id>/state can wait
+# without holding up other requests
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='ttt-metrics-')
+
+
+def on_starting(server):
+    # Counters from a previous run must not carry over
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,378 @@
+import atexit
+import heapq
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from codec import GAME_MODES, WINNERS
+from engine import DIFFICULTIES, TicTacToe
+
+# Append-only journal of every game event on the server, so games survive a
+# restart and finished games can be analysed later.
+#
+# A journal is a directory of segment files. Each starts with an 8 byte
+# header (magic, version) followed by fixed-size 28 byte records:
+#
+#   16 bytes  game id (UUID)
+#   1 byte    kind
+#   3 bytes   arguments, by kind:
+#               NEW    size, win length, game mode (index into GAME_MODES)
+#                      plus 16 * difficulty (index into DIFFICULTIES)
+#               MOVE   cell, ply
+#               UNDO   cell, ply
+#               RESET  -
+#               MODE   game mode, difficulty
+#               END    winner (index into WINNERS), number of moves
+#   8 bytes   timestamp, seconds since the epoch
+#
+# Every process writes its own segments, named <writer>-<sequence>.log and
+# rolled over at SEGMENT_BYTES. Appends only fill a buffer; a background
+# thread writes and fsyncs it every FLUSH_INTERVAL, so requests never wait
+# on the disk and a crash loses at most that much. Segments are read through
+# memory maps, and the records of all writers are merged by timestamp.
+#
+# Segments are deleted once nothing has been written to them for RETENTION
+# seconds. Each journal also indexes which segments hold every game's
+# records: the segments present when the server starts and the ones it
+# writes itself. Looking a game up reads only its segments, and ids that
+# are not in the index are never searched for.
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'journal')
+MAGIC = b'TTTJ'
+JOURNAL_VERSION = 1
+SEGMENT_BYTES = 64 * 1024 * 1024
+FLUSH_INTERVAL = 0.1  # seconds between group commits
+MAX_BUFFERED = 4096  # records; a fuller buffer is flushed straight away
+RETENTION = 7 * 24 * 60 * 60  # seconds a segment is kept after its last write
+
+NEW, MOVE, UNDO, RESET, MODE, END = range(1, 7)
+
+_HEADER = struct.Struct('<4sB3x')
+_RECORD = struct.Struct('<16sBBBBd')
+
+Record = namedtuple('Record', 'game_id kind a b c timestamp')
+
+
+class JournalError(ValueError):
+    pass
+
+
+def game_key(game_id):
+    # The 16 byte form of a game id used in records
+    return uuid.UUID(game_id).bytes
+
+
+def format_game_id(key):
+    return str(uuid.UUID(bytes=key))
+
+
+class Journal:
+    # Writer side. A journal without a directory accepts and drops every
+    # record, so callers never need to check whether journaling is enabled.
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, flush_interval=FLUSH_INTERVAL,
+                 clock=time.time, retention=RETENTION):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.retention = retention
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._buffer = []
+        self._pid = None
+        self._file = None
+        # game key -> tuple of the segments holding its records; most games
+        # are in one segment, and a tuple is a fraction of a set's size
+        self._index = {}
+        self._segment_keys = {}  # segment path -> game keys indexed from it
+        self._index_lock = threading.Lock()
+
+    def _start(self):
+        # Runs on first use in each process, so a forked worker writes its
+        # own segments rather than sharing the parent's file
+        self._pid = os.getpid()
+        self._buffer = []
+        self._file = None
+        self._writer = '%d-%d' % (int(self.clock() * 1000), self._pid)
+        self._sequence = 0
+        thread = threading.Thread(target=self._run, name='journal-writer', daemon=True)
+        thread.start()
+        atexit.register(self.close)
+
+    def append(self, game_id, kind, a=0, b=0, c=0):
+        if self.directory is None:
+            return
+        key = game_key(game_id)
+        with self._cond:
+            if self._pid != os.getpid():
+                self._start()
+            self._buffer.append(_RECORD.pack(key, kind, a, b, c, self.clock()))
+            if len(self._buffer) >= MAX_BUFFERED:
+                self._cond.notify()
+
+    def record_new(self, game_id, game):
+        self.append(game_id, NEW, game.size, game.win_length,
+                    GAME_MODES.index(game.game_mode) | DIFFICULTIES.index(game.difficulty) << 4)
+
+    def record_moves(self, game_id, game, start=0):
+        # Records game.moves[start:], and the result if one of them ended it
+        for ply in range(start, len(game.moves)):
+            self.append(game_id, MOVE, game.moves[ply], ply)
+        if game.game_over and start < len(game.moves):
+            self.append(game_id, END, WINNERS.index(game.winner), len(game.moves))
+
+    def record_undo(self, game_id, moves, start):
+        # Records taking back moves[start:], last move first
+        for ply in range(len(moves) - 1, start - 1, -1):
+            self.append(game_id, UNDO, moves[ply], ply)
+
+    def record_reset(self, game_id):
+        self.append(game_id, RESET)
+
+    def record_mode(self, game_id, game):
+        self.append(game_id, MODE, GAME_MODES.index(game.game_mode),
+                    DIFFICULTIES.index(game.difficulty))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait(self.flush_interval)
+            self.flush()
+
+    def _segment(self, incoming):
+        if self._file is not None and self._file.tell() + incoming > self.segment_bytes:
+            self._file.close()
+            self._file = None
+        if self._file is None:
+            self.prune()
+            os.makedirs(self.directory, exist_ok=True)
+            self._sequence += 1
+            name = '%s-%06d.log' % (self._writer, self._sequence)
+            self._file = open(os.path.join(self.directory, name), 'xb')
+            self._file.write(_HEADER.pack(MAGIC, JOURNAL_VERSION))
+        return self._file
+
+    def flush(self):
+        # Writes and fsyncs everything appended so far in this process
+        if self._pid != os.getpid():
+            return
+        with self._write_lock:
+            with self._cond:
+                records, self._buffer = self._buffer, []
+            if not records:
+                return
+            data = b''.join(records)
+            f = self._segment(len(data))
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            self._add_to_index(f.name, {record[:16] for record in records})
+
+    def close(self):
+        self.flush()
+        with self._write_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _add_to_index(self, path, keys):
+        with self._index_lock:
+            self._segment_keys.setdefault(path, set()).update(keys)
+            for key in keys:
+                paths = self._index.get(key, ())
+                if path not in paths:
+                    self._index[key] = paths + (path,)
+
+    def _forget(self, path):
+        with self._index_lock:
+            for key in self._segment_keys.pop(path, ()):
+                paths = tuple(other for other in self._index[key] if other != path)
+                if paths:
+                    self._index[key] = paths
+                else:
+                    del self._index[key]
+
+    def prune(self):
+        # Deletes the segments last written more than `retention` seconds
+        # ago, by any writer, and drops them from the index
+        cutoff = self.clock() - self.retention
+        current = self._file.name if self._file is not None else None
+        for paths in segment_paths(self.directory).values():
+            for path in paths:
+                if path == current:
+                    continue
+                try:
+                    if os.path.getmtime(path) >= cutoff:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # pruned by another process
+                self._forget(path)
+
+    def load_index(self, since):
+        # Prunes old segments and indexes the rest; returns the keys of the
+        # games with activity at or after `since` (epoch seconds). Only the
+        # segments written since then are decoded to find those.
+        self.prune()
+        active = set()
+        for paths in segment_paths(self.directory).values():
+            for path in paths:
+                self._add_to_index(path, segment_keys(path))
+                if os.path.getmtime(path) >= since:
+                    active.update(record.game_id for record in read_segment(path)
+                                  if record.timestamp >= since)
+        return active
+
+    def rebuild(self, keys):
+        # Replays the indexed games with the given keys; returns
+        # {game id: TicTacToe}. Only the segments holding them are read.
+        with self._index_lock:
+            paths = set().union(*(self._index.get(key, ()) for key in keys))
+        games = replay(merge_records(paths), keys=keys)
+        return {format_game_id(key): game for key, game in games.items()}
+
+    def load_game(self, game_id):
+        # The latest state of an indexed game, or None; raises ValueError
+        # for a malformed id
+        key = game_key(game_id)
+        with self._index_lock:
+            paths = set(self._index.get(key, ()))
+        if not paths:
+            return None
+        return replay(find_records(paths, key)).get(key)
+
+
+def create_journal():
+    # JOURNAL_DIR chooses the directory; set it empty to turn journaling off.
+    # JOURNAL_RETENTION_SECONDS sets how long segments are kept.
+    directory = os.environ.get('JOURNAL_DIR', DEFAULT_DIRECTORY)
+    retention = float(os.environ.get('JOURNAL_RETENTION_SECONDS', RETENTION))
+    return Journal(directory or None, retention=retention)
+
+
+def segment_paths(directory):
+    # Segment files grouped by writer, each group in write order
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.log'))
+    except FileNotFoundError:
+        return {}
+    writers = {}
+    for name in names:
+        writers.setdefault(name.rsplit('-', 1)[0], []).append(os.path.join(directory, name))
+    return writers
+
+
+def _open_segment(f, path):
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mm) < _HEADER.size or _HEADER.unpack_from(mm) != (MAGIC, JOURNAL_VERSION):
+        mm.close()
+        raise JournalError('Not a journal segment: %s' % path)
+    # A record torn by a crash mid-write is ignored
+    end = len(mm) - (len(mm) - _HEADER.size) % _RECORD.size
+    return mm, end
+
+
+def read_segment(path):
+    # Yields the records of one segment
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        mm, end = _open_segment(f, path)
+        with mm:
+            unpack = _RECORD.unpack_from
+            for offset in range(_HEADER.size, end, _RECORD.size):
+                yield Record(*unpack(mm, offset))
+
+
+def segment_keys(path):
+    # The game keys with records in one segment, without decoding them
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return set()
+        mm, end = _open_segment(f, path)
+        with mm:
+            return {mm[offset:offset + 16] for offset in range(_HEADER.size, end, _RECORD.size)}
+
+
+def _read_writer(paths):
+    for path in paths:
+        try:
+            yield from read_segment(path)
+        except FileNotFoundError:
+            continue  # pruned since it was listed
+
+
+def merge_records(paths):
+    # The records of the given segments, in timestamp order across writers
+    writers = {}
+    for path in sorted(paths):
+        writers.setdefault(path.rsplit('-', 1)[0], []).append(path)
+    streams = [_read_writer(group) for group in writers.values()]
+    return heapq.merge(*streams, key=lambda record: record.timestamp)
+
+
+def iter_records(directory):
+    # Every record in the journal, in timestamp order across writers
+    return merge_records(path for paths in segment_paths(directory).values() for path in paths)
+
+
+def find_records(paths, key):
+    # The records of one game in the given segments, found by searching the
+    # mapped segments for its key instead of decoding every record
+    found = []
+    for path in paths:
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            continue
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                continue
+            mm, end = _open_segment(f, path)
+            with mm:
+                offset = mm.find(key, _HEADER.size, end)
+                while offset != -1:
+                    if (offset - _HEADER.size) % _RECORD.size == 0:
+                        found.append(Record(*_RECORD.unpack_from(mm, offset)))
+                    offset = mm.find(key, offset + 1, end)
+    found.sort(key=lambda record: record.timestamp)
+    return found
+
+
+def replay(records, games=None, keys=None):
+    # Applies records in order; returns {game key: TicTacToe}. With keys,
+    # only those games are rebuilt. Events for games whose NEW record is
+    # missing are skipped. A game's version counts its records; every save
+    # journals at least one, so a rebuilt game carries on from at least the
+    # version it was last saved at instead of starting again from 0.
+    games = {} if games is None else games
+    for record in records:
+        if keys is not None and record.game_id not in keys:
+            continue
+        kind = record.kind
+        if kind == NEW:
+            game = games[record.game_id] = TicTacToe(record.a, record.b)
+            game.game_mode = GAME_MODES[record.c & 15]
+            game.difficulty = DIFFICULTIES[record.c >> 4]
+            game.version = 1
+            continue
+        game = games.get(record.game_id)
+        if game is None:
+            continue
+        if kind == MOVE:
+            row, col = game.geometry.to_row_col(record.a)
+            game.make_move(row, col)
+        elif kind == UNDO:
+            game.undo_move()
+        elif kind == RESET:
+            game.reset()
+        elif kind == MODE:
+            game.game_mode = GAME_MODES[record.a]
+            game.difficulty = DIFFICULTIES[record.b]
+        game.version += 1
+    return games
@@ -0,0 +1,93 @@
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge,
+                               Histogram, REGISTRY, generate_latest)
+
+# Prometheus metrics for the web server, exposed at /metrics.
+#
+# Under gunicorn every worker is a separate process, so counters are written
+# to files in PROMETHEUS_MULTIPROC_DIR (set by gunicorn.conf.py) and summed
+# across live workers when scraped. Without it they live in this process.
+
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+# Bot moves range from table lookups (microseconds) to full time budgets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+REQUEST_SECONDS = Histogram(
+    'ttt_request_seconds', "Time spent handling an API request",
+    ['route', 'method', 'status'], buckets=LATENCY_BUCKETS)
+BOT_MOVE_SECONDS = Histogram(
+    'ttt_bot_move_seconds', "Time the bot spent choosing a move",
+    ['variant'], buckets=LATENCY_BUCKETS)
+VALIDATION_FAILURES = Counter(
+    'ttt_validation_failures_total', "Requests rejected before changing a game",
+    ['reason'])
+GAMES_CREATED = Counter(
+    'ttt_games_created_total', "Games created", ['variant'])
+GAMES_FINISHED = Counter(
+    'ttt_games_finished_total', "Games that ended in a win or a tie",
+    ['variant', 'mode', 'winner'])
+GAMES_EVICTED = Counter(
+    'ttt_games_evicted_total', "Games dropped by the in-process store", ['reason'])
+ANALYSIS_LOOKUPS = Counter(
+    'ttt_analysis_cache_lookups_total', "Position analysis cache lookups", ['result'])
+STORE_GAMES = Gauge(
+    'ttt_store_games', "Games held by the in-process store",
+    multiprocess_mode='livesum')
+STORE_BYTES = Gauge(
+    'ttt_store_bytes', "Encoded bytes held by the in-process store",
+    multiprocess_mode='livesum')
+
+
+def variant(game):
+    return '%d-%d' % (game.size, game.win_length)
+
+
+def observe_request(route, method, status, seconds):
+    REQUEST_SECONDS.labels(route, method, status).observe(seconds)
+
+
+def observe_bot_move(game, seconds):
+    BOT_MOVE_SECONDS.labels(variant(game)).observe(seconds)
+
+
+def validation_failed(reason):
+    VALIDATION_FAILURES.labels(reason).inc()
+
+
+def games_created(game, count=1):
+    GAMES_CREATED.labels(variant(game)).inc(count)
+
+
+def move_played(game):
+    # Call after every accepted move; counts the game once when it ends
+    if game.game_over:
+        GAMES_FINISHED.labels(variant(game), game.game_mode or 'none', game.winner).inc()
+
+
+def game_evicted(reason):
+    GAMES_EVICTED.labels(reason).inc()
+
+
+def analysis_lookup(result):
+    ANALYSIS_LOOKUPS.labels(result).inc()
+
+
+def observe_store(store):
+    stats = store.stats()
+    if stats is not None:
+        STORE_GAMES.set(stats['games'])
+        STORE_BYTES.set(stats['bytes'])
+
+
+def render():
+    # Returns (body, content type) for a scrape
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,145 @@
+import numpy as np
+
+# Particle effects for the pygame client.
+#
+# Particles are kept as a struct of arrays: one NumPy array per attribute,
+# with the live particles packed at the front. A frame moves every particle
+# with a few array operations, and dead ones are removed by moving live
+# particles from the end into their slots, so nothing is allocated or
+# shifted while an effect plays. The arrays are allocated once, at the
+# pool's capacity, and reused by every effect; particles emitted into a
+# full pool are dropped.
+#
+# Effects are functions in EFFECTS that emit particles into a pool, and
+# several can play in the same pool at once.
+
+MAX_PARTICLES = 8192
+MAX_SIZE = 8  # largest particle radius, in pixels
+
+
+class Particles:
+    def __init__(self, width, height, colors, capacity=MAX_PARTICLES, rng=None):
+        # Particles leaving the width x height area are removed
+        self.width = width
+        self.height = height
+        self.colors = colors
+        self.capacity = capacity
+        self.rng = rng or np.random.default_rng()
+        self.count = 0
+        self.x = np.zeros(capacity, np.float32)
+        self.y = np.zeros(capacity, np.float32)
+        self.vx = np.zeros(capacity, np.float32)
+        self.vy = np.zeros(capacity, np.float32)
+        self.gravity = np.zeros(capacity, np.float32)
+        self.life = np.zeros(capacity, np.int16)  # frames left
+        self.size = np.zeros(capacity, np.int16)
+        self.color = np.zeros(capacity, np.int16)  # index into colors
+        self._arrays = (self.x, self.y, self.vx, self.vy, self.gravity,
+                        self.life, self.size, self.color)
+        self._sprites = None
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def emit(self, count, x, y, vx, vy, gravity=0.0, life=180, size=None, color=None):
+        # Adds up to `count` particles. Every attribute is a scalar or an
+        # array of `count` values; size and color default to random ones.
+        start = self.count
+        count = min(count, self.capacity - start)
+        if count <= 0:
+            return
+        if size is None:
+            size = self.rng.integers(3, MAX_SIZE + 1, count)
+        if color is None:
+            color = self.rng.integers(0, len(self.colors), count)
+        end = start + count
+        for array, values in zip(self._arrays, (x, y, vx, vy, gravity, life, size, color)):
+            values = np.asarray(values)
+            array[start:end] = values[:count] if values.ndim else values
+        self.count = end
+
+    def update(self):
+        # Advances every particle one frame and removes the dead ones
+        n = self.count
+        if not n:
+            return
+        x, y, vy = self.x[:n], self.y[:n], self.vy[:n]
+        x += self.vx[:n]
+        y += vy
+        vy += self.gravity[:n]
+        self.life[:n] -= 1
+        alive = (self.life[:n] > 0) & (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        dead = np.flatnonzero(~alive)
+        if not dead.size:
+            return
+        # Swap-remove: live particles past the new end fill the holes before it
+        keep = n - dead.size
+        holes = dead[dead < keep]
+        fillers = np.flatnonzero(alive[keep:]) + keep
+        for array in self._arrays:
+            array[holes] = array[fillers]
+        self.count = keep
+
+    def sprites(self):
+        # One pre-drawn circle per colour and radius, looked up by
+        # color * (MAX_SIZE + 1) + size
+        if self._sprites is None:
+            import pygame
+            self._sprites = []
+            for color in self.colors:
+                for radius in range(MAX_SIZE + 1):
+                    sprite = pygame.Surface((2 * radius, 2 * radius), pygame.SRCALPHA)
+                    if radius:
+                        pygame.draw.circle(sprite, color, (radius, radius), radius)
+                    self._sprites.append(sprite)
+        return self._sprites
+
+    def draw(self, surface):
+        # Blits every particle in one call; returns the area drawn over, or
+        # None when there are no particles
+        n = self.count
+        if not n:
+            return None
+        import pygame
+        sprites = self.sprites()
+        size = self.size[:n]
+        left = (self.x[:n] - size).astype(np.int32)
+        top = (self.y[:n] - size).astype(np.int32)
+        keys = self.color[:n] * (MAX_SIZE + 1) + size
+        surface.blits(list(zip(map(sprites.__getitem__, keys.tolist()),
+                               zip(left.tolist(), top.tolist()))), False)
+        return pygame.Rect(int(left.min()), int(top.min()),
+                           int((left + 2 * size).max() - left.min()),
+                           int((top + 2 * size).max() - top.min()))
+
+
+def burst(particles, count):
+    # Explodes from the centre and falls back down
+    rng = particles.rng
+    particles.emit(count, particles.width // 2, particles.height // 2,
+                   rng.uniform(-5, 5, count), rng.uniform(-5, 5, count), gravity=0.2)
+
+
+def fountain(particles, count):
+    # Shoots up from the bottom edge
+    rng = particles.rng
+    particles.emit(count, rng.normal(particles.width / 2, 20, count), particles.height - 1,
+                   rng.uniform(-2.5, 2.5, count), rng.uniform(-16, -8, count), gravity=0.25)
+
+
+def confetti(particles, count):
+    # Drifts down over the whole width
+    rng = particles.rng
+    particles.emit(count, rng.uniform(0, particles.width, count), rng.uniform(0, 40, count),
+                   rng.uniform(-1, 1, count), rng.uniform(0.5, 3, count), gravity=0.02,
+                   life=rng.integers(120, 240, count), size=rng.integers(2, 5, count))
+
+
+EFFECTS = {
+    'burst': burst,
+    'fountain': fountain,
+    'confetti': confetti,
+}
@@ -0,0 +1,231 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Player ratings and the leaderboard, kept in SQLite.
+#
+# Every player has an Elo rating, updated once when a rated game ends: an
+# online game with a player in both seats, or a bot game with a player as
+# X, rated against a fixed rating for the bot's difficulty. Friend games
+# are not rated. The database is shared by every worker on the host; WAL
+# mode lets leaderboard reads run while a rating update is being written.
+#
+# The leaderboard never sorts players per request. The top of the table is
+# read from an index on rating, and a player's rank comes from a small
+# table counting players per RATING_BUCKET points of rating: the players
+# in higher buckets are summed, and only the player's own bucket is
+# counted from the index.
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ratings.db')
+INITIAL_RATING = 1200.0
+K_FACTOR = 32
+RATING_BUCKET = 10  # rating points per rank-counting bucket
+BOT_RATINGS = {'easy': 800.0, 'medium': 1100.0, 'hard': 1400.0, 'perfect': 1800.0}
+MAX_NAME_LENGTH = 40
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS players (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    rating REAL NOT NULL,
+    wins INTEGER NOT NULL DEFAULT 0,
+    losses INTEGER NOT NULL DEFAULT 0,
+    draws INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS players_by_rating ON players (rating);
+CREATE TABLE IF NOT EXISTS rating_buckets (
+    bucket INTEGER PRIMARY KEY,
+    players INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS seats (
+    game_id TEXT NOT NULL,
+    seat TEXT NOT NULL,
+    player_id TEXT NOT NULL,
+    PRIMARY KEY (game_id, seat)
+);
+CREATE TABLE IF NOT EXISTS results (
+    game_id TEXT PRIMARY KEY,
+    winner TEXT NOT NULL,
+    finished REAL NOT NULL
+);
+'''
+
+_PLAYER_COLUMNS = 'id, name, rating, wins, losses, draws'
+
+# Ranks count only the players rated strictly higher, so equal ratings share
+# a rank
+_RANK_QUERY = '''
+SELECT (SELECT COALESCE(SUM(players), 0) FROM rating_buckets WHERE bucket > :bucket)
+     + (SELECT COUNT(*) FROM players WHERE rating > :rating AND rating < :bucket_end)
+     + 1
+'''
+
+
+def expected_score(rating, opponent):
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+
+def updated_rating(rating, opponent, score):
+    # score is 1 for a win, 0.5 for a draw and 0 for a loss
+    return rating + K_FACTOR * (score - expected_score(rating, opponent))
+
+
+def _bucket(rating):
+    return int(rating // RATING_BUCKET)
+
+
+def _player(row):
+    player_id, name, rating, wins, losses, draws = row
+    return {'player_id': player_id, 'name': name, 'rating': round(rating),
+            'wins': wins, 'losses': losses, 'draws': draws}
+
+
+class Ratings:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        # One connection per thread; writes take the database lock up front
+        # and wait up to the timeout for other writers
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _adjust_bucket(self, connection, rating, change):
+        connection.execute(
+            'INSERT INTO rating_buckets (bucket, players) VALUES (?, ?) '
+            'ON CONFLICT (bucket) DO UPDATE SET players = players + excluded.players',
+            (_bucket(rating), change))
+
+    def create_player(self, name):
+        player_id = uuid.uuid4().hex
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'INSERT INTO players (id, name, rating, created) VALUES (?, ?, ?, ?)',
+                (player_id, name, INITIAL_RATING, time.time()))
+            self._adjust_bucket(connection, INITIAL_RATING, 1)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return self.get_player(player_id)
+
+    def get_player(self, player_id):
+        # The player with their current rank, or None
+        row = self._connection().execute(
+            'SELECT %s FROM players WHERE id = ?' % _PLAYER_COLUMNS, (player_id,)).fetchone()
+        if row is None:
+            return None
+        player = _player(row)
+        player['rank'] = self.rank(row[2])
+        return player
+
+    def rank(self, rating):
+        # 1 + the number of players rated higher than `rating`
+        bucket = _bucket(rating)
+        return self._connection().execute(_RANK_QUERY, {
+            'bucket': bucket,
+            'rating': rating,
+            'bucket_end': (bucket + 1) * RATING_BUCKET,
+        }).fetchone()[0]
+
+    def top(self, limit):
+        # The `limit` highest rated players, best first, each with a rank
+        rows = self._connection().execute(
+            'SELECT %s FROM players ORDER BY rating DESC LIMIT ?' % _PLAYER_COLUMNS,
+            (limit,)).fetchall()
+        players = []
+        for index, row in enumerate(rows):
+            player = _player(row)
+            tied = index and row[2] == rows[index - 1][2]
+            player['rank'] = players[-1]['rank'] if tied else index + 1
+            players.append(player)
+        return players
+
+    def seat(self, game_id, seat, player_id):
+        # Records who plays `seat` ('X' or 'O') in a game
+        self._connection().execute(
+            'INSERT OR REPLACE INTO seats (game_id, seat, player_id) VALUES (?, ?, ?)',
+            (game_id, seat, player_id))
+
+    def is_seated(self, game_id):
+        # Whether any player has a seat in the game, making it rated
+        return self._connection().execute(
+            'SELECT 1 FROM seats WHERE game_id = ? LIMIT 1', (game_id,)).fetchone() is not None
+
+    def record_result(self, game_id, game):
+        # Applies the result of a finished game to its players' ratings.
+        # Returns {player_id: new rating} for the players whose rating
+        # changed; each game is rated at most once.
+        if not game.game_over or game.game_mode not in ('bot', 'online'):
+            return {}
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            changed = self._apply_result(connection, game_id, game)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return changed
+
+    def _apply_result(self, connection, game_id, game):
+        seats = dict(connection.execute(
+            'SELECT seat, player_id FROM seats WHERE game_id = ?', (game_id,)))
+        if game.game_mode == 'bot':
+            seats.pop('O', None)  # the bot plays O
+        players = {}
+        for seat, player_id in seats.items():
+            row = connection.execute('SELECT rating FROM players WHERE id = ?',
+                                     (player_id,)).fetchone()
+            if row is not None:
+                players[seat] = (player_id, row[0])
+        if 'X' not in players:
+            return {}
+        if game.game_mode == 'online' and ('O' not in players
+                                           or players['O'][0] == players['X'][0]):
+            return {}
+        cursor = connection.execute(
+            'INSERT OR IGNORE INTO results (game_id, winner, finished) VALUES (?, ?, ?)',
+            (game_id, game.winner, time.time()))
+        if not cursor.rowcount:
+            return {}
+
+        if game.game_mode == 'bot':
+            opponents = {'X': BOT_RATINGS[game.difficulty]}
+        else:
+            opponents = {'X': players['O'][1], 'O': players['X'][1]}
+        changed = {}
+        for seat, opponent in opponents.items():
+            player_id, rating = players[seat]
+            if game.winner == 'Tie':
+                score, column = 0.5, 'draws'
+            elif game.winner == seat:
+                score, column = 1.0, 'wins'
+            else:
+                score, column = 0.0, 'losses'
+            new_rating = updated_rating(rating, opponent, score)
+            connection.execute(
+                'UPDATE players SET rating = ?, {0} = {0} + 1 WHERE id = ?'.format(column),
+                (new_rating, player_id))
+            if _bucket(new_rating) != _bucket(rating):
+                self._adjust_bucket(connection, rating, -1)
+                self._adjust_bucket(connection, new_rating, 1)
+            changed[player_id] = round(new_rating)
+        return changed
+
+
+def create_ratings():
+    # RATINGS_DB chooses the database file
+    return Ratings(os.environ.get('RATINGS_DB') or DEFAULT_PATH)
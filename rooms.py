@@ -0,0 +1,231 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict, deque
+
+from engine import get_geometry
+
+# Online multiplayer: seat and player tokens, matchmaking, push fan-out and
+# change notifications for long-polling clients.
+#
+# Seat tokens are derived from the game id with an HMAC, so any worker that
+# shares SECRET_KEY can check them without storing anything per game; player
+# tokens are the player id followed by an HMAC of it. Set SECRET_KEY in
+# production: the random fallback only suits a single process, and player
+# tokens signed with it stop working when the process restarts.
+#
+# The matchmaking queue and the push subscribers live in this process and
+# are not shared through the store, so online play runs in one process.
+
+SECRET_KEY = (os.environ.get('SECRET_KEY') or secrets.token_hex(32)).encode()
+SEATS = ('X', 'O')
+MAX_PENDING_MESSAGES = 64  # per subscriber, before it is treated as too slow
+
+
+def seat_token(game_id, seat):
+    message = ('%s:%s' % (game_id, seat)).encode()
+    return hmac.new(SECRET_KEY, message, hashlib.sha256).hexdigest()[:32]
+
+
+def seat_for_token(game_id, token):
+    # Returns 'X' or 'O' for a valid token, None for spectators and bad tokens
+    if not isinstance(game_id, str) or not isinstance(token, str):
+        return None
+    for seat in SEATS:
+        if hmac.compare_digest(seat_token(game_id, seat), token):
+            return seat
+    return None
+
+
+def player_token(player_id):
+    message = ('player:%s' % player_id).encode()
+    return '%s.%s' % (player_id, hmac.new(SECRET_KEY, message, hashlib.sha256).hexdigest()[:32])
+
+
+def player_for_token(token):
+    # Returns the player id of a valid player token, otherwise None
+    if not isinstance(token, str) or '.' not in token:
+        return None
+    player_id = token.rsplit('.', 1)[0]
+    if hmac.compare_digest(player_token(player_id), token):
+        return player_id
+    return None
+
+
+class Broadcast:
+    # One published update. It is rendered at most once per format, however
+    # many subscribers receive it.
+    __slots__ = ('_render', '_texts')
+
+    def __init__(self, render):
+        self._render = render
+        self._texts = {}
+
+    def text(self, compact):
+        text = self._texts.get(compact)
+        if text is None:
+            text = self._texts[compact] = self._render(compact)
+        return text
+
+
+class Subscription:
+    __slots__ = ('topic', 'queue', 'overflowed')
+
+    def __init__(self, topic):
+        self.topic = topic
+        self.queue = asyncio.Queue(MAX_PENDING_MESSAGES)
+        self.overflowed = False
+
+
+class PubSub:
+    # In-process topic fan-out for the asyncio server. Subscribers each get a
+    # bounded queue; publish() may be called from any thread, e.g. from
+    # Flask routes running under the ASGI adapter.
+
+    def __init__(self):
+        self._topics = defaultdict(set)
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic):
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(topic)
+        with self._lock:
+            self._topics[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._topics.get(subscription.topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[subscription.topic]
+
+    def subscriber_count(self, topic):
+        return len(self._topics.get(topic, ()))
+
+    def publish(self, topic, message):
+        if topic not in self._topics or self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver(topic, message)
+        else:
+            self._loop.call_soon_threadsafe(self._deliver, topic, message)
+
+    def _deliver(self, topic, message):
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Drop clients that stop reading instead of buffering forever
+                subscription.overflowed = True
+                self.unsubscribe(subscription)
+
+
+class ChangeNotifier:
+    # Wakes threads blocked until a game changes, for HTTP long-polls. Each
+    # watched game has one condition, dropped when its last waiter leaves.
+    # Changes saved by other processes (a shared Redis store) are not
+    # signalled, so waiters also recheck every `recheck` seconds.
+
+    def __init__(self, recheck=1.0):
+        self.recheck = recheck
+        self._conditions = {}  # game id -> [condition, waiters]
+        self._lock = threading.Lock()
+
+    def notify(self, game_id):
+        with self._lock:
+            entry = self._conditions.get(game_id)
+        if entry is not None:
+            with entry[0]:
+                entry[0].notify_all()
+
+    def wait(self, game_id, changed, timeout):
+        # Blocks until changed() is true or the timeout passes; returns the
+        # last result of changed(). notify() cannot slip in between a check
+        # and the wait, since both hold the condition.
+        with self._lock:
+            entry = self._conditions.get(game_id)
+            if entry is None:
+                entry = self._conditions[game_id] = [threading.Condition(), 0]
+            entry[1] += 1
+        deadline = time.monotonic() + timeout
+        try:
+            with entry[0]:
+                while not changed():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    entry[0].wait(min(remaining, self.recheck))
+                return True
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._conditions[game_id]
+
+
+class Matchmaker:
+    # Pairs waiting players per board variant, so a win length left to its
+    # default matches the same length given explicitly. The first player to
+    # wait gets X; create_game(size, win_length) must return the new game's
+    # id. It is called in a worker thread, so it may save the game to a slow
+    # store.
+
+    def __init__(self, create_game):
+        self.create_game = create_game
+        self._waiting = defaultdict(deque)
+
+    def waiting_count(self, variant=None):
+        if variant is not None:
+            return sum(1 for future in self._waiting.get(variant, ()) if not future.done())
+        return sum(self.waiting_count(key) for key in list(self._waiting))
+
+    async def join(self, size, win_length):
+        geometry = get_geometry(size, win_length)
+        size, win_length = variant = (geometry.size, geometry.win_length)
+        # The variant's queue is looked up again after every wait, since the
+        # last waiter leaving drops it
+        while self._waiting[variant]:
+            opponent = self._waiting[variant].popleft()
+            if opponent.done():
+                continue
+            try:
+                game_id = await asyncio.to_thread(self.create_game, size, win_length)
+            except BaseException:
+                if not opponent.done():
+                    self._waiting[variant].appendleft(opponent)  # still waiting
+                raise
+            if opponent.done():
+                continue  # left while the game was created, which then expires unused
+            opponent.set_result((game_id, 'X'))
+            return game_id, 'O'
+
+        queue = self._waiting[variant]
+        future = asyncio.get_running_loop().create_future()
+        queue.append(future)
+        try:
+            return await future
+        finally:
+            if not future.done() or future.cancelled():
+                try:
+                    queue.remove(future)
+                except ValueError:
+                    pass
+            if not queue and self._waiting.get(variant) is queue:
+                del self._waiting[variant]
+
+
+hub = PubSub()
+changes = ChangeNotifier()
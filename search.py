@@ -0,0 +1,325 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from engine import MAX_BOARD_SIZE, iter_cells, popcount
+
+# Iterative-deepening alpha-beta search for boards of any size and win length.
+#
+# Positions are hashed with Zobrist keys that are updated incrementally as
+# moves are made, and results are kept in a fixed-size transposition table
+# shared by every search on the same geometry. The static evaluation is also
+# incremental: each move only rescores the winning windows through its cell.
+#
+# A forced win found `ply` moves below the root scores WIN_SCORE - ply, so
+# quicker wins score higher. The table is shared between searches from
+# different roots, so it stores such scores counted from the entry's own
+# position and converts them back when they are probed.
+
+DEFAULT_TIME_BUDGET = 0.5  # seconds per bot move
+DEFAULT_TT_SIZE = 1 << 18  # entries, must be a power of two
+MAX_BRANCHING = 12  # candidate moves searched per node on big boards
+WIN_SCORE = 1000000
+MAX_SEARCHERS = 4  # board variants with a searcher (and its table) kept in memory
+INFINITY = WIN_SCORE * 2
+MAX_PLY = MAX_BOARD_SIZE * MAX_BOARD_SIZE
+MAX_EVAL = WIN_SCORE // 4  # bound on a static evaluation, far from any forced result
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class _Context:
+    __slots__ = ('deadline', 'nodes')
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.nodes = 0
+
+
+def _to_table(value, ply):
+    # A score relative to the root as stored for a position `ply` moves down
+    if value >= WIN_SCORE - MAX_PLY:
+        return value + ply
+    if value <= MAX_PLY - WIN_SCORE:
+        return value - ply
+    return value
+
+
+def _from_table(value, ply):
+    if value >= WIN_SCORE - MAX_PLY:
+        return value - ply
+    if value <= MAX_PLY - WIN_SCORE:
+        return value + ply
+    return value
+
+
+class Searcher:
+    def __init__(self, geometry, tt_size=DEFAULT_TT_SIZE, seed=0):
+        self.geometry = geometry
+        rng = random.Random(seed)
+        self.zobrist = tuple(
+            tuple(rng.getrandbits(64) for _ in range(geometry.cell_count))
+            for _ in range(2)
+        )
+        self.tt_mask = tt_size - 1
+        self.tt = [None] * tt_size
+        # A window holding n marks of one player and none of the other's is
+        # worth 4 ** n to that player. With long win lengths that would soon
+        # pass WIN_SCORE, so there the scores are scaled down until all the
+        # windows together stay within MAX_EVAL.
+        top = 4 ** (geometry.win_length - 1) * len(geometry.win_masks)
+        self.window_scores = tuple(0 if n == 0 else max(n, 4 ** n * MAX_EVAL // max(top, MAX_EVAL))
+                                   for n in range(geometry.win_length + 1))
+
+    def hash_position(self, x_mask, o_mask):
+        key = 0
+        for cell in iter_cells(x_mask):
+            key ^= self.zobrist[0][cell]
+        for cell in iter_cells(o_mask):
+            key ^= self.zobrist[1][cell]
+        return key
+
+    def evaluate(self, x_mask, o_mask):
+        # Static score from X's point of view
+        score = 0
+        for window in self.geometry.win_masks:
+            if not o_mask & window:
+                score += self.window_scores[popcount(x_mask & window)]
+            elif not x_mask & window:
+                score -= self.window_scores[popcount(o_mask & window)]
+        return score
+
+    def _gain(self, mine, theirs, cell):
+        # How much placing `cell` improves the mover's score
+        gain = 0
+        scores = self.window_scores
+        for window in self.geometry.lines_through[cell]:
+            if theirs & window:
+                if not mine & window:
+                    gain += scores[popcount(theirs & window)]
+            else:
+                count = popcount(mine & window)
+                gain += scores[count + 1] - scores[count]
+        return gain
+
+    def _candidates(self, x_mask, o_mask):
+        geometry = self.geometry
+        occupied = x_mask | o_mask
+        empty = geometry.full_mask & ~occupied
+        if geometry.cell_count <= 16:
+            return empty
+        if not occupied:
+            return 1 << geometry.center
+        nearby = 0
+        for cell in iter_cells(occupied):
+            nearby |= geometry.neighbours[cell]
+        return (nearby & empty) or empty
+
+    def _ordered_moves(self, mine, theirs, candidates, tt_move):
+        # Attack plus defence value of each candidate, best first
+        scored = []
+        for cell in iter_cells(candidates):
+            order = self._gain(mine, theirs, cell) + self._gain(theirs, mine, cell)
+            if cell == tt_move:
+                order = INFINITY
+            scored.append((order, cell))
+        scored.sort(reverse=True)
+        if self.geometry.cell_count > 16:
+            scored = scored[:MAX_BRANCHING]
+        return [cell for _, cell in scored]
+
+    def likely_moves(self, x_mask, o_mask, player, count):
+        # The `count` moves for `player` that move ordering ranks highest
+        mine, theirs = (x_mask, o_mask) if player == 'X' else (o_mask, x_mask)
+        candidates = self._candidates(x_mask, o_mask)
+        return self._ordered_moves(mine, theirs, candidates, None)[:count]
+
+    def _negamax(self, ctx, mine, theirs, player, depth, alpha, beta, key, score, ply):
+        ctx.nodes += 1
+        if ctx.nodes & 63 == 0 and time.perf_counter() > ctx.deadline:
+            raise SearchTimeout()
+
+        alpha_orig = alpha
+        slot = key & self.tt_mask
+        entry = self.tt[slot]
+        tt_move = None
+        if entry is not None and entry[0] == key:
+            tt_move = entry[4]
+            if entry[1] >= depth:
+                flag, value = entry[2], _from_table(entry[3], ply)
+                if flag == EXACT:
+                    return value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        if depth == 0:
+            return score
+
+        x_mask, o_mask = (mine, theirs) if player == 0 else (theirs, mine)
+        candidates = self._candidates(x_mask, o_mask)
+        if not candidates:
+            return 0
+
+        geometry = self.geometry
+        zobrist = self.zobrist[player]
+        best = -INFINITY
+        best_move = None
+        for cell in self._ordered_moves(mine, theirs, candidates, tt_move):
+            placed = mine | (1 << cell)
+            if geometry.has_line(placed, cell):
+                value = WIN_SCORE - ply
+            elif (placed | theirs) == geometry.full_mask:
+                value = 0
+            else:
+                child_score = -(score + self._gain(mine, theirs, cell))
+                value = -self._negamax(ctx, theirs, placed, 1 - player, depth - 1,
+                                       -beta, -alpha, key ^ zobrist[cell],
+                                       child_score, ply + 1)
+            if value > best:
+                best = value
+                best_move = cell
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                break
+
+        if best <= alpha_orig:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        if entry is None or entry[0] != key or entry[1] <= depth:
+            self.tt[slot] = (key, depth, flag, _to_table(best, ply), best_move)
+        return best
+
+    def search(self, x_mask, o_mask, player='O', time_budget=None, max_depth=None):
+        # Returns the best cell for `player` found within the time budget
+        if time_budget is None:
+            time_budget = DEFAULT_TIME_BUDGET
+        geometry = self.geometry
+        player_index = 0 if player == 'X' else 1
+        mine, theirs = (x_mask, o_mask) if player_index == 0 else (o_mask, x_mask)
+        empty = geometry.full_mask & ~(x_mask | o_mask)
+        if not empty:
+            return None
+
+        candidates = self._candidates(x_mask, o_mask)
+        moves = self._ordered_moves(mine, theirs, candidates, None)
+        best_move = moves[0]
+
+        # Take a win or block a loss without searching
+        for cell in iter_cells(candidates):
+            if geometry.has_line(mine | (1 << cell), cell):
+                return cell
+        threats = [cell for cell in iter_cells(candidates)
+                   if geometry.has_line(theirs | (1 << cell), cell)]
+        if threats or len(moves) == 1:
+            return threats[0] if threats else best_move
+
+        ctx = _Context(time.perf_counter() + time_budget)
+        key = self.hash_position(x_mask, o_mask)
+        score = self.evaluate(x_mask, o_mask)
+        if player_index == 1:
+            score = -score
+        zobrist = self.zobrist[player_index]
+        limit = popcount(empty) if max_depth is None else min(max_depth, popcount(empty))
+
+        try:
+            for depth in range(1, limit + 1):
+                alpha = -INFINITY
+                iteration_best = None
+                for cell in [best_move] + [m for m in moves if m != best_move]:
+                    placed = mine | (1 << cell)
+                    if (placed | theirs) == geometry.full_mask:
+                        value = 0
+                    else:
+                        child_score = -(score + self._gain(mine, theirs, cell))
+                        value = -self._negamax(ctx, theirs, placed, 1 - player_index,
+                                               depth - 1, -INFINITY, -alpha,
+                                               key ^ zobrist[cell], child_score, 1)
+                    if iteration_best is None or value > alpha:
+                        alpha = value
+                        iteration_best = cell
+                best_move = iteration_best
+                # A forced result needs no deeper search
+                if abs(alpha) >= WIN_SCORE - limit:
+                    break
+        except SearchTimeout:
+            pass
+        return best_move
+
+    def analyze(self, x_mask, o_mask, player='O', time_budget=None, max_depth=None):
+        # Scores every legal move for `player`, each with a full window so the
+        # scores can be compared, searching all of them one ply deeper per
+        # iteration within the time budget. Returns ({cell: score for the
+        # mover}, depth of the last completed iteration); depth 1 always runs.
+        if time_budget is None:
+            time_budget = DEFAULT_TIME_BUDGET
+        geometry = self.geometry
+        player_index = 0 if player == 'X' else 1
+        mine, theirs = (x_mask, o_mask) if player_index == 0 else (o_mask, x_mask)
+        empty = geometry.full_mask & ~(x_mask | o_mask)
+        if not empty:
+            return {}, 0
+
+        deadline = time.perf_counter() + time_budget
+        ctx = _Context(float('inf'))
+        key = self.hash_position(x_mask, o_mask)
+        score = self.evaluate(x_mask, o_mask)
+        if player_index == 1:
+            score = -score
+        zobrist = self.zobrist[player_index]
+        limit = popcount(empty) if max_depth is None else min(max_depth, popcount(empty))
+
+        scores, completed = {}, 0
+        try:
+            for depth in range(1, limit + 1):
+                iteration = {}
+                for cell in iter_cells(empty):
+                    placed = mine | (1 << cell)
+                    if geometry.has_line(placed, cell):
+                        value = WIN_SCORE
+                    elif (placed | theirs) == geometry.full_mask:
+                        value = 0
+                    else:
+                        child_score = -(score + self._gain(mine, theirs, cell))
+                        value = -self._negamax(ctx, theirs, placed, 1 - player_index,
+                                               depth - 1, -INFINITY, INFINITY,
+                                               key ^ zobrist[cell], child_score, 1)
+                    iteration[cell] = value
+                scores, completed = iteration, depth
+                ctx.deadline = deadline
+                # Stop once every move is a forced result
+                if all(abs(value) >= WIN_SCORE - limit for value in scores.values()):
+                    break
+        except SearchTimeout:
+            pass
+        return scores, completed
+
+
+_searchers = OrderedDict()  # geometry -> Searcher, least recently used first
+_searchers_lock = threading.Lock()
+
+
+def get_searcher(geometry):
+    # One searcher (and transposition table) per board variant, for the
+    # MAX_SEARCHERS variants used most recently
+    with _searchers_lock:
+        searcher = _searchers.get(geometry)
+        if searcher is None:
+            searcher = _searchers[geometry] = Searcher(geometry)
+            while len(_searchers) > MAX_SEARCHERS:
+                _searchers.popitem(last=False)
+        else:
+            _searchers.move_to_end(geometry)
+    return searcher
@@ -0,0 +1,143 @@
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import solver
+from engine import BOARD_SIZE, TicTacToe
+from strategies import STRATEGIES, get_strategy
+
+# Headless self-play simulator for comparing bot strategies.
+#
+#   python simulate.py --x perfect --o heuristic --games 1000000
+#
+# Games are split into chunks and played across a process pool. Each chunk
+# is seeded from --seed and its index, so with the random, heuristic and
+# perfect strategies a run is reproducible whatever the number of workers.
+# The search strategy and the bot levels stop searching when their time
+# runs out, so their results also depend on the machine and its load.
+
+CHUNK_SIZE = 10000
+
+
+def play_game(x_strategy, o_strategy, size, win_length, rng):
+    # Returns (winner, number of moves)
+    game = TicTacToe(size, win_length)
+    moves = 0
+    while not game.game_over:
+        strategy = x_strategy if game.current_player == 'X' else o_strategy
+        row, col = strategy(game, rng)
+        game.make_move(row, col)
+        moves += 1
+    return game.winner, moves
+
+
+def play_chunk(task):
+    x_name, o_name, size, win_length, count, seed = task
+    rng = random.Random(seed)
+    x_strategy = get_strategy(x_name)
+    o_strategy = get_strategy(o_name)
+    results = {'X': 0, 'O': 0, 'Tie': 0, 'moves': 0}
+    for _ in range(count):
+        winner, moves = play_game(x_strategy, o_strategy, size, win_length, rng)
+        results[winner] += 1
+        results['moves'] += moves
+    return results
+
+
+def play_chunk_vectorized(task):
+    # Same as play_chunk, but plays the whole chunk in lockstep with NumPy
+    import numpy as np
+    import batch
+    from engine import get_geometry
+    x_name, o_name, size, win_length, count, seed = task
+    geometry = get_geometry(size, win_length)
+    boards, winners = batch.play_lockstep(x_name, o_name, count, geometry,
+                                          np.random.default_rng(seed))
+    counts = np.bincount(winners, minlength=3)
+    return {'X': int(counts[batch.X]), 'O': int(counts[batch.O]), 'Tie': int(counts[0]),
+            'moves': int((boards != batch.EMPTY).sum())}
+
+
+def _init_worker():
+    # Load the opening book once per worker rather than once per chunk
+    solver.get_book()
+
+
+def simulate(x_name, o_name, games, size=BOARD_SIZE, win_length=None, workers=None,
+             seed=0, chunk_size=CHUNK_SIZE, vectorized=False):
+    tasks = []
+    for index, start in enumerate(range(0, games, chunk_size)):
+        count = min(chunk_size, games - start)
+        tasks.append((x_name, o_name, size, win_length, count, seed * 1000003 + index))
+
+    play = play_chunk_vectorized if vectorized else play_chunk
+    totals = {'X': 0, 'O': 0, 'Tie': 0, 'moves': 0}
+    if workers == 1:
+        _init_worker()
+        results = map(play, tasks)
+        for result in results:
+            for key in totals:
+                totals[key] += result[key]
+        return totals
+
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        for result in pool.imap_unordered(play, tasks):
+            for key in totals:
+                totals[key] += result[key]
+    return totals
+
+
+def confidence_interval(count, total, z=1.96):
+    # Normal-approximation 95% interval for a rate, as +/- percentage points
+    if not total:
+        return 0.0
+    rate = count / total
+    return 100 * z * math.sqrt(rate * (1 - rate) / total)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play bot strategies against each other headlessly")
+    parser.add_argument('--x', default='perfect', choices=sorted(STRATEGIES), help="strategy playing X")
+    parser.add_argument('--o', default='heuristic', choices=sorted(STRATEGIES), help="strategy playing O")
+    parser.add_argument('--games', type=int, default=100000, help="number of games to play")
+    parser.add_argument('--size', type=int, default=BOARD_SIZE, help="board size")
+    parser.add_argument('--win-length', type=int, default=None, help="marks in a row needed to win")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument('--seed', type=int, default=0, help="base random seed")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="games per worker task")
+    parser.add_argument('--vectorized', action='store_true',
+                        help="play each chunk in lockstep with NumPy (random, heuristic and perfect only)")
+    args = parser.parse_args(argv)
+
+    if args.games < 1:
+        parser.error("--games must be at least 1")
+    try:
+        game = TicTacToe(args.size, args.win_length)
+    except (TypeError, ValueError) as e:
+        parser.error(str(e))
+    if 'perfect' in (args.x, args.o) and not game.is_classic:
+        parser.error("the perfect strategy only supports the 3x3 board")
+    if args.vectorized and not {args.x, args.o} <= {'random', 'heuristic', 'perfect'}:
+        parser.error("only the random, heuristic and perfect strategies can be vectorized")
+
+    start = time.perf_counter()
+    totals = simulate(args.x, args.o, args.games, args.size, args.win_length,
+                      args.workers, args.seed, args.chunk_size, args.vectorized)
+    elapsed = time.perf_counter() - start
+
+    games = args.games
+    print("%s (X) vs %s (O), %d games on %dx%d" % (args.x, args.o, games, args.size, args.size))
+    for label, key in (("X wins", 'X'), ("O wins", 'O'), ("Draws", 'Tie')):
+        print("  %-7s %10d  %6.2f%% +/- %.2f" % (
+            label, totals[key], 100 * totals[key] / games, confidence_interval(totals[key], games)))
+    print("  %.1fs, %.0f games/sec, %.0f moves/sec, %.2f moves/game" % (
+        elapsed, games / elapsed, totals['moves'] / elapsed, totals['moves'] / games))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import os
+import random
+import struct
+import sys
+from array import array
+
+from engine import (CELL_COUNT, FULL_MASK, INVERSE_SYMMETRIES, canonical,
+                    has_line, iter_cells, to_row_col)
+
+# Perfect-play opening book for 3x3 tic-tac-toe.
+#
+# Every position reachable from the empty board is enumerated once, reduced
+# under the 8 board symmetries and solved with minimax. Each canonical
+# position maps to a 16-bit entry:
+#
+#   bits 0-8   mask of optimal moves (in canonical orientation)
+#   bits 9-10  value for the side to move + 1 (0 = loss, 1 = draw, 2 = win)
+#   bits 11-14 plies until the game ends with best play from both sides
+#
+# The book is written to BOOK_PATH as a sorted array of 18-bit position keys
+# followed by the matching entries, and loaded once at startup.
+
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book.bin')
+BOOK_MAGIC = b'TTTB'
+BOOK_VERSION = 1
+
+LOSS, DRAW, WIN = -1, 0, 1
+
+
+def position_key(x_mask, o_mask):
+    return (x_mask << CELL_COUNT) | o_mask
+
+
+def pack_entry(moves_mask, value, distance):
+    return moves_mask | ((value + 1) << 9) | (distance << 11)
+
+
+def unpack_entry(entry):
+    return entry & FULL_MASK, ((entry >> 9) & 0b11) - 1, entry >> 11
+
+
+def build_book():
+    # Returns {canonical key: packed entry} for every non-terminal position
+    book = {}
+
+    def solve(x_mask, o_mask):
+        x_mask, o_mask, _ = canonical(x_mask, o_mask)
+        key = position_key(x_mask, o_mask)
+        if key in book:
+            _, value, distance = unpack_entry(book[key])
+            return value, distance
+
+        x_to_move = bin(x_mask).count('1') == bin(o_mask).count('1')
+        mine, theirs = (x_mask, o_mask) if x_to_move else (o_mask, x_mask)
+        empty = FULL_MASK & ~(x_mask | o_mask)
+
+        best = None
+        best_moves = 0
+        for cell in iter_cells(empty):
+            placed = mine | (1 << cell)
+            if has_line(placed, cell):
+                score = (WIN, 1)
+            elif (placed | theirs) == FULL_MASK:
+                score = (DRAW, 1)
+            else:
+                if x_to_move:
+                    value, distance = solve(placed, theirs)
+                else:
+                    value, distance = solve(theirs, placed)
+                score = (-value, distance + 1)
+
+            # Prefer higher values, then quick wins and slow losses
+            rank = (score[0], -score[1] if score[0] >= 0 else score[1])
+            if best is None or rank > best[0]:
+                best = (rank, score)
+                best_moves = 1 << cell
+            elif rank == best[0]:
+                best_moves |= 1 << cell
+
+        value, distance = best[1]
+        book[key] = pack_entry(best_moves, value, distance)
+        return value, distance
+
+    solve(0, 0)
+    return book
+
+
+def save_book(book, path=BOOK_PATH):
+    keys = array('I', sorted(book))
+    entries = array('H', (book[key] for key in keys))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<4sHI', BOOK_MAGIC, BOOK_VERSION, len(keys)))
+        if sys.byteorder != 'little':
+            keys.byteswap()
+            entries.byteswap()
+        keys.tofile(f)
+        entries.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def load_book(path=BOOK_PATH):
+    with open(path, 'rb') as f:
+        header = f.read(struct.calcsize('<4sHI'))
+        magic, version, count = struct.unpack('<4sHI', header)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            raise ValueError('Unsupported opening book: %s' % path)
+        keys = array('I')
+        entries = array('H')
+        keys.fromfile(f, count)
+        entries.fromfile(f, count)
+    if sys.byteorder != 'little':
+        keys.byteswap()
+        entries.byteswap()
+    return dict(zip(keys, entries))
+
+
+_book = None
+
+
+def get_book(path=BOOK_PATH):
+    # Load the book from disk, building and caching it on first use
+    global _book
+    if _book is None:
+        try:
+            _book = load_book(path)
+        except (OSError, ValueError, EOFError):
+            _book = build_book()
+            try:
+                save_book(_book, path)
+            except OSError:
+                pass
+    return _book
+
+
+def lookup(x_mask, o_mask):
+    # Returns (optimal moves mask, value, distance) in the caller's orientation,
+    # or None for terminal positions
+    cx, co, symmetry = canonical(x_mask, o_mask)
+    entry = get_book().get(position_key(cx, co))
+    if entry is None:
+        return None
+    moves_mask, value, distance = unpack_entry(entry)
+    if symmetry:
+        moves_mask = _untransform(moves_mask, symmetry)
+    return moves_mask, value, distance
+
+
+def _untransform(mask, symmetry):
+    inverse = INVERSE_SYMMETRIES[symmetry]
+    result = 0
+    for cell in iter_cells(mask):
+        result |= 1 << inverse[cell]
+    return result
+
+
+def best_move(x_mask, o_mask, rng=random):
+    result = lookup(x_mask, o_mask)
+    if result is None:
+        return None
+    moves = list(iter_cells(result[0]))
+    return to_row_col(rng.choice(moves))
+
+
+if __name__ == '__main__':
+    book = build_book()
+    save_book(book)
+    print('Wrote %d positions to %s' % (len(book), BOOK_PATH))
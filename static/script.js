@@ -1,33 +1,157 @@
 let gameId = null;
 let currentMode = null;
+let boardSize = 3;
+let socket = null;
+let matchSocket = null;
+let seatToken = null;
+let mySeat = null;
 
 // Initialize game
+function selectedVariant() {
+    return document.getElementById('variant-select').value.split('-').map(Number);
+}
+
 async function initGame() {
+    const [size, winLength] = selectedVariant();
+    seatToken = null;
+    mySeat = null;
     const response = await fetch('/api/new-game', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
-        }
+        },
+        body: JSON.stringify({
+            size: size,
+            win_length: winLength
+        })
     });
     const data = await response.json();
     gameId = data.game_id;
+    buildBoard(data.size);
+    connectSocket();
+}
+
+// Stream moves over a WebSocket when the server supports it (asgi.py),
+// falling back to one fetch per move otherwise
+function connectSocket() {
+    closeSocket();
+    if (!('WebSocket' in window)) return;
+    
+    const protocol = location.protocol === 'https:' ? 'wss' : 'ws';
+    const token = seatToken ? `&token=${seatToken}` : '';
+    const ws = new WebSocket(`${protocol}://${location.host}/ws/${gameId}?format=compact${token}`);
+    ws.onopen = () => {
+        socket = ws;
+        ws.send(JSON.stringify({type: 'state'}));
+    };
+    ws.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type === 'error') {
+            console.error(data.error);
+            return;
+        }
+        updateBoardFromData(data);
+    };
+    ws.onclose = () => {
+        if (socket === ws) {
+            socket = null;
+        }
+    };
+}
+
+function closeSocket() {
+    if (socket) {
+        socket.close();
+        socket = null;
+    }
+    if (matchSocket) {
+        matchSocket.close();
+        matchSocket = null;
+    }
+}
+
+// Wait in the matchmaking queue for an online opponent
+function findOnlineMatch() {
+    closeSocket();
+    gameId = null;
+    const [size, winLength] = selectedVariant();
+    const protocol = location.protocol === 'https:' ? 'wss' : 'ws';
+    const ws = new WebSocket(`${protocol}://${location.host}/ws/match?size=${size}&win_length=${winLength}`);
+    matchSocket = ws;
+    let matched = false;
+    
+    buildBoard(size);
+    document.getElementById('game-over').classList.add('hidden');
+    document.getElementById('current-player').textContent = 'Waiting for an opponent...';
+    document.getElementById('game-mode-text').textContent = 'Mode: Online';
+    
+    ws.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type !== 'matched') return;
+        matched = true;
+        matchSocket = null;
+        gameId = data.game_id;
+        seatToken = data.token;
+        mySeat = data.seat;
+        buildBoard(data.size);
+        document.getElementById('game-mode-text').textContent = `Mode: Online (you are ${mySeat})`;
+        connectSocket();
+    };
+    ws.onclose = () => {
+        if (!matched && matchSocket === ws) {
+            matchSocket = null;
+            document.getElementById('current-player').textContent = 'Online play is not available on this server';
+        }
+    };
+}
+
+// Create the board cells for the current variant
+function buildBoard(size) {
+    boardSize = size;
+    const board = document.getElementById('board');
+    board.innerHTML = '';
+    board.style.gridTemplateColumns = `repeat(${size}, 1fr)`;
+    board.style.gap = size > 5 ? '2px' : '10px';
+    board.style.maxWidth = size > 5 ? '600px' : '450px';
+    
+    for (let row = 0; row < size; row++) {
+        for (let col = 0; col < size; col++) {
+            const cell = document.createElement('div');
+            cell.className = 'cell';
+            cell.dataset.row = row;
+            cell.dataset.col = col;
+            cell.style.fontSize = `${Math.max(0.8, 12 / size)}rem`;
+            if (size > 5) {
+                cell.style.borderRadius = '4px';
+                cell.style.borderWidth = '1px';
+            }
+            cell.addEventListener('click', handleCellClick);
+            board.appendChild(cell);
+        }
+    }
 }
 
 // Start game - show mode selection
 function startGame() {
     document.getElementById('menu-screen').classList.remove('active');
     document.getElementById('mode-screen').classList.add('active');
-    initGame();
 }
 
 // Select game mode
 async function selectMode(mode) {
     currentMode = mode;
     
-    if (!gameId) {
-        await initGame();
+    if (mode === 'online') {
+        document.getElementById('mode-screen').classList.remove('active');
+        document.getElementById('game-screen').classList.add('active');
+        findOnlineMatch();
+        return;
     }
     
+    // Start a fresh game for the selected board variant
+    await initGame();
+    const difficulty = document.getElementById('difficulty-select').value;
+    
     // Set mode on server
     await fetch('/api/set-mode', {
         method: 'POST',
@@ -36,13 +160,15 @@ async function selectMode(mode) {
         },
         body: JSON.stringify({
             game_id: gameId,
-            mode: mode
+            mode: mode,
+            difficulty: difficulty
         })
     });
     
     document.getElementById('mode-screen').classList.remove('active');
     document.getElementById('game-screen').classList.add('active');
-    document.getElementById('game-mode-text').textContent = `Mode: ${mode === 'bot' ? 'Bot' : 'Friend'}`;
+    document.getElementById('game-mode-text').textContent =
+        mode === 'bot' ? `Mode: Bot (${difficulty})` : 'Mode: Friend';
     
     updateBoard();
 }
@@ -54,6 +180,11 @@ async function makeMove(row, col) {
     const cell = document.querySelector(`[data-row="${row}"][data-col="${col}"]`);
     if (cell.classList.contains('filled')) return;
     
+    if (socket && socket.readyState === WebSocket.OPEN) {
+        socket.send(JSON.stringify({type: 'move', row: row, col: col}));
+        return;
+    }
+    
     const response = await fetch('/api/make-move', {
         method: 'POST',
         headers: {
@@ -62,7 +193,9 @@ async function makeMove(row, col) {
         body: JSON.stringify({
             game_id: gameId,
             row: row,
-            col: col
+            col: col,
+            token: seatToken,
+            format: 'compact'
         })
     });
     
@@ -75,24 +208,58 @@ async function makeMove(row, col) {
     
     updateBoardFromData(data);
     
-    // If bot made a move, update again
-    if (data.bot_move) {
-        setTimeout(() => {
-            updateBoard();
-        }, 500);
+    // The bot's reply is not in the response yet: wait for it
+    if (data.bot_pending) {
+        waitForBotMove(data);
+    }
+}
+
+// Long-poll the game's state until its board differs from `pending`.
+// Sending back the last ETag makes the server hold each request until the
+// game changes (or the wait runs out with 304, and the next one is sent).
+async function waitForBotMove(pending) {
+    const game = gameId;
+    let etag = null;
+    while (gameId === game) {
+        const response = await fetch(`/api/games/${game}/state?format=compact&wait=25`, {
+            headers: etag ? {'If-None-Match': etag} : {},
+            cache: 'no-store'
+        });
+        if (gameId !== game || response.status === 304) continue;
+        if (!response.ok) return;
+        etag = response.headers.get('ETag');
+        const data = await response.json();
+        if (data.cells !== pending.cells) {
+            updateBoardFromData(data);
+            return;
+        }
+    }
+}
+
+// Expand a compact 'X', 'O', '.' cell string into rows
+function expandCells(cells, size) {
+    const board = [];
+    for (let row = 0; row < size; row++) {
+        const cellsInRow = cells.slice(row * size, (row + 1) * size);
+        board.push(Array.from(cellsInRow, c => c === '.' ? '' : c));
     }
+    return board;
 }
 
 // Update board from server data
 async function updateBoardFromData(data) {
-    const board = data.board;
+    const board = data.board || expandCells(data.cells, data.size);
     const currentPlayer = data.current_player;
     const gameOver = data.game_over;
     const winner = data.winner;
     
+    if (board.length !== boardSize) {
+        buildBoard(board.length);
+    }
+    
     // Update cells
-    for (let row = 0; row < 3; row++) {
-        for (let col = 0; col < 3; col++) {
+    for (let row = 0; row < board.length; row++) {
+        for (let col = 0; col < board.length; col++) {
             const cell = document.querySelector(`[data-row="${row}"][data-col="${col}"]`);
             cell.classList.remove('x', 'o', 'filled');
             
@@ -142,7 +309,8 @@ async function updateBoard() {
             'Content-Type': 'application/json'
         },
         body: JSON.stringify({
-            game_id: gameId
+            game_id: gameId,
+            format: 'compact'
         })
     });
     
@@ -152,6 +320,9 @@ async function updateBoard() {
 
 // Reset game
 async function resetGame() {
+    if (currentMode === 'online' && !gameId) {
+        return;
+    }
     if (!gameId) {
         await initGame();
         return;
@@ -163,7 +334,9 @@ async function resetGame() {
             'Content-Type': 'application/json'
         },
         body: JSON.stringify({
-            game_id: gameId
+            game_id: gameId,
+            token: seatToken,
+            format: 'compact'
         })
     });
     
@@ -191,6 +364,7 @@ async function resetGame() {
 function backToMenu() {
     document.getElementById('game-screen').classList.remove('active');
     document.getElementById('menu-screen').classList.add('active');
+    closeSocket();
     gameId = null;
     currentMode = null;
 }
@@ -215,6 +389,8 @@ document.addEventListener('keydown', (e) => {
         selectMode('friend');
     } else if (e.key === '2' && document.getElementById('mode-screen').classList.contains('active')) {
         selectMode('bot');
+    } else if (e.key === '3' && document.getElementById('mode-screen').classList.contains('active')) {
+        selectMode('online');
     } else if (e.key === 'r' && document.getElementById('game-screen').classList.contains('active')) {
         resetGame();
     } else if (e.key === 'Escape' && document.getElementById('game-screen').classList.contains('active')) {
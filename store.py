@@ -0,0 +1,284 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import codec
+
+# Game session storage. Games are kept in the binary form from codec.py, so
+# every backend holds only a few bytes per game and a game loaded by one
+# gunicorn worker can be saved by another. Callers load a game, mutate it
+# and save it back; saving also bumps the game's version.
+#
+# Saves are compare-and-set on that version: a game is only saved over the
+# version it was loaded at, so two requests that load the same game and
+# both change it cannot silently lose one of the changes. The later save
+# raises VersionConflict instead, and nothing is written.
+
+DEFAULT_TTL = 60 * 60  # seconds a game lives after its last use
+DEFAULT_MAX_GAMES = 100000
+
+
+def serialize_game(game):
+    return codec.encode(game)
+
+
+def deserialize_game(data):
+    return codec.decode(data)
+
+
+class VersionConflict(Exception):
+    # The stored game has changed since it was loaded
+    def __init__(self, game_ids):
+        super().__init__('Game changed since it was loaded: %s' % ', '.join(game_ids))
+        self.game_ids = game_ids
+
+
+def _stamp(game):
+    # Every save is a new version of the game, for conditional reads.
+    # Returns (version loaded at, encoded next version); the caller sets
+    # game.version once the save has gone through.
+    loaded = game.version
+    game.version = loaded + 1
+    try:
+        return loaded, serialize_game(game)
+    finally:
+        game.version = loaded
+
+
+def _conflicts(stored, expected):
+    # The ids whose stored data is not at the expected version; a game that
+    # is not stored (new, or dropped by the store) can always be saved
+    return [game_id for game_id, data in stored.items()
+            if data is not None and codec.stored_version(data) != expected[game_id]]
+
+
+class GameStore:
+    def get(self, game_id):
+        raise NotImplementedError
+
+    def save(self, game_id, game):
+        raise NotImplementedError
+
+    def delete(self, game_id):
+        raise NotImplementedError
+
+    def get_many(self, game_ids):
+        # Returns {game_id: game} for the ids that exist
+        found = {}
+        for game_id in game_ids:
+            game = self.get(game_id)
+            if game is not None:
+                found[game_id] = game
+        return found
+
+    def save_many(self, games):
+        for game_id, game in games.items():
+            self.save(game_id, game)
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def __contains__(self, game_id):
+        return self.get(game_id) is not None
+
+    def stats(self):
+        # Cheap {'games', 'bytes'} summary for metrics, or None when it
+        # would need a scan of a shared backend
+        return None
+
+
+class MemoryGameStore(GameStore):
+    # In-process store with LRU eviction past max_games and a sliding TTL.
+    # Entries are kept in access order, so expired games collect at the front.
+    # on_evict, if given, is called with 'expired' or 'capacity' for every
+    # game dropped by the store rather than deleted by the caller.
+
+    def __init__(self, ttl=DEFAULT_TTL, max_games=DEFAULT_MAX_GAMES, clock=time.monotonic,
+                 on_evict=None):
+        self.ttl = ttl
+        self.max_games = max_games
+        self.clock = clock
+        self.on_evict = on_evict
+        self._games = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _put(self, game_id, expires_at, data):
+        old = self._games.get(game_id)
+        if old is not None:
+            self._bytes -= len(old[1])
+        self._games[game_id] = (expires_at, data)
+        self._games.move_to_end(game_id)
+        self._bytes += len(data)
+
+    def _drop(self, game_id, reason=None):
+        self._bytes -= len(self._games.pop(game_id)[1])
+        if reason and self.on_evict:
+            self.on_evict(reason)
+
+    def _evict(self, now):
+        while self._games:
+            game_id, (expires_at, _) = next(iter(self._games.items()))
+            if expires_at > now:
+                if len(self._games) <= self.max_games:
+                    break
+                self._drop(game_id, 'capacity')
+            else:
+                self._drop(game_id, 'expired')
+
+    def get(self, game_id):
+        if not isinstance(game_id, str):
+            return None
+        now = self.clock()
+        with self._lock:
+            entry = self._games.get(game_id)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                self._drop(game_id, 'expired')
+                return None
+            self._games[game_id] = (now + self.ttl, entry[1])
+            self._games.move_to_end(game_id)
+        return deserialize_game(entry[1])
+
+    def save(self, game_id, game):
+        # save_many for one game, without its per-call dicts
+        loaded, data = _stamp(game)
+        now = self.clock()
+        with self._lock:
+            entry = self._games.get(game_id)
+            if entry is not None and codec.stored_version(entry[1]) != loaded:
+                raise VersionConflict([game_id])
+            self._put(game_id, now + self.ttl, data)
+            self._evict(now)
+        game.version = loaded + 1
+
+    def get_many(self, game_ids):
+        now = self.clock()
+        entries = {}
+        with self._lock:
+            for game_id in game_ids:
+                if not isinstance(game_id, str):
+                    continue
+                entry = self._games.get(game_id)
+                if entry is None:
+                    continue
+                if entry[0] <= now:
+                    self._drop(game_id, 'expired')
+                    continue
+                self._games[game_id] = (now + self.ttl, entry[1])
+                self._games.move_to_end(game_id)
+                entries[game_id] = entry[1]
+        return {game_id: deserialize_game(data) for game_id, data in entries.items()}
+
+    def save_many(self, games):
+        # Saves all of the games or, on a conflict, none of them
+        encoded = {game_id: _stamp(game) for game_id, game in games.items()}
+        now = self.clock()
+        with self._lock:
+            conflicts = _conflicts(
+                {game_id: self._games.get(game_id, (None, None))[1] for game_id in encoded},
+                {game_id: loaded for game_id, (loaded, _) in encoded.items()})
+            if conflicts:
+                raise VersionConflict(conflicts)
+            for game_id, (_, data) in encoded.items():
+                self._put(game_id, now + self.ttl, data)
+            self._evict(now)
+        for game_id, game in games.items():
+            game.version = encoded[game_id][0] + 1
+
+    def delete(self, game_id):
+        with self._lock:
+            if game_id in self._games:
+                self._drop(game_id)
+
+    def __len__(self):
+        with self._lock:
+            self._evict(self.clock())
+            return len(self._games)
+
+    def stats(self):
+        # Live games and their encoded bytes, without expiring anything
+        with self._lock:
+            return {'games': len(self._games), 'bytes': self._bytes}
+
+
+class RedisGameStore(GameStore):
+    # Shared store for multiple workers or nodes. Works with any client that
+    # speaks the redis-py API (redis.Redis, fakeredis.FakeRedis, ...).
+
+    def __init__(self, client, ttl=DEFAULT_TTL, prefix='ttt:game:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, game_id):
+        return self.prefix + game_id
+
+    def get(self, game_id):
+        if not isinstance(game_id, str):
+            return None
+        key = self._key(game_id)
+        pipe = self.client.pipeline()
+        pipe.get(key)
+        pipe.expire(key, self.ttl)
+        data, _ = pipe.execute()
+        if data is None:
+            return None
+        return deserialize_game(data)
+
+    def save(self, game_id, game):
+        self.save_many({game_id: game})
+
+    def get_many(self, game_ids):
+        game_ids = [game_id for game_id in game_ids if isinstance(game_id, str)]
+        if not game_ids:
+            return {}
+        pipe = self.client.pipeline()
+        pipe.mget([self._key(game_id) for game_id in game_ids])
+        for game_id in game_ids:
+            pipe.expire(self._key(game_id), self.ttl)
+        values = pipe.execute()[0]
+        return {game_id: deserialize_game(data)
+                for game_id, data in zip(game_ids, values) if data is not None}
+
+    def save_many(self, games):
+        # Saves all of the games or, on a conflict, none of them. The keys
+        # are watched while their versions are checked, so a write by
+        # another worker in between makes the transaction retry the check.
+        if not games:
+            return
+        encoded = {game_id: _stamp(game) for game_id, game in games.items()}
+        keys = [self._key(game_id) for game_id in encoded]
+
+        def write(pipe):
+            conflicts = _conflicts(dict(zip(encoded, pipe.mget(keys))),
+                                   {game_id: loaded for game_id, (loaded, _) in encoded.items()})
+            if conflicts:
+                raise VersionConflict(conflicts)
+            pipe.multi()
+            for key, (_, data) in zip(keys, encoded.values()):
+                pipe.set(key, data, ex=self.ttl)
+
+        self.client.transaction(write, *keys)
+        for game_id, game in games.items():
+            game.version = encoded[game_id][0] + 1
+
+    def delete(self, game_id):
+        self.client.delete(self._key(game_id))
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + '*', count=1000))
+
+
+def create_store(on_evict=None):
+    # Uses Redis when REDIS_URL is set, otherwise an in-process store. Redis
+    # expires games itself, so on_evict only applies to the in-process store.
+    ttl = int(os.environ.get('GAME_TTL_SECONDS', DEFAULT_TTL))
+    redis_url = os.environ.get('REDIS_URL')
+    if redis_url:
+        import redis
+        return RedisGameStore(redis.Redis.from_url(redis_url), ttl=ttl)
+    max_games = int(os.environ.get('MAX_GAMES', DEFAULT_MAX_GAMES))
+    return MemoryGameStore(ttl=ttl, max_games=max_games, on_evict=on_evict)
@@ -0,0 +1,85 @@
+import random
+from collections import namedtuple
+
+import solver
+from search import DEFAULT_TIME_BUDGET, get_searcher
+
+# Move strategies for headless play. Each one takes a game and a
+# random.Random and returns the (row, col) to play for the side to move.
+
+SEARCH_TIME_BUDGET = 0.05  # seconds per move, kept short for simulations
+
+# Bot difficulty levels. A level plays a random legal move with probability
+# random_rate, and otherwise searches at most max_depth plies (None for no
+# limit) for at most time_budget seconds, so every level has a hard bound on
+# its thinking time. 'perfect' uses the opening book on the classic board.
+Level = namedtuple('Level', 'random_rate max_depth time_budget')
+
+LEVELS = {
+    'easy': Level(0.4, 1, 0.02),
+    'medium': Level(0.15, 2, 0.05),
+    'hard': Level(0.0, 4, 0.2),
+    'perfect': Level(0.0, None, DEFAULT_TIME_BUDGET),
+}
+
+
+def random_move(game, rng):
+    return rng.choice(game.legal_moves())
+
+
+def heuristic_move(game, rng):
+    # The original greedy bot: win, block, center, corner, anything
+    return game.get_heuristic_move(rng)
+
+
+def perfect_move(game, rng):
+    if not game.is_classic:
+        raise ValueError('The perfect strategy only supports the 3x3 board')
+    return solver.best_move(game.x_mask, game.o_mask, rng)
+
+
+def search_move(game, rng):
+    cell = get_searcher(game.geometry).search(
+        game.x_mask, game.o_mask, game.current_player, time_budget=SEARCH_TIME_BUDGET)
+    return game.geometry.to_row_col(cell)
+
+
+def level_move(game, difficulty, rng=random, time_budget=None):
+    # The move of the bot at `difficulty`; time_budget can only shorten the
+    # level's own limit
+    level = LEVELS[difficulty]
+    if level.random_rate and rng.random() < level.random_rate:
+        return random_move(game, rng)
+    if difficulty == 'perfect' and game.is_classic:
+        return perfect_move(game, rng)
+    if time_budget is None or time_budget > level.time_budget:
+        time_budget = level.time_budget
+    cell = get_searcher(game.geometry).search(
+        game.x_mask, game.o_mask, game.current_player,
+        time_budget=time_budget, max_depth=level.max_depth)
+    return game.geometry.to_row_col(cell)
+
+
+def _level_strategy(difficulty):
+    def strategy(game, rng):
+        return level_move(game, difficulty, rng)
+    return strategy
+
+
+STRATEGIES = {
+    'random': random_move,
+    'heuristic': heuristic_move,
+    'perfect': perfect_move,
+    'search': search_move,
+    'easy': _level_strategy('easy'),
+    'medium': _level_strategy('medium'),
+    'hard': _level_strategy('hard'),
+}
+
+
+def get_strategy(name):
+    try:
+        return STRATEGIES[name]
+    except KeyError:
+        raise ValueError('Unknown strategy %r (choose from %s)'
+                         % (name, ', '.join(sorted(STRATEGIES)))) from None
@@ -0,0 +1,50 @@
+import pytest
+
+import analysis
+import solver
+from bots import BotPool
+from engine import FULL_MASK, TicTacToe
+
+
+def cells(*indices):
+    return sum(1 << cell for cell in indices)
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(analysis, 'cache', analysis.EvalCache())
+
+
+def test_book_values():
+    # Every opening move draws, nine plies from the end
+    assert solver.lookup(0, 0) == (FULL_MASK, 0, 9)
+    # X wins at once on the top row, whichever way the board is turned
+    assert solver.lookup(cells(0, 1), cells(3, 4)) == (cells(2), 1, 1)
+    assert solver.lookup(cells(2, 5), cells(1, 4)) == (cells(8), 1, 1)
+    assert solver.lookup(cells(0, 1, 2), cells(3, 4)) is None
+
+
+def test_searched_analysis_is_cached_per_budget():
+    game = TicTacToe(4, 3)
+    game.make_move(1, 1)
+    analysis.analyze(game, 0.01)
+    analysis.analyze(game, 0.01)
+    analysis.analyze(game, 0.02)
+    assert analysis.cache.stats()['hits'] == 1
+    assert analysis.cache.stats()['misses'] == 2
+
+
+def test_pool_searches_in_the_game_worker(monkeypatch):
+    def in_process(*args):
+        raise AssertionError('searched in the calling thread')
+
+    monkeypatch.setattr(analysis, 'searched_moves', in_process)
+    game = TicTacToe(4, 3)
+    for move in [(0, 0), (3, 3), (0, 1), (3, 2)]:
+        game.make_move(*move)
+    pool = BotPool(workers=1)
+    try:
+        best = pool.analyze('game', game, 0.05)[0]
+    finally:
+        pool.close()
+    assert (best.row, best.col, best.value, best.distance) == (0, 2, 'win', 1)
@@ -0,0 +1,79 @@
+import io
+
+from analytics import Report, export_jsonl, journal_games, jsonl_games
+from engine import TicTacToe
+from journal import Journal
+
+GAME_ID = '00000000-0000-4000-8000-000000000002'
+
+
+class Recorder:
+    # Plays a game and journals it the way the server does
+    def __init__(self, directory, mode='bot', difficulty='hard'):
+        self.journal = Journal(directory)
+        self.game = TicTacToe()
+        self.game.game_mode = mode
+        self.game.difficulty = difficulty
+        self.journal.record_new(GAME_ID, self.game)
+
+    def play(self, *moves):
+        start = len(self.game.moves)
+        for row, col in moves:
+            assert self.game.make_move(row, col)
+        self.journal.record_moves(GAME_ID, self.game, start)
+
+    def undo(self):
+        moves = bytes(self.game.moves)
+        self.game.undo_move()
+        self.journal.record_undo(GAME_ID, moves, len(self.game.moves))
+
+    def reset(self):
+        self.game.reset()
+        self.journal.record_reset(GAME_ID)
+
+    def games(self):
+        self.journal.flush()
+        return list(journal_games(self.journal.directory))
+
+
+def test_finished_game(tmp_path):
+    recorder = Recorder(str(tmp_path))
+    recorder.play((0, 0), (1, 0), (0, 1), (1, 1), (0, 2))
+    [game] = recorder.games()
+    assert (game.size, game.win_length, game.mode, game.difficulty) == (3, 3, 'bot', 'hard')
+    assert game.winner == 'X'
+    assert game.moves == bytes([0, 3, 1, 4, 2])
+
+
+def test_undo_after_the_end_keeps_the_moves(tmp_path):
+    recorder = Recorder(str(tmp_path), mode='friend')
+    recorder.play((0, 0), (1, 0), (0, 1), (1, 1), (0, 2))
+    recorder.undo()
+    recorder.play((2, 2), (1, 2))
+    first, second = recorder.games()
+    assert first.winner == 'X'
+    assert second.winner == 'O'
+    assert second.moves == bytes([0, 3, 1, 4, 8, 5])
+
+
+def test_reset_starts_a_new_game(tmp_path):
+    recorder = Recorder(str(tmp_path))
+    recorder.play((0, 0), (1, 0), (0, 1), (1, 1), (0, 2))
+    recorder.reset()
+    recorder.play((1, 1), (0, 0), (2, 2), (0, 2), (0, 1), (2, 1), (1, 0), (1, 2), (2, 0))
+    first, second = recorder.games()
+    assert second.winner == 'Tie'
+    assert second.moves[0] == 4 and len(second.moves) == 9
+
+
+def test_report_and_jsonl_round_trip(tmp_path):
+    recorder = Recorder(str(tmp_path))
+    recorder.play((0, 0), (1, 0), (0, 1), (1, 1), (0, 2))
+    out = io.StringIO()
+    assert export_jsonl(recorder.games(), out) == 1
+    games = list(jsonl_games(out.getvalue().splitlines()))
+    assert games == recorder.games()
+    summary = Report(depth=2).consume(games).as_dict()
+    assert summary['games'] == 1
+    assert summary['variants']['3-3']['modes']['bot/hard']['x_wins'] == 1
+    assert summary['variants']['3-3']['openings'][1][0]['cells'] == 'X........'
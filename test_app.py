@@ -0,0 +1,142 @@
+import copy
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import app as server
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+def new_game(client, **options):
+    return client.post('/api/new-game', json=options).get_json()['game_id']
+
+
+def test_state_etag_and_304(client):
+    game_id = new_game(client)
+    url = '/api/games/%s/state' % game_id
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert response.get_json()['version'] == 1
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert not response.data
+
+    client.post('/api/make-move', json={'game_id': game_id, 'row': 0, 'col': 0})
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['board'][0][0] == 'X'
+
+
+def test_long_poll_times_out_with_304(client):
+    game_id = new_game(client)
+    url = '/api/games/%s/state' % game_id
+    etag = client.get(url).headers['ETag']
+    start = time.monotonic()
+    response = client.get(url + '?wait=0.2', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert time.monotonic() - start >= 0.2
+
+
+def test_etag_differs_when_version_starts_over(client):
+    game_id = new_game(client)
+    game = server.games.get(game_id)
+    before = server.state_etag(game)
+    game.make_move(1, 1)
+    game.version = 1
+    assert server.state_etag(game) != before
+
+
+def test_stale_save_is_refused(client, monkeypatch):
+    game_id = new_game(client)
+    stale = server.games.get(game_id)
+    assert client.post('/api/make-move',
+                       json={'game_id': game_id, 'row': 0, 'col': 0}).status_code == 200
+    monkeypatch.setattr(server.games, 'get', lambda _: copy.deepcopy(stale))
+    response = client.post('/api/make-move', json={'game_id': game_id, 'row': 2, 'col': 2})
+    assert response.status_code == 409
+    monkeypatch.undo()
+    assert server.games.get(game_id).history == [(0, 0)]
+
+
+def test_failed_bot_worker_falls_back_to_thinking_here(client, monkeypatch):
+    def broken(key, game):
+        future = Future()
+        future.set_exception(RuntimeError('worker died'))
+        return future
+
+    monkeypatch.setattr(server.bots, 'submit', broken)
+    game_id = new_game(client)
+    client.post('/api/set-mode', json={'game_id': game_id, 'mode': 'bot'})
+    response = client.post('/api/make-move', json={'game_id': game_id, 'row': 1, 'col': 1})
+    assert response.status_code == 200
+    assert 'bot_move' in response.get_json()
+
+
+def batch_game_ids(client, count, **options):
+    response = client.post('/api/batch/new-games', json=dict(options, count=count))
+    assert response.status_code == 200
+    return response.get_json()['game_ids']
+
+
+def test_batch_moves_match_single_moves(client):
+    batched = batch_game_ids(client, 2, mode='friend')
+    single = new_game(client)
+    client.post('/api/set-mode', json={'game_id': single, 'mode': 'friend'})
+    cells = [(1, 1), (0, 0), (2, 2)]
+    response = client.post('/api/batch/moves', json={'moves': [
+        {'game_id': batched[0], 'row': row, 'col': col} for row, col in cells
+    ] + [{'game_id': batched[1], 'row': 1, 'col': 1}, {'game_id': batched[1], 'row': 1, 'col': 1},
+         {'game_id': 'missing', 'row': 0, 'col': 0}]})
+    for row, col in cells:
+        client.post('/api/make-move', json={'game_id': single, 'row': row, 'col': col})
+
+    body = response.get_json()
+    assert [result.get('status') for result in body['results']] == [None] * 4 + [400, 404]
+    expected = client.post('/api/game-state', json={'game_id': single}).get_json()
+    assert body['games'][batched[0]]['board'] == expected['board']
+    assert server.games.get(batched[0]).history == cells
+
+
+def test_batch_waits_for_bot_replies_until_its_deadline(client, monkeypatch):
+    # A reply that never comes makes the batch answer after BATCH_BOT_WAIT,
+    # not once per bot move
+    monkeypatch.setattr(server, 'BATCH_BOT_WAIT', 0.2)
+    monkeypatch.setattr(server.bots, 'submit', lambda key, game: Future())
+    first, second = batch_game_ids(client, 2, mode='bot')
+    start = time.monotonic()
+    response = client.post('/api/batch/moves', json={'moves': [
+        {'game_id': first, 'row': 1, 'col': 1}, {'game_id': first, 'row': 0, 'col': 0},
+        {'game_id': second, 'row': 1, 'col': 1}]})
+    assert time.monotonic() - start < 1
+    results = response.get_json()['results']
+    assert results[0]['bot_pending'] and results[2]['bot_pending']
+    assert results[1]['status'] == 409
+    assert server.games.get(first).history == [(1, 1)]
+
+
+def test_batch_move_failure_only_fails_that_move(client, monkeypatch):
+    game_ids = batch_game_ids(client, 2, mode='friend')
+    real_apply = server.apply_move
+
+    def apply_move(game_id, game, data, wait=None):
+        if game_id == game_ids[0] and data['row'] == 2:
+            game.make_move(data['row'], data['col'])
+            raise RuntimeError('failed halfway')
+        return real_apply(game_id, game, data, wait)
+
+    monkeypatch.setattr(server, 'apply_move', apply_move)
+    response = client.post('/api/batch/moves', json={'moves': [
+        {'game_id': game_ids[0], 'row': 0, 'col': 0}, {'game_id': game_ids[0], 'row': 2, 'col': 2},
+        {'game_id': game_ids[1], 'row': 1, 'col': 1}]})
+    assert response.status_code == 200
+    assert [result.get('status') for result in response.get_json()['results']] == [None, 500, None]
+    assert server.games.get(game_ids[0]).history == [(0, 0)]
+    assert server.games.get(game_ids[1]).history == [(1, 1)]
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import asgi
+from app import app as flask_app
+from rooms import Matchmaker
+
+
+class Socket:
+    # Drives one WebSocket connection through the ASGI app
+    def __init__(self, path, query=b''):
+        self.scope = {'type': 'websocket', 'path': path, 'query_string': query}
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        self.incoming.put_nowait({'type': 'websocket.connect'})
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send(self, message):
+        await self.outgoing.put(message)
+
+    def start(self):
+        return asyncio.ensure_future(asgi.app(self.scope, self.receive, self.send))
+
+    def send_json(self, payload):
+        self.incoming.put_nowait({'type': 'websocket.receive', 'text': json.dumps(payload)})
+
+    async def next_json(self):
+        while True:
+            message = await asyncio.wait_for(self.outgoing.get(), 5)
+            if message['type'] == 'websocket.send':
+                return json.loads(message['text'])
+
+    def close(self):
+        self.incoming.put_nowait({'type': 'websocket.disconnect'})
+
+
+def bot_game():
+    client = flask_app.test_client()
+    game_id = client.post('/api/new-game', json={}).get_json()['game_id']
+    client.post('/api/set-mode', json={'game_id': game_id, 'mode': 'bot'})
+    return game_id
+
+
+async def play_against_bot(game_id):
+    socket = Socket('/ws/' + game_id)
+    task = socket.start()
+    assert (await socket.outgoing.get())['type'] == 'websocket.accept'
+    socket.send_json({'type': 'move', 'row': 1, 'col': 1})
+    messages = [await socket.next_json(), await socket.next_json()]
+    socket.close()
+    await task
+    return messages
+
+
+def test_bot_reply_is_pushed_after_the_move():
+    human, bot = asyncio.run(play_against_bot(bot_game()))
+    assert human['type'] == 'state' and human['current_player'] == 'O'
+    assert bot['type'] == 'state' and 'bot_move' in bot
+    assert bot['current_player'] == 'X'
+
+
+def test_failed_worker_falls_back_to_thinking_here(monkeypatch):
+    def broken(key, game):
+        future = Future()
+        future.set_exception(RuntimeError('worker died'))
+        return future
+
+    monkeypatch.setattr(asgi.bots, 'submit', broken)
+    human, bot = asyncio.run(play_against_bot(bot_game()))
+    assert 'bot_move' in bot
+
+
+def test_bot_failure_is_reported(monkeypatch):
+    def fail(game_id, moves, future):
+        raise RuntimeError('no move')
+
+    monkeypatch.setattr(asgi, 'deliver_bot_move', fail)
+    human, reply = asyncio.run(play_against_bot(bot_game()))
+    assert reply == {'type': 'error', 'error': 'The bot could not move'}
+
+
+def test_matchmaker_creates_games_off_the_event_loop():
+    threads = []
+
+    def create_game(size, win_length):
+        threads.append(threading.current_thread())
+        return 'game-%d' % len(threads)
+
+    async def pair():
+        matchmaker = Matchmaker(create_game)
+        first = asyncio.ensure_future(matchmaker.join(3, None))
+        await asyncio.sleep(0)
+        second = await matchmaker.join(3, None)
+        return await first, second, matchmaker.waiting_count()
+
+    first, second, waiting = asyncio.run(pair())
+    assert first == ('game-1', 'X') and second == ('game-1', 'O')
+    assert waiting == 0
+    assert threads[0] is not threading.main_thread()
+
+
+def test_matchmaker_skips_players_who_left_during_creation():
+    async def pair():
+        created = []
+
+        def create_game(size, win_length):
+            created.append(None)
+            if len(created) == 1:
+                asyncio.run_coroutine_threadsafe(cancel_first(), loop).result()
+            return 'game-%d' % len(created)
+
+        async def cancel_first():
+            first.cancel()
+
+        loop = asyncio.get_running_loop()
+        matchmaker = Matchmaker(create_game)
+        first = asyncio.ensure_future(matchmaker.join(3, None))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(matchmaker.join(3, None))
+        await asyncio.sleep(0.1)
+        third = await matchmaker.join(3, None)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, third
+
+    second, third = asyncio.run(pair())
+    assert second == ('game-2', 'X') and third == ('game-2', 'O')
+
+
+async def http(method, path, body=None, headers=(), query=b''):
+    # One HTTP request through the ASGI app; returns (status, headers, body)
+    sent = []
+    payload = json.dumps(body).encode() if body is not None else b''
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+             'http_version': '1.1',
+             'headers': [(b'content-type', b'application/json'),
+                         (b'content-length', str(len(payload)).encode())] + list(headers)}
+
+    async def receive():
+        return {'type': 'http.request', 'body': payload}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi.app(scope, receive, send)
+    start = sent[0]
+    return (start['status'], dict(start['headers']),
+            b''.join(message.get('body', b'') for message in sent[1:]))
+
+
+def test_long_poll_does_not_hold_up_other_requests():
+    async def poll_and_move():
+        game_id = json.loads((await http('POST', '/api/new-game', {}))[2])['game_id']
+        await http('POST', '/api/set-mode', {'game_id': game_id, 'mode': 'friend'})
+        path = '/api/games/%s/state' % game_id
+        _, headers, _ = await http('GET', path)
+        poll = asyncio.ensure_future(http('GET', path, query=b'wait=5',
+                                          headers=[(b'if-none-match', headers[b'etag'])]))
+        await asyncio.sleep(0.1)
+        start = time.monotonic()
+        move = await http('POST', '/api/make-move', {'game_id': game_id, 'row': 0, 'col': 0})
+        polled = await poll
+        return move[0], polled[0], time.monotonic() - start
+
+    move, polled, elapsed = asyncio.run(poll_and_move())
+    assert move == 200 and polled == 200
+    # The move ran beside the held poll, which it then ended
+    assert elapsed < 2
+
+
+def test_matched_players_and_spectators_see_every_move():
+    async def play():
+        first = Socket('/ws/match', b'size=3')
+        second = Socket('/ws/match', b'size=3&win_length=3')
+        tasks = [first.start(), second.start()]
+        matched = [await first.next_json(), await second.next_json()]
+        for task in tasks:
+            await task
+        game_id = matched[0]['game_id']
+        assert matched[1]['game_id'] == game_id
+
+        seats = {match['seat']: match['token'] for match in matched}
+        x = Socket('/ws/' + game_id, ('token=%s' % seats['X']).encode())
+        o = Socket('/ws/' + game_id, ('token=%s' % seats['O']).encode())
+        spectator = Socket('/ws/' + game_id)
+        sockets = [x, o, spectator]
+        tasks = [socket.start() for socket in sockets]
+        for socket in sockets:
+            assert (await socket.outgoing.get())['type'] == 'websocket.accept'
+        x.send_json({'type': 'move', 'row': 1, 'col': 1})
+        seen = [await socket.next_json() for socket in sockets]
+        spectator.send_json({'type': 'move', 'row': 0, 'col': 0})
+        refused = await spectator.next_json()
+        for socket in sockets:
+            socket.close()
+        await asyncio.gather(*tasks)
+        return matched, seen, refused
+
+    matched, seen, refused = asyncio.run(play())
+    assert sorted(match['seat'] for match in matched) == ['O', 'X']
+    assert all(state['board'][1][1] == 'X' and state['current_player'] == 'O' for state in seen)
+    assert refused == {'type': 'error', 'error': 'Spectators cannot play'}
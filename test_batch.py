@@ -0,0 +1,58 @@
+import random
+
+import numpy as np
+import pytest
+
+import batch
+from engine import TicTacToe, get_geometry
+
+
+class FirstChoice:
+    # Stands in for both random.Random and a NumPy Generator so the engine
+    # and the batch pick the same corner
+    def choice(self, options):
+        return min(options)
+
+    def random(self, shape):
+        return np.zeros(shape)
+
+
+def random_positions(size, win_length, count, seed=0):
+    rng = random.Random(seed)
+    games = []
+    while len(games) < count:
+        game = TicTacToe(size, win_length)
+        for _ in range(rng.randrange(game.geometry.cell_count)):
+            if game.game_over:
+                break
+            game.make_move(*rng.choice(game.legal_moves()))
+        if not game.game_over:
+            games.append(game)
+    return games
+
+
+@pytest.mark.parametrize('size, win_length', [(3, None), (4, 3), (5, 4)])
+def test_heuristic_moves_match_the_engine(size, win_length):
+    geometry = get_geometry(size, win_length)
+    games = random_positions(size, win_length, 300)
+    moves = batch.heuristic_moves(batch.from_games(games), geometry, FirstChoice())
+    for game, cell in zip(games, moves):
+        assert geometry.to_row_col(int(cell)) == game.get_heuristic_move(FirstChoice())
+
+
+def test_heuristic_moves_are_deterministic_outside_corners():
+    games = random_positions(3, None, 300, seed=1)
+    boards = batch.from_games(games)
+    first = batch.heuristic_moves(boards, rng=np.random.default_rng(1))
+    second = batch.heuristic_moves(boards, rng=np.random.default_rng(2))
+    corners = set(batch.CLASSIC.corners)
+    for a, b in zip(first, second):
+        if a != b:
+            assert a in corners and b in corners
+
+
+def test_finished_boards_have_no_move():
+    game = TicTacToe()
+    for row, col in [(0, 0), (1, 0), (0, 1), (1, 1), (0, 2)]:
+        game.make_move(row, col)
+    assert batch.heuristic_moves(batch.from_games([game]))[0] == batch.NO_MOVE
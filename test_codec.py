@@ -0,0 +1,65 @@
+import pytest
+
+import codec
+from engine import TicTacToe
+
+
+def played(size=3, win_length=None, moves=()):
+    game = TicTacToe(size, win_length)
+    for row, col in moves:
+        assert game.make_move(row, col)
+    return game
+
+
+def assert_same(decoded, game):
+    for name in ('size', 'win_length', 'x_mask', 'o_mask', 'current_player', 'game_over',
+                 'winner', 'game_mode', 'difficulty', 'version'):
+        assert getattr(decoded, name) == getattr(game, name), name
+    assert decoded.moves == game.moves
+
+
+@pytest.mark.parametrize('size, win_length, moves', [
+    (3, None, []),
+    (3, None, [(1, 1), (0, 0), (2, 2)]),
+    (3, None, [(0, 0), (1, 0), (0, 1), (1, 1), (0, 2)]),
+    (3, None, [(0, 0), (0, 1), (0, 2), (1, 1), (1, 0), (1, 2), (2, 1), (2, 0), (2, 2)]),
+    (15, 5, [(7, 7), (0, 14), (14, 0)]),
+])
+def test_round_trip(size, win_length, moves):
+    game = played(size, win_length, moves)
+    game.game_mode = 'bot'
+    game.difficulty = 'hard'
+    game.version = 123456
+    data = codec.encode(game)
+    assert data[0] == codec.CODEC_VERSION
+    assert codec.stored_version(data) == 123456
+    assert_same(codec.decode(data), game)
+
+
+def test_classic_game_size():
+    assert len(codec.encode(played())) == 4 + 2 * 2 + 1 + 4
+    assert len(codec.encode(played(moves=[(1, 1)]))) == 4 + 2 * 2 + 2 + 4
+
+
+def test_older_versions_decode_with_version_0():
+    game = played(moves=[(1, 1), (0, 0)])
+    game.version = 9
+    data = bytearray(codec.encode(game))
+    data[0] = 3
+    v3 = bytes(data[:-4])
+    assert codec.stored_version(v3) == 0
+    decoded = codec.decode(v3)
+    assert decoded.version == 0
+    assert decoded.moves == game.moves
+
+
+@pytest.mark.parametrize('data', [b'', b'\x04\x03', b'\x09\x03\x03\x00' + bytes(9)])
+def test_invalid_states(data):
+    with pytest.raises(codec.CodecError):
+        codec.decode(data)
+
+
+def test_truncated_state():
+    data = codec.encode(played(moves=[(1, 1)]))
+    with pytest.raises(codec.CodecError):
+        codec.decode(data[:-1])
@@ -0,0 +1,24 @@
+from concurrent.futures import Future
+
+import game as client
+
+
+def waiting_window():
+    # A window whose bot is due to reply, without opening pygame
+    ui = client.GameUI.__new__(client.GameUI)
+    ui.game = client.TicTacToe()
+    ui.game.game_mode = 'bot'
+    ui.game.make_move(1, 1)
+    ui.bots = client.BotPool(0)
+    ui.bot_position = bytes(ui.game.moves)
+    ui.bot_due = 0
+    return ui
+
+
+def test_bot_failure_falls_back_to_thinking_here():
+    ui = waiting_window()
+    ui.bot_future = Future()
+    ui.bot_future.set_exception(RuntimeError('worker died'))
+    ui.update_bot()
+    assert ui.bot_future is None
+    assert len(ui.game.moves) == 2 and ui.game.current_player == 'X'
@@ -0,0 +1,103 @@
+import os
+
+from engine import TicTacToe
+from journal import Journal, segment_paths
+
+OLD_GAME = '00000000-0000-4000-8000-000000000001'
+NEW_GAME = '00000000-0000-4000-8000-000000000002'
+UNKNOWN_GAME = '00000000-0000-4000-8000-000000000003'
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def play(journal, game_id, *moves, mode='friend'):
+    game = TicTacToe()
+    game.game_mode = mode
+    journal.record_new(game_id, game)
+    for row, col in moves:
+        game.make_move(row, col)
+    journal.record_moves(game_id, game)
+    journal.flush()
+    return game
+
+
+def test_rebuilt_game_keeps_counting_versions(tmp_path):
+    journal = Journal(str(tmp_path))
+    game = play(journal, OLD_GAME, (1, 1), (0, 0))
+    loaded = journal.load_game(OLD_GAME)
+    assert loaded.moves == game.moves
+    assert loaded.version == 3
+
+
+def test_recover_after_restart(tmp_path):
+    clock = Clock(1000.0)
+    writer = Journal(str(tmp_path), clock=clock)
+    old = play(writer, OLD_GAME, (0, 0), mode='bot')
+    clock.now = 5000.0
+    new = play(writer, NEW_GAME, (1, 1), (2, 2))
+    writer.close()
+
+    restarted = Journal(str(tmp_path), clock=clock)
+    active = restarted.load_index(since=4000.0)
+    recovered = restarted.rebuild(active)
+    assert list(recovered) == [NEW_GAME]
+    assert recovered[NEW_GAME].moves == new.moves
+    # Games outside the window are not recovered but can still be read
+    loaded = restarted.load_game(OLD_GAME)
+    assert loaded.moves == old.moves and loaded.game_mode == 'bot'
+
+
+def test_recover_merges_writers(tmp_path):
+    clock = Clock(1000.0)
+    first = Journal(str(tmp_path), clock=clock)
+    play(first, NEW_GAME, (1, 1))
+    first.close()
+    # Another writer, as a second server process would be, starting later
+    clock.now = 1001.0
+    second = Journal(str(tmp_path), clock=clock)
+    game = TicTacToe()
+    game.make_move(1, 1)
+    game.make_move(0, 0)
+    second.record_moves(NEW_GAME, game, 1)
+    second.flush()
+    assert len(segment_paths(str(tmp_path))) == 2
+
+    restarted = Journal(str(tmp_path), clock=clock)
+    recovered = restarted.rebuild(restarted.load_index(since=0))
+    assert recovered[NEW_GAME].moves == game.moves
+
+
+def test_unknown_ids_are_not_searched(tmp_path):
+    clock = Clock(1000.0)
+    journal = Journal(str(tmp_path), clock=clock)
+    play(journal, OLD_GAME, (0, 0))
+    assert journal.load_game(UNKNOWN_GAME) is None
+    # Nor are games another process wrote after this one indexed the journal
+    clock.now = 1001.0
+    other = Journal(str(tmp_path), clock=clock)
+    play(other, NEW_GAME, (0, 0))
+    assert journal.load_game(NEW_GAME) is None
+
+
+def test_old_segments_are_pruned(tmp_path):
+    clock = Clock(1000.0)
+    journal = Journal(str(tmp_path), clock=clock, retention=3600)
+    play(journal, OLD_GAME, (0, 0))
+    journal.close()
+    [paths] = segment_paths(str(tmp_path)).values()
+    os.utime(paths[0], (1000.0, 1000.0))
+
+    clock.now = 1000.0 + 3599
+    restarted = Journal(str(tmp_path), clock=clock, retention=3600)
+    restarted.load_index(since=0)
+    assert restarted.load_game(OLD_GAME) is not None
+    clock.now = 1000.0 + 3601
+    restarted.prune()
+    assert not segment_paths(str(tmp_path))
+    assert restarted.load_game(OLD_GAME) is None
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import particles
+from particles import EFFECTS, Particles
+
+COLORS = [(255, 0, 0), (0, 0, 255)]
+
+
+def pool(capacity=10):
+    return Particles(100, 100, COLORS, capacity=capacity, rng=np.random.default_rng(0))
+
+
+def test_emit_is_capped_at_capacity():
+    p = pool(capacity=10)
+    p.emit(6, 50, 50, 0, 0)
+    p.emit(6, 50, 50, 0, 0)
+    assert len(p) == 10
+    p.emit(1, 50, 50, 0, 0)
+    assert len(p) == 10
+    p.clear()
+    assert len(p) == 0
+
+
+def test_step_moves_particles_and_applies_gravity():
+    p = pool()
+    p.emit(1, 10, 20, 2, -1, gravity=0.5)
+    p.update()
+    assert (p.x[0], p.y[0], p.vy[0]) == (12, 19, -0.5)
+
+
+def test_expired_and_escaped_particles_are_removed_keeping_the_rest():
+    p = pool()
+    # Lives of 1, 3, 1 and 3 frames; the last particle also leaves the area
+    p.emit(4, [10, 20, 30, 40], 50, [0, 0, 0, 80], 0, life=[1, 3, 1, 3])
+    p.update()
+    assert len(p) == 1
+    assert p.x[0] == 20 and p.life[0] == 2
+    p.update()
+    p.update()
+    assert len(p) == 0
+
+
+@pytest.mark.parametrize('effect', sorted(EFFECTS))
+def test_effects_play_out(effect):
+    p = pool(capacity=500)
+    EFFECTS[effect](p, 200)
+    assert len(p) == 200
+    assert (p.size[:200] >= 1).all() and (p.size[:200] <= particles.MAX_SIZE).all()
+    for _ in range(300):
+        p.update()
+    assert len(p) == 0
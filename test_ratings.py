@@ -0,0 +1,109 @@
+import pytest
+
+from engine import TicTacToe
+from ratings import BOT_RATINGS, INITIAL_RATING, Ratings, updated_rating
+
+
+def finished_game(mode, moves, difficulty='perfect'):
+    game = TicTacToe()
+    game.game_mode = mode
+    game.difficulty = difficulty
+    for row, col in moves:
+        game.make_move(row, col)
+    assert game.game_over
+    return game
+
+
+X_WINS = [(0, 0), (1, 0), (0, 1), (1, 1), (0, 2)]
+
+
+@pytest.fixture
+def ratings(tmp_path):
+    return Ratings(str(tmp_path / 'ratings.db'))
+
+
+def test_bot_game_is_rated_against_the_bot(ratings):
+    player = ratings.create_player('Ann')
+    ratings.seat('g1', 'X', player['player_id'])
+    changed = ratings.record_result('g1', finished_game('bot', X_WINS, 'hard'))
+    expected = round(updated_rating(INITIAL_RATING, BOT_RATINGS['hard'], 1.0))
+    assert changed == {player['player_id']: expected}
+    assert ratings.get_player(player['player_id'])['wins'] == 1
+
+
+def test_game_is_rated_once(ratings):
+    player = ratings.create_player('Ann')
+    ratings.seat('g1', 'X', player['player_id'])
+    game = finished_game('bot', X_WINS)
+    assert ratings.record_result('g1', game)
+    assert ratings.record_result('g1', game) == {}
+    assert ratings.get_player(player['player_id'])['wins'] == 1
+
+
+def test_online_game_rates_both_seats(ratings):
+    x = ratings.create_player('Ann')
+    o = ratings.create_player('Bob')
+    ratings.seat('g1', 'X', x['player_id'])
+    ratings.seat('g1', 'O', o['player_id'])
+    changed = ratings.record_result('g1', finished_game('online', X_WINS))
+    assert changed[x['player_id']] > INITIAL_RATING > changed[o['player_id']]
+    assert ratings.get_player(x['player_id'])['rank'] == 1
+    assert ratings.get_player(o['player_id'])['rank'] == 2
+
+
+def test_unrated_games(ratings):
+    x = ratings.create_player('Ann')
+    ratings.seat('g1', 'X', x['player_id'])
+    ratings.seat('g2', 'X', x['player_id'])
+    ratings.seat('g2', 'O', x['player_id'])
+    assert ratings.record_result('g1', finished_game('friend', X_WINS)) == {}
+    # Online games need two different players
+    assert ratings.record_result('g2', finished_game('online', X_WINS)) == {}
+    # and bot games a seated player
+    assert ratings.record_result('g3', finished_game('bot', X_WINS)) == {}
+    assert ratings.get_player(x['player_id'])['wins'] == 0
+
+
+def test_rated_game_mode_is_locked_once_started():
+    from app import app, ratings as app_ratings
+    client = app.test_client()
+    player = client.post('/api/players', json={'name': 'Ann'}).get_json()
+    game_id = client.post('/api/new-game', json={'player': player['token']}).get_json()['game_id']
+
+    def set_mode(difficulty):
+        return client.post('/api/set-mode', json={'game_id': game_id, 'mode': 'bot',
+                                                  'difficulty': difficulty})
+
+    assert set_mode('perfect').status_code == 200
+    assert app_ratings.is_seated(game_id)
+    assert client.post('/api/make-move', json={'game_id': game_id, 'row': 1, 'col': 1,
+                                               'wait': 2}).status_code == 200
+    response = set_mode('easy')
+    assert response.status_code == 409
+    state = client.post('/api/game-state', json={'game_id': game_id}).get_json()
+    assert state['difficulty'] == 'perfect'
+
+
+def test_rated_game_cannot_undo_or_reset():
+    from app import app
+    client = app.test_client()
+    player = client.post('/api/players', json={'name': 'Bea'}).get_json()
+    game_id = client.post('/api/new-game', json={'player': player['token']}).get_json()['game_id']
+    client.post('/api/set-mode', json={'game_id': game_id, 'mode': 'bot'})
+    assert client.post('/api/make-move', json={'game_id': game_id, 'row': 1, 'col': 1,
+                                               'wait': 2}).status_code == 200
+
+    assert client.post('/api/undo', json={'game_id': game_id}).status_code == 409
+    assert client.post('/api/reset', json={'game_id': game_id}).status_code == 409
+    # Neither went through, so the mode stays locked
+    assert client.post('/api/set-mode', json={'game_id': game_id, 'mode': 'bot',
+                                              'difficulty': 'easy'}).status_code == 409
+    state = client.post('/api/game-state', json={'game_id': game_id}).get_json()
+    assert state['board'][1][1] == 'X'
+
+    # Unrated games still can
+    other = client.post('/api/new-game', json={}).get_json()['game_id']
+    client.post('/api/set-mode', json={'game_id': other, 'mode': 'friend'})
+    client.post('/api/make-move', json={'game_id': other, 'row': 1, 'col': 1})
+    assert client.post('/api/undo', json={'game_id': other}).status_code == 200
+    assert client.post('/api/reset', json={'game_id': other}).status_code == 200
@@ -0,0 +1,73 @@
+import asyncio
+
+from rooms import MAX_PENDING_MESSAGES, Matchmaker, PubSub
+
+
+def test_default_and_explicit_win_length_are_matched():
+    created = []
+
+    def create_game(size, win_length):
+        created.append((size, win_length))
+        return 'game'
+
+    async def pair():
+        matchmaker = Matchmaker(create_game)
+        first = asyncio.ensure_future(matchmaker.join(3, None))
+        await asyncio.sleep(0)
+        second = await matchmaker.join(3, 3)
+        return await first, second
+
+    assert asyncio.run(pair()) == (('game', 'X'), ('game', 'O'))
+    assert created == [(3, 3)]
+
+
+def test_other_variants_keep_waiting():
+    async def join_both():
+        matchmaker = Matchmaker(lambda size, win_length: 'game')
+        small = asyncio.ensure_future(matchmaker.join(3, None))
+        large = asyncio.ensure_future(matchmaker.join(7, None))
+        await asyncio.sleep(0.05)
+        waiting = matchmaker.waiting_count()
+        small.cancel()
+        large.cancel()
+        await asyncio.gather(small, large, return_exceptions=True)
+        return waiting, matchmaker.waiting_count()
+
+    assert asyncio.run(join_both()) == (2, 0)
+
+
+def test_publish_fans_out_to_every_subscriber_of_the_topic():
+    async def fan_out():
+        hub = PubSub()
+        first, second = hub.subscribe('game'), hub.subscribe('game')
+        other = hub.subscribe('other')
+        hub.publish('game', 'moved')
+        # Published from another thread, as Flask routes do
+        await asyncio.to_thread(hub.publish, 'game', 'again')
+        await asyncio.sleep(0)
+        hub.unsubscribe(second)
+        hub.publish('game', 'later')
+        drained = [[], [], []]
+        for queue, messages in zip((first, second, other), drained):
+            while not queue.queue.empty():
+                messages.append(queue.queue.get_nowait())
+        return drained, hub.subscriber_count('game')
+
+    (first, second, other), count = asyncio.run(fan_out())
+    assert first == ['moved', 'again', 'later']
+    assert second == ['moved', 'again']
+    assert other == []
+    assert count == 1
+
+
+def test_slow_subscribers_are_marked_overflowed():
+    async def flood():
+        hub = PubSub()
+        subscription = hub.subscribe('game')
+        for index in range(MAX_PENDING_MESSAGES + 1):
+            hub.publish('game', index)
+        return subscription
+
+    subscription = asyncio.run(flood())
+    assert subscription.overflowed
+    assert subscription.queue.qsize() == MAX_PENDING_MESSAGES
@@ -0,0 +1,49 @@
+from collections import OrderedDict
+
+import search
+from engine import TicTacToe, get_geometry
+
+
+def position(size, win_length, *cells):
+    game = TicTacToe(size, win_length)
+    for cell in cells:
+        game.make_move(*game.geometry.to_row_col(cell))
+    return game.x_mask, game.o_mask, game.current_player
+
+
+def test_searchers_are_kept_for_recent_variants(monkeypatch):
+    monkeypatch.setattr(search, 'MAX_SEARCHERS', 2)
+    monkeypatch.setattr(search, '_searchers', OrderedDict())
+    small, medium, large = get_geometry(4, 3), get_geometry(5, 4), get_geometry(6, 4)
+
+    first = search.get_searcher(small)
+    search.get_searcher(medium)
+    assert search.get_searcher(small) is first
+    # The medium board was used least recently, so it makes room
+    search.get_searcher(large)
+    assert list(search._searchers) == [small, large]
+    assert search.get_searcher(small) is first
+
+
+def test_table_scores_do_not_depend_on_earlier_searches():
+    # Forced results found from the parent position are stored in the table
+    # and must keep their distance when probed from the child
+    geometry = get_geometry(4, 3)
+    child = position(4, 3, 3, 10, 14, 9)
+    fresh = search.Searcher(geometry).analyze(*child, time_budget=5)
+    warmed = search.Searcher(geometry)
+    warmed.analyze(*position(4, 3, 3, 10), time_budget=5)
+    assert warmed.analyze(*child, time_budget=5) == fresh
+    assert fresh[0][11] == 1 - search.WIN_SCORE
+
+
+def test_long_win_lengths_never_look_like_forced_results():
+    # Twelve marks toward a line of 15 are far from a win, however many
+    # windows they fill
+    geometry = get_geometry(15, 15)
+    searcher = search.Searcher(geometry)
+    x_mask, o_mask, player = position(15, 15, *[cell for column in range(12)
+                                               for cell in (column, 15 + column)])
+    assert abs(searcher.evaluate(x_mask, o_mask)) <= search.MAX_EVAL
+    scores, _ = searcher.analyze(x_mask, o_mask, player, time_budget=0.05)
+    assert all(abs(score) < search.WIN_SCORE - search.MAX_PLY for score in scores.values())
@@ -0,0 +1,32 @@
+import pytest
+
+from simulate import confidence_interval, main, simulate
+
+
+def test_results_do_not_depend_on_the_workers():
+    one = simulate('perfect', 'heuristic', 300, workers=1, seed=3, chunk_size=40)
+    two = simulate('perfect', 'heuristic', 300, workers=2, seed=3, chunk_size=40)
+    assert one == two
+    assert one['X'] + one['O'] + one['Tie'] == 300
+    # Perfect play never loses
+    assert one['O'] == 0
+
+
+def test_vectorized_chunks_add_up():
+    pytest.importorskip('numpy')
+    totals = simulate('random', 'random', 250, workers=1, chunk_size=100, vectorized=True)
+    assert totals['X'] + totals['O'] + totals['Tie'] == 250
+    assert 5 * 250 <= totals['moves'] <= 9 * 250
+
+
+def test_confidence_interval():
+    assert confidence_interval(0, 0) == 0.0
+    assert confidence_interval(50, 100) == pytest.approx(9.8, abs=0.01)
+
+
+def test_main_prints_the_rates(capsys):
+    assert main(['--x', 'random', '--o', 'random', '--games', '20', '--workers', '1']) == 0
+    out = capsys.readouterr().out
+    assert 'random (X) vs random (O), 20 games on 3x3' in out
+    with pytest.raises(SystemExit):
+        main(['--x', 'perfect', '--size', '4'])
@@ -0,0 +1,147 @@
+import time
+
+import pytest
+
+from engine import TicTacToe
+from store import MemoryGameStore, RedisGameStore, VersionConflict
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def new_game(*moves):
+    game = TicTacToe()
+    for row, col in moves:
+        game.make_move(row, col)
+    return game
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def store(request):
+    # The compare-and-set tests run against both backends; Redis is faked
+    if request.param == 'memory':
+        return MemoryGameStore()
+    fakeredis = pytest.importorskip('fakeredis')
+    return RedisGameStore(fakeredis.FakeRedis())
+
+
+def test_save_bumps_version_and_round_trips(store):
+    game = new_game((1, 1))
+    store.save('a', game)
+    assert game.version == 1
+    loaded = store.get('a')
+    assert loaded.version == 1
+    assert loaded.moves == game.moves
+
+
+def test_ttl_slides_on_access():
+    clock = Clock()
+    evicted = []
+    store = MemoryGameStore(ttl=10, clock=clock, on_evict=evicted.append)
+    store.save('a', new_game())
+    clock.now = 9
+    assert store.get('a') is not None
+    clock.now = 18
+    assert store.get('a') is not None
+    clock.now = 28
+    assert store.get('a') is None
+    assert evicted == ['expired']
+
+
+def test_lru_eviction_past_capacity():
+    evicted = []
+    store = MemoryGameStore(max_games=2, on_evict=evicted.append)
+    store.save('a', new_game())
+    store.save('b', new_game())
+    store.get('a')
+    store.save('c', new_game())
+    assert 'b' not in store
+    assert 'a' in store and 'c' in store
+    assert evicted == ['capacity']
+    assert store.stats()['games'] == 2
+
+
+def test_stale_save_conflicts(store):
+    store.save('a', new_game())
+    first, second = store.get('a'), store.get('a')
+    first.make_move(0, 0)
+    store.save('a', first)
+    second.make_move(2, 2)
+    with pytest.raises(VersionConflict) as info:
+        store.save('a', second)
+    assert info.value.game_ids == ['a']
+    assert second.version == 1
+    assert store.get('a').moves == first.moves
+
+
+def test_save_many_is_all_or_nothing(store):
+    store.save_many({'a': new_game(), 'b': new_game()})
+    a, b = store.get('a'), store.get('b')
+    stale_b = store.get('b')
+    store.save('b', b)
+    a.make_move(1, 1)
+    with pytest.raises(VersionConflict):
+        store.save_many({'a': a, 'b': stale_b})
+    assert store.get('a').version == 1
+    assert not store.get('a').moves
+
+
+def test_shared_game_saved_under_many_ids(store):
+    template = new_game()
+    store.save_many({'a': template, 'b': template, 'c': template})
+    assert template.version == 1
+    assert [store.get(game_id).version for game_id in 'abc'] == [1, 1, 1]
+
+
+def test_redis_ttl_is_set_and_slides_on_access():
+    fakeredis = pytest.importorskip('fakeredis')
+    client = fakeredis.FakeRedis()
+    store = RedisGameStore(client, ttl=100)
+    store.save('a', new_game())
+    key = store.prefix + 'a'
+    assert 0 < client.ttl(key) <= 100
+    client.expire(key, 5)
+    assert store.get('a') is not None
+    assert client.ttl(key) > 5
+    assert store.get_many(['a', 'missing']).keys() == {'a'}
+
+    client.pexpire(key, 1)
+    time.sleep(0.01)
+    assert store.get('a') is None
+    # A game the store has dropped can be saved again
+    store.save('a', new_game((1, 1)))
+    assert store.get('a').version == 1
+
+
+def test_redis_write_between_check_and_save_conflicts():
+    # Another worker saving while the versions are checked makes the
+    # transaction retry the check, which then sees the newer version
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server)
+    store = RedisGameStore(client)
+    other = RedisGameStore(fakeredis.FakeRedis(server=server))
+    store.save('a', new_game())
+    mine, theirs = store.get('a'), other.get('a')
+    real_mget = type(client.pipeline()).mget
+    interfered = []
+
+    def mget(pipe, keys):
+        values = real_mget(pipe, keys)
+        if not interfered:
+            interfered.append(True)
+            theirs.make_move(0, 0)
+            other.save('a', theirs)
+        return values
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(type(client.pipeline()), 'mget', mget)
+        mine.make_move(2, 2)
+        with pytest.raises(VersionConflict):
+            store.save('a', mine)
+    assert store.get('a').moves == theirs.moves